@@ -1,6 +1,17 @@
-from django.contrib import admin
+from collections import Counter
+
+from django.contrib import admin, messages
 from django.utils.html import format_html
-from .models import User, BlogsCategories, Blogs, BlogImages, News, Bookings, Calculators, CalculatorResults, CalculatorQuestions
+from .bookings import CONFLICT, UNCHANGED, UPDATED, BulkUpdateConflict, bulk_update
+from .images import variant_url
+from . import search
+from .models import User, BlogsCategories, Blogs, BlogImages, News, Bookings, TherapistAvailability, Calculators, CalculatorResults, CalculatorQuestions
+
+def search_admin_results(model_admin, kind, request, queryset, search_term):
+    """Admin search through the full-text index instead of LIKE '%term%' scans"""
+    if not search.is_available() or not search.match_expression(search_term):
+        return admin.ModelAdmin.get_search_results(model_admin, request, queryset, search_term)
+    return queryset.filter(pk__in=search.matching_ids(kind, search_term)), False
 
 # Customizing User Admin
 @admin.register(User)
@@ -18,7 +29,7 @@ class BlogsCategoriesAdmin(admin.ModelAdmin):
 
     def category_image(self, obj):
         if obj.img:
-            return format_html('<img src="{}" width="50" height="50" />'.format(obj.img.url))
+            return format_html('<img src="{}" width="50" height="50" />', variant_url(obj.img, obj.img_variants, 100))
         return "-"
 
 # Blogs Admin
@@ -30,6 +41,9 @@ class BlogsAdmin(admin.ModelAdmin):
     search_fields = ('title', 'content')
     autocomplete_fields = ('owner', 'category')
 
+    def get_search_results(self, request, queryset, search_term):
+        return search_admin_results(self, "blog", request, queryset, search_term)
+
 # Blog Images Admin
 @admin.register(BlogImages)
 class BlogImagesAdmin(admin.ModelAdmin):
@@ -37,7 +51,7 @@ class BlogImagesAdmin(admin.ModelAdmin):
 
     def blog_image(self, obj):
         if obj.image:
-            return format_html('<img src="{}" width="50" height="50" />'.format(obj.image.url))
+            return format_html('<img src="{}" width="50" height="50" />', variant_url(obj.image, obj.image_variants, 100))
         return "-"
 
 # News Admin
@@ -46,13 +60,51 @@ class NewsAdmin(admin.ModelAdmin):
     list_display = ('title', 'created_at')
     search_fields = ('title', 'content')
 
+    def get_search_results(self, request, queryset, search_term):
+        return search_admin_results(self, "news", request, queryset, search_term)
+
 # Bookings Admin
 @admin.register(Bookings)
 class BookingsAdmin(admin.ModelAdmin):
-    list_display = ('user', 'therapist', 'date', 'time', 'status', 'created_at')
-    list_filter = ('status', 'date')
+    list_display = ('user', 'therapist', 'date', 'time', 'status', 'paid', 'created_at')
+    list_filter = ('status', 'paid', 'date')
     search_fields = ('user__username', 'therapist__username')
     autocomplete_fields = ('user', 'therapist')
+    actions = ('mark_confirmed', 'mark_cancelled', 'mark_paid')
+
+    @admin.action(description="Mark selected bookings as confirmed")
+    def mark_confirmed(self, request, queryset):
+        self.bulk_update(request, queryset, status="confirmed")
+
+    @admin.action(description="Mark selected bookings as cancelled")
+    def mark_cancelled(self, request, queryset):
+        self.bulk_update(request, queryset, status="cancelled")
+
+    @admin.action(description="Mark selected bookings as paid")
+    def mark_paid(self, request, queryset):
+        self.bulk_update(request, queryset, paid=True)
+
+    def bulk_update(self, request, queryset, **changes):
+        """One UPDATE for the whole selection (api.bookings)"""
+        try:
+            results = bulk_update(list(queryset.values_list("pk", flat=True)), changes)
+        except BulkUpdateConflict as error:
+            self.message_user(request, str(error), messages.ERROR)
+            return
+        counts = Counter(results.values())
+        self.message_user(request, f"Updated {counts[UPDATED]} booking(s), {counts[UNCHANGED]} already were.")
+        if counts[CONFLICT]:
+            self.message_user(
+                request, f"{counts[CONFLICT]} booking(s) left cancelled, their slot is booked again.", messages.WARNING
+            )
+
+# Therapist working hours and date exceptions
+@admin.register(TherapistAvailability)
+class TherapistAvailabilityAdmin(admin.ModelAdmin):
+    list_display = ('therapist', 'weekday', 'date', 'start_time', 'end_time', 'is_available')
+    list_filter = ('weekday', 'is_available')
+    search_fields = ('therapist__username',)
+    autocomplete_fields = ('therapist',)
 
 @admin.register(Calculators)
 class CalculatorAdmin(admin.ModelAdmin):
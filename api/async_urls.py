@@ -0,0 +1,16 @@
+from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
+
+from . import async_views
+
+# Mounted ahead of api.urls by backend/asgi_urls.py; same paths and names as the sync routes
+urlpatterns = [
+    path('therapists/', async_views.TherapistListView.as_view(), name='therapists'),
+    path('categories/', async_views.BlogCategoryListView.as_view(), name='categories'),
+    path('blogs/category/<str:category_name>/', async_views.BlogsByCategoryView.as_view(), name='blogs_by_category'),
+    path('blogs/latest/', async_views.LatestBlogsView.as_view(), name='latest_blogs'),
+    path('news/latest/', async_views.LatestNewsListView.as_view(), name='latest_news'),
+    path("calculators/", async_views.CalculatorListView.as_view(), name="calculator-list"),
+    # Like the api_view it replaces, which only enforces CSRF for session logins it never uses
+    path("chatbot/", csrf_exempt(async_views.ChatbotView.as_view()), name="chatbot_response"),
+]
@@ -0,0 +1,186 @@
+"""
+Native async versions of the hot public reads, served by backend/asgi.py.
+
+Under ASGI a sync DRF view runs in asgiref's thread-sensitive executor, so
+every request on the worker queues for that one thread for its whole
+lifetime. These views stay on the event loop and only hop to a thread for
+the SQL itself (``aget``, ``acount``, ``aiterator``), so one worker keeps
+many slow clients in flight while a handful of queries run.
+
+Rows are fully fetched, prefetches included, before serialization, so the
+serializers do no I/O and run on the loop as plain CPU work; a serializer
+that reached for a lazy relation would raise SynchronousOnlyOperation
+rather than block it. Responses match the sync views byte for byte: same
+serializers, DRF's JSON renderer, the same versioned cache keys and
+validators (the classes keep the sync views' names for that reason). Only
+JSON is rendered, the browsable API stays on the sync views. Cache calls
+go through the cache's async API, so a networked backend such as Redis
+doesn't block the loop either.
+
+``ChatbotView`` awaits its reply from api.chatbot's batching thread, so
+waiting for the model holds no thread at all.
+
+The sync views in api.views remain the implementation under WSGI.
+"""
+import asyncio
+
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.views import View
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from .cache import RESPONSE_TIMEOUT, add_validators, aget_versions, response_cache_key, validators
+from .models import User, BlogsCategories, Blogs, BlogImages, News, Calculators
+from .serializers import TherapistSummarySerializer, BlogCategorySerializer, BlogListSerializer, NewsSerializer, CalculatorListSerializer
+from . import chatbot
+from .richtext import full_text_columns
+from .views import CHATBOT_UNAVAILABLE, BlogCursorPagination, BlogPagination, blog_list, start_chat
+
+
+def render_json(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type="application/json")
+
+
+def error_response(exc):
+    # As rest_framework.views.exception_handler answers
+    if isinstance(exc, Http404):
+        exc = NotFound(*exc.args)
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {"detail": exc.detail}
+    return render_json(data, status=exc.status_code)
+
+
+class AsyncReadView(View):
+    """
+    GET-only list view over ``get_queryset()``, with the conditional GET of
+    api.cache.ConditionalGetMixin and, if ``cache_responses`` is set, the
+    response cache of CachedResponseMixin.
+    """
+    http_method_names = ["get", "head", "options"]
+    serializer_class = None
+    cache_models = ()
+    cache_responses = False
+    chunk_size = 100  # aiterator() only runs prefetch_related lookups with an explicit chunk_size
+
+    async def get(self, request, *args, **kwargs):
+        versions = await aget_versions(self.cache_models)
+        etag, last_modified = validators(self, request, versions)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        self.request = Request(request)  # For query_params, as pagination and serializers expect
+        try:
+            data = await self.get_data(versions, *args, **kwargs)
+        except (APIException, Http404) as exc:
+            return error_response(exc)
+        response = render_json(data)
+        add_validators(response, etag, last_modified)
+        return response
+
+    async def get_data(self, versions, *args, **kwargs):
+        if not self.cache_responses:
+            return await self.build(*args, **kwargs)
+        key = response_cache_key(self, self.request, versions)
+        data = await cache.aget(key)
+        if data is None:
+            data = await self.build(*args, **kwargs)
+            await cache.aset(key, data, RESPONSE_TIMEOUT)
+        return data
+
+    async def build(self, *args, **kwargs):
+        rows = [obj async for obj in self.get_queryset().aiterator(chunk_size=self.chunk_size)]
+        return self.serialize(rows)
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def serialize(self, rows):
+        return self.serializer_class(rows, many=True, context={"request": self.request, "view": self}).data
+
+
+class TherapistListView(AsyncReadView):
+    serializer_class = TherapistSummarySerializer
+    cache_models = (User,)
+    cache_responses = True
+
+    def get_queryset(self):
+        return User.objects.filter(role="therapist").defer(*full_text_columns(User))
+
+
+class BlogCategoryListView(AsyncReadView):
+    serializer_class = BlogCategorySerializer
+    cache_models = (BlogsCategories,)
+    cache_responses = True
+
+    def get_queryset(self):
+        return BlogsCategories.objects.all()
+
+
+class BlogsByCategoryView(AsyncReadView):
+    serializer_class = BlogListSerializer
+    cache_models = (Blogs, BlogsCategories, User, BlogImages)
+
+    @property
+    def pagination_class(self):
+        params = self.request.query_params
+        if params.get("pagination") == "cursor" or "cursor" in params:
+            return BlogCursorPagination
+        return BlogPagination
+
+    async def build(self, category_name):
+        try:
+            category = await BlogsCategories.objects.aget(name__iexact=category_name.strip())
+        except BlogsCategories.DoesNotExist:
+            raise Http404("No BlogsCategories matches the given query.")
+        queryset = blog_list().filter(category_id=category.id).order_by("-created_at")
+        paginator = self.pagination_class()
+        rows = await paginator.apaginate_queryset(queryset, self.request, view=self)
+        return paginator.get_paginated_response(self.serialize(rows)).data
+
+
+class LatestBlogsView(AsyncReadView):
+    serializer_class = BlogListSerializer
+    cache_models = (Blogs, BlogsCategories, User, BlogImages)
+    cache_responses = True
+
+    def get_queryset(self):
+        return blog_list().order_by("-created_at")[:4]
+
+
+class LatestNewsListView(AsyncReadView):
+    serializer_class = NewsSerializer
+    cache_models = (News,)
+    cache_responses = True
+
+    def get_queryset(self):
+        return News.objects.order_by("-created_at")[:4]
+
+
+class CalculatorListView(AsyncReadView):
+    serializer_class = CalculatorListSerializer
+    cache_models = (Calculators,)
+    cache_responses = True
+
+    def get_queryset(self):
+        return Calculators.objects.all()
+
+
+class ChatbotView(View):
+    http_method_names = ["post", "options"]
+
+    async def post(self, request):
+        request = Request(request, parsers=[JSONParser(), FormParser(), MultiPartParser()])
+        try:
+            session_id, future = start_chat(request.data)
+        except APIException as exc:
+            return error_response(exc)
+        try:
+            # Cancelling the wrapper on timeout cancels the queued request too
+            reply = await asyncio.wait_for(asyncio.wrap_future(future), chatbot.REPLY_TIMEOUT)
+        except Exception:
+            return render_json(CHATBOT_UNAVAILABLE, status=503)
+        return render_json({"session_id": session_id, "response": reply})
@@ -0,0 +1,141 @@
+"""
+JWT authentication without a users-table lookup per request.
+
+Tokens minted by ``tokens_for_user`` carry the user's role and flags as
+claims, so ``ClaimsJWTAuthentication`` can rebuild ``request.user`` from the
+token alone. Snapshots are kept in a bounded per-process LRU cache whose TTL
+defaults to the access token lifetime. User saves overwrite the cached
+snapshot (see api.signals), so deactivating someone takes effect on this
+process immediately; other processes catch up once the access tokens issued
+before the change expire, since refreshing re-reads the row and re-stamps
+the claims (``ClaimsTokenRefreshSerializer``).
+
+Tokens issued before the claims existed fall back to one query per user,
+whose result is cached the same way.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS, router
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import User, ClaimsUser
+
+
+# Claims copied onto tokens, and the fields a ClaimsUser starts with
+CLAIM_FIELDS = ("role", "is_active", "is_staff")
+SNAPSHOT_FIELDS = ("id", "username", "role", "is_active", "is_staff", "is_superuser")
+
+
+class UserSnapshotCache:
+    """Thread-safe LRU of user id -> snapshot dict whose entries expire after ``ttl`` seconds"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires, snapshot = entry
+            if expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return snapshot
+
+    def set(self, user_id, snapshot):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, snapshot)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserSnapshotCache(
+    max_size=getattr(settings, "AUTH_USER_CACHE_SIZE", 10000),
+    ttl=getattr(settings, "AUTH_USER_CACHE_TTL", api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()),
+)
+
+
+def add_claims(token, user):
+    for field in CLAIM_FIELDS:
+        token[field] = getattr(user, field)
+    return token
+
+
+def tokens_for_user(user):
+    """Refresh token (and through it the access token) carrying the claims ClaimsJWTAuthentication reads"""
+    return add_claims(RefreshToken.for_user(user), user)
+
+
+def snapshot_of(user):
+    """Snapshot of a saved user, or None if some of its identity fields weren't loaded"""
+    if user.get_deferred_fields().intersection(SNAPSHOT_FIELDS):
+        return None
+    return {field: getattr(user, field) for field in SNAPSHOT_FIELDS}
+
+
+def remember_user(sender, instance, **kwargs):
+    """post_save handler keeping the cached snapshot in step with the row"""
+    snapshot = snapshot_of(instance)
+    if snapshot is None:
+        user_cache.discard(instance.pk)
+    else:
+        user_cache.set(instance.pk, snapshot)
+
+
+def forget_user(sender, instance, **kwargs):
+    """post_delete handler: tokens of deleted users stop working on this process at once"""
+    user_cache.set(instance.pk, {"id": instance.pk, "is_active": False})
+
+
+def build_user(snapshot):
+    fields = [field.attname for field in User._meta.concrete_fields if field.attname in snapshot]
+    db = router.db_for_read(ClaimsUser) or DEFAULT_DB_ALIAS
+    return ClaimsUser.from_db(db, fields, [snapshot[name] for name in fields])
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            # Recent simplejwt versions put the id in the token as a string
+            user_id = User._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, ValidationError):
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        snapshot = user_cache.get(user_id)
+        if snapshot is None:
+            if all(claim in validated_token for claim in CLAIM_FIELDS):
+                snapshot = {"id": user_id, **{claim: validated_token[claim] for claim in CLAIM_FIELDS}}
+            else:
+                snapshot = (
+                    User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).values(*SNAPSHOT_FIELDS).first()
+                )
+                if snapshot is None:
+                    raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            user_cache.set(user_id, snapshot)
+
+        if not snapshot["is_active"]:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return build_user(snapshot)
@@ -0,0 +1,132 @@
+"""
+Free-slot computation for therapist bookings.
+
+A day's open time is the union of the therapist's weekly hours and any extra
+hours added for that date. Blocked windows and existing non-cancelled
+bookings are subtracted from it as intervals, and whatever is left is cut
+into slots of ``BOOKING_SLOT_MINUTES``. Times are handled as minutes since
+midnight so the interval arithmetic stays on plain integers.
+
+A whole date range needs exactly two queries: one for the availability rows
+and one for the bookings.
+"""
+import datetime
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Bookings, TherapistAvailability
+
+
+SLOT_MINUTES = getattr(settings, "BOOKING_SLOT_MINUTES", 60)
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def _time(minutes):
+    return datetime.time(minutes // 60, minutes % 60)
+
+
+def merge(intervals):
+    """Sort and coalesce overlapping or touching (start, end) intervals"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(interval) for interval in merged]
+
+
+def subtract(intervals, removed):
+    """Remove ``removed`` from ``intervals``; both are merged, in a single sweep"""
+    result = []
+    removed = merge(removed)
+    i = 0
+    for start, end in merge(intervals):
+        # Skip removals that end before this interval starts
+        while i < len(removed) and removed[i][1] <= start:
+            i += 1
+        j = i
+        while j < len(removed) and removed[j][0] < end:
+            if removed[j][0] > start:
+                result.append((start, removed[j][0]))
+            start = max(start, removed[j][1])
+            j += 1
+        if start < end:
+            result.append((start, end))
+    return result
+
+
+def _slots(intervals, slot_minutes):
+    for start, end in intervals:
+        while start + slot_minutes <= end:
+            yield start
+            start += slot_minutes
+
+
+def free_slots(therapist_id, start, end, slot_minutes=SLOT_MINUTES, now=None):
+    """
+    Return ``{date: [time, ...]}`` with the bookable slot start times of every
+    day from ``start`` to ``end`` inclusive. Slots that already began are left out.
+    """
+    rules = TherapistAvailability.objects.filter(therapist_id=therapist_id).filter(
+        Q(weekday__isnull=False) | Q(date__range=(start, end))
+    )
+    booked = (
+        Bookings.objects.filter(therapist_id=therapist_id, date__range=(start, end), time__isnull=False)
+        .exclude(status="cancelled")
+        .values_list("date", "time")
+    )
+    return compute_free_slots(rules, booked, start, end, slot_minutes, now)
+
+
+def compute_free_slots(rules, booked, start, end, slot_minutes=SLOT_MINUTES, now=None):
+    weekly = defaultdict(list)
+    extra = defaultdict(list)
+    blocked = defaultdict(list)
+    days_off = set()
+    for rule in rules:
+        if rule.weekday is not None:
+            if rule.is_available and rule.start_time is not None:
+                weekly[rule.weekday].append((_minutes(rule.start_time), _minutes(rule.end_time)))
+        elif rule.start_time is None:
+            days_off.add(rule.date)
+        elif rule.is_available:
+            extra[rule.date].append((_minutes(rule.start_time), _minutes(rule.end_time)))
+        else:
+            blocked[rule.date].append((_minutes(rule.start_time), _minutes(rule.end_time)))
+
+    for date, time in booked:
+        begin = _minutes(time)
+        blocked[date].append((begin, begin + slot_minutes))
+
+    now = timezone.localtime(now or timezone.now())
+    slots = {}
+    day = start
+    while day <= end:
+        free = []
+        if day not in days_off and day >= now.date():
+            open_intervals = weekly[day.weekday()] + extra[day]
+            if day == now.date():
+                # Nothing can be booked in the past
+                blocked[day].append((0, _minutes(now) + (1 if now.second or now.microsecond else 0)))
+            free = [_time(minutes) for minutes in _slots(subtract(open_intervals, blocked[day]), slot_minutes)]
+        slots[day] = free
+        day += datetime.timedelta(days=1)
+    return slots
+
+
+def is_slot_free(therapist_id, date, time, slot_minutes=SLOT_MINUTES):
+    """
+    Whether a booking may start at ``date`` ``time``. Therapists who haven't set up
+    any availability yet accept any time, as before availability existed.
+    """
+    if not TherapistAvailability.objects.filter(therapist_id=therapist_id).exists():
+        return True
+    day = free_slots(therapist_id, date, date, slot_minutes)[date]
+    return time.replace(second=0, microsecond=0) in day
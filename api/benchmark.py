@@ -0,0 +1,405 @@
+"""
+Load benchmark of the API routes, run by ``manage.py benchmark``.
+
+The command migrates a throwaway SQLite database, seeds it with ``seed`` and
+then drives every route in ``ROUTES`` through the project's real WSGI and
+ASGI applications (backend/wsgi.py, backend/asgi.py), with the full
+middleware stack, at a configurable concurrency. The ``asgi-sync`` driver
+runs Django's stock ASGI handler, which serves the sync views everywhere, so
+it measures what the async views of backend/asgi.py buy over the sync ones. For each route it records
+latency percentiles, throughput, failed requests and the number of SQL
+queries per request, the latter counted by an execute wrapper that follows
+the request through threads via a context variable.
+
+Reports are plain JSON so they can be kept per commit; ``compare`` lists
+the routes where a report regressed against a baseline.
+"""
+import asyncio
+import contextvars
+import datetime
+import itertools
+import json
+import logging
+import math
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import quote, unquote, urlsplit
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import RequestFactory
+from django.utils import timezone
+
+from . import search
+from .authentication import tokens_for_user
+from .models import (
+    User, BlogsCategories, Blogs, BlogImages, News, Bookings, Calculators, CalculatorQuestions,
+    CalculatorResults, CalculatorScores, CalculatorLatestScore,
+)
+
+
+PASSWORD = "benchmark-password"
+PARAGRAPH = (
+    "Therapy gives people room to notice patterns in how they think, feel and act. "
+    "Small, regular steps such as keeping a sleep diary, naming worries out loud or "
+    "taking a short walk after a hard conversation often matter more than big plans. "
+)
+EXPERTISE = ("Anxiety", "Depression", "Couples counselling", "Grief", "Trauma", "Stress at work", "Sleep")
+
+_queries = contextvars.ContextVar("benchmark_queries", default=None)
+_sequence = itertools.count()  # Keeps usernames and booking slots unique across routes and drivers
+
+
+class Fixture:
+    """Names and rows of the seeded data that the routes refer to"""
+
+    def __init__(self, user, category, blog, calculator, question_count, therapist_ids):
+        self.user = user
+        self.category = category
+        self.blog = blog
+        self.calculator = calculator
+        self.question_count = question_count
+        self.therapist_ids = therapist_ids
+        self.access = str(tokens_for_user(user).access_token)
+
+
+def seed(scale=1):
+    """Fill an empty database with a dataset shaped like production's; returns the Fixture"""
+    today = timezone.localdate()
+    password = make_password(PASSWORD)  # Hashed once and shared, seeding shouldn't take minutes
+    therapists = User.objects.bulk_create(
+        User(
+            username=f"therapist{i}", password=password, role="therapist", first_name=f"Therapist {i}",
+            therapist_expertise=f"{EXPERTISE[i % len(EXPERTISE)]}, {EXPERTISE[(i + 3) % len(EXPERTISE)]}",
+            therapist_experience=i % 25, therapist_fee=2000 + 250 * (i % 12),
+            therapist_description=f"<p>{PARAGRAPH * 2}</p>",
+        )
+        for i in range(50 * scale)
+    )
+    clients = User.objects.bulk_create(
+        User(username=f"client{i}", password=password, first_name=f"Client {i}", therapist_description="")
+        for i in range(200 * scale)
+    )
+    user = clients[0]
+
+    categories = BlogsCategories.objects.bulk_create(
+        BlogsCategories(name=name, description=f"Articles about {name.lower()}", img=f"categories/{i}.jpg")
+        for i, name in enumerate(EXPERTISE)
+    )
+    blogs = Blogs.objects.bulk_create(
+        Blogs(
+            category=categories[i % len(categories)], owner=therapists[i % len(therapists)],
+            title=f"{categories[i % len(categories)].name} note {i}", content=f"<p>{PARAGRAPH * 12}</p>",
+        )
+        for i in range(60 * len(categories) * scale)
+    )
+    BlogImages.objects.bulk_create(
+        BlogImages(blog=blog, image=f"blogs/{blog.id}-{i}.jpg") for blog in blogs for i in range(2)
+    )
+    News.objects.bulk_create(News(title=f"News {i}", content=PARAGRAPH) for i in range(200 * scale))
+
+    calculators = Calculators.objects.bulk_create(
+        Calculators(
+            name=f"Calculator {i}", desc="Screening questionnaire", sub_desc="Over the last two weeks",
+            caution="Not a diagnosis", scoring_name="Score", leveling_name="Level",
+            calculation_para=PARAGRAPH, result_line="Your result", img=f"calculators/{i}.jpg",
+        )
+        for i in range(5)
+    )
+    question_count = 10
+    CalculatorQuestions.objects.bulk_create(
+        CalculatorQuestions(
+            calculator=calculator, question=f"Question {q}",
+            option1="Not at all", option2="Several days", option3="More than half the days", option4="Nearly every day",
+        )
+        for calculator in calculators
+        for q in range(question_count)
+    )
+    CalculatorResults.objects.bulk_create(
+        CalculatorResults(calculator=calculator, min=low, max=high, result=result)
+        for calculator in calculators
+        for low, high, result in ((0, 4, "Minimal"), (5, 9, "Mild"), (10, 19, "Moderate"), (20, None, "Severe"))
+    )
+    scores = CalculatorScores.objects.bulk_create(
+        CalculatorScores(calculator=calculators[i % len(calculators)], user=client, score=i % 30)
+        for i, client in enumerate(clients * 5)
+    )
+    CalculatorLatestScore.objects.bulk_create(
+        {
+            (entry.user_id, entry.calculator_id): CalculatorLatestScore(
+                user_id=entry.user_id, calculator_id=entry.calculator_id, score=entry.score, created_at=entry.created_at
+            )
+            for entry in scores
+        }.values()
+    )
+    Bookings.objects.bulk_create(
+        Bookings(
+            user=user, therapist=therapists[i % len(therapists)],
+            date=today - datetime.timedelta(days=i), time=datetime.time(9 + i % 8),
+        )
+        for i in range(20)
+    )
+    search.rebuild()
+    return Fixture(user, categories[0], blogs[0], calculators[0], question_count, [t.id for t in therapists])
+
+
+def _json(body):
+    return ("application/json", json.dumps(body).encode())
+
+
+def _booking(fixture):
+    n = next(_sequence)
+    therapists = len(fixture.therapist_ids)
+    day = timezone.localdate() + datetime.timedelta(days=1 + n // (therapists * 24))
+    return _json({
+        "therapist_id": fixture.therapist_ids[n % therapists], "date": day.isoformat(),
+        "time": f"{n // therapists % 24:02d}:00", "payment_method": "physical",
+    })
+
+
+# Route name -> function(fixture) returning (method, path, headers, (content type, body) or None,
+# needs a bearer token). Called before the clock starts, so building a request is never timed.
+ROUTES = {
+    "token": lambda f: ("POST", "/api/token/", {}, _json({"username": f.user.username, "password": PASSWORD}), False),
+    "token_refresh": lambda f: (
+        "POST", "/api/token/refresh/", {"cookie": f"refresh_token={tokens_for_user(f.user)}"}, None, False
+    ),
+    "signup": lambda f: (
+        "POST", "/api/signup/", {}, _json({"username": f"signup{next(_sequence)}", "password": PASSWORD}), False
+    ),
+    "therapists": lambda f: ("GET", "/api/therapists/", {}, None, False),
+    "therapist_directory": lambda f: ("GET", "/api/therapists/directory/?sort=fee&expertise=anxiety", {}, None, False),
+    "therapist_detail": lambda f: ("GET", f"/api/therapists/{f.therapist_ids[0]}/", {}, None, False),
+    "therapist_slots": lambda f: ("GET", f"/api/therapists/{f.therapist_ids[0]}/slots/", {}, None, False),
+    "categories": lambda f: ("GET", "/api/categories/", {}, None, False),
+    "blogs_by_category": lambda f: ("GET", f"/api/blogs/category/{quote(f.category.name)}/", {}, None, False),
+    "blog_detail": lambda f: ("GET", f"/api/blogs/{quote(f.category.name)}/{quote(f.blog.title)}", {}, None, False),
+    "latest_blogs": lambda f: ("GET", "/api/blogs/latest/", {}, None, False),
+    "latest_news": lambda f: ("GET", "/api/news/latest/", {}, None, False),
+    "bookings": lambda f: ("GET", "/api/bookings/", {}, None, True),
+    "booking_create": lambda f: ("POST", "/api/bookings/", {}, _booking(f), True),
+    "calculators": lambda f: ("GET", "/api/calculators/", {}, None, False),
+    "calculator_detail": lambda f: ("GET", f"/api/calculators/{quote(f.calculator.name)}/", {}, None, False),
+    "calculator_submit": lambda f: (
+        "POST", f"/api/calculators/{quote(f.calculator.name)}/submit/", {}, _json({"answers": [1] * f.question_count}), True
+    ),
+    "user_scores": lambda f: ("GET", "/api/user/scores/", {}, None, True),
+    "save_score": lambda f: (
+        "POST", "/api/save-score/", {}, _json({"calculator_name": f.calculator.name, "answers": [1] * f.question_count}), True
+    ),
+    "search": lambda f: ("GET", "/api/search/?q=sleep+diary", {}, None, False),
+}
+
+
+def build_request(route, fixture):
+    method, path, headers, body, authenticated = ROUTES[route](fixture)
+    headers = dict(headers)
+    if authenticated:
+        headers["authorization"] = f"Bearer {fixture.access}"
+    content_type, data = body or ("", b"")
+    return method, path, headers, content_type, data
+
+
+def count_queries(execute, sql, params, many, context):
+    counter = _queries.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(connection, **kwargs):
+    # Outermost, so it never disturbs the push/pop order of wrappers added during a request
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_queries)
+
+
+# Drivers: each sends one request and returns its status code
+
+_factory = RequestFactory()
+
+
+def send_wsgi(application, request):
+    method, path, headers, content_type, data = request
+    extra = {"HTTP_" + name.upper().replace("-", "_"): value for name, value in headers.items()}
+    environ = _factory.generic(method, path, data, content_type=content_type or "application/octet-stream", **extra).environ
+    statuses = []
+    response = application(environ, lambda status, response_headers, exc_info=None: statuses.append(status))
+    try:
+        for _ in response:
+            pass
+    finally:
+        if hasattr(response, "close"):
+            response.close()
+    return int(statuses[0].split()[0])
+
+
+async def send_asgi(application, request):
+    method, path, headers, content_type, data = request
+    url = urlsplit(path)
+    raw_headers = [(b"host", b"testserver")] + [(name.encode(), value.encode()) for name, value in headers.items()]
+    if content_type:
+        raw_headers += [(b"content-type", content_type.encode()), (b"content-length", str(len(data)).encode())]
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+        "path": unquote(url.path), "raw_path": url.path.encode(), "query_string": url.query.encode(), "root_path": "",
+        "headers": raw_headers, "client": ("127.0.0.1", 0), "server": ("testserver", 80),
+    }
+    messages = [{"type": "http.request", "body": data, "more_body": False}]
+    disconnected = asyncio.Event()  # The client never goes away mid-request
+    statuses = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await disconnected.wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    await application(scope, receive, send)
+    return statuses[0]
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(samples, elapsed):
+    """Stats of one route from (seconds, status, queries) samples taken over ``elapsed`` seconds"""
+    latencies = sorted(seconds * 1000 for seconds, _, _ in samples)
+    queries = [count for _, _, count in samples]
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for _, status, _ in samples if status >= 400),
+        "statuses": dict(sorted(Counter(str(status) for _, status, _ in samples).items())),
+        "throughput_rps": round(len(samples) / elapsed, 1) if elapsed else None,
+        "mean_ms": round(sum(latencies) / len(latencies), 2),
+        **{f"p{p}_ms": round(percentile(latencies, p), 2) for p in (50, 95, 99)},
+        "queries_mean": round(sum(queries) / len(queries), 2),
+        "queries_max": max(queries),
+    }
+
+
+def run_wsgi(application, pending, concurrency):
+    def one(request):
+        counter = [0]
+        _queries.set(counter)
+        started = time.perf_counter()
+        status = send_wsgi(application, request)
+        return time.perf_counter() - started, status, counter[0]
+
+    def worker(batch):
+        try:
+            return [one(request) for request in batch]
+        finally:
+            connections.close_all()  # Each worker thread opened its own connection
+
+    batches = [pending[i::concurrency] for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency, thread_name_prefix="benchmark") as pool:
+        samples = [sample for result in pool.map(worker, batches) for sample in result]
+    return summarize(samples, time.perf_counter() - started)
+
+
+def run_asgi(application, pending, concurrency):
+    async def one(request, semaphore):
+        async with semaphore:
+            counter = [0]
+            _queries.set(counter)  # Each task runs in its own copy of the context
+            started = time.perf_counter()
+            status = await send_asgi(application, request)
+            return time.perf_counter() - started, status, counter[0]
+
+    async def run(pending):
+        semaphore = asyncio.Semaphore(concurrency)
+        started = time.perf_counter()
+        samples = await asyncio.gather(*(one(request, semaphore) for request in pending))
+        return samples, time.perf_counter() - started
+
+    # Run in a fresh thread so the sync views get a connection of their own
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(value=asyncio.run(run(pending))))
+    thread.start()
+    thread.join()
+    samples, elapsed = result["value"]
+    return summarize(samples, elapsed)
+
+
+DRIVERS = {"wsgi": run_wsgi, "asgi": run_asgi, "asgi-sync": run_asgi}
+
+
+class ExceptionCounter(logging.Handler):
+    """Counts the exceptions behind 500 responses, which django.request logs"""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.counts = Counter()
+
+    def emit(self, record):
+        if record.exc_info:
+            error = record.exc_info[1]
+            self.counts[f"{type(error).__name__}: {error}"[:200]] += 1
+
+    @contextmanager
+    def watching(self, logger_name="django.request"):
+        logger = logging.getLogger(logger_name)
+        logger.addHandler(self)
+        try:
+            yield self
+        finally:
+            logger.removeHandler(self)
+
+
+def run(applications, fixture, routes, requests, concurrency, warmup=5, mixed=False, progress=None):
+    """
+    {driver: {workload: stats}} for every driver in ``applications`` ({name: app}).
+    Each route is its own workload, unless ``mixed`` interleaves them all into one
+    called "mixed", e.g. to measure how concurrent reads and writes contend.
+    """
+    workloads = {"mixed": list(routes)} if mixed else {route: [route] for route in routes}
+    results = {}
+    connection_created.connect(install_query_counter, dispatch_uid="benchmark_query_counter")
+    for connection in connections.all(initialized_only=True):
+        install_query_counter(connection)
+    try:
+        for driver, application in applications.items():
+            results[driver] = {}
+            for name, members in workloads.items():
+                cache.clear()  # Every workload starts cold, then warms up before being timed
+                DRIVERS[driver](application, [build_request(route, fixture) for route in members for _ in range(warmup)], 1)
+                pending = [build_request(members[i % len(members)], fixture) for i in range(requests)]
+                with ExceptionCounter().watching() as exceptions:
+                    results[driver][name] = DRIVERS[driver](application, pending, concurrency)
+                results[driver][name]["exceptions"] = dict(exceptions.counts.most_common())
+                if progress:
+                    progress(driver, name, results[driver][name])
+    finally:
+        connection_created.disconnect(dispatch_uid="benchmark_query_counter")
+    return results
+
+
+def compare(report, baseline, tolerance=0.2):
+    """Human readable regressions of ``report`` against ``baseline``"""
+    regressions = []
+    for driver, routes in report["results"].items():
+        for route, stats in routes.items():
+            before = baseline.get("results", {}).get(driver, {}).get(route)
+            if before is None:
+                continue
+            name = f"{driver} {route}"
+            if stats["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {stats['p95_ms']}ms")
+            if stats["queries_mean"] > before["queries_mean"]:
+                regressions.append(f"{name}: {before['queries_mean']} -> {stats['queries_mean']} queries per request")
+            if stats["errors"] > before["errors"]:
+                regressions.append(f"{name}: {before['errors']} -> {stats['errors']} failed requests")
+    return regressions
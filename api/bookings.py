@@ -0,0 +1,86 @@
+"""
+Bulk status and payment changes to bookings.
+
+``bulk_update`` classifies every requested id with one SELECT and applies
+the change to all the rows it can with one UPDATE, inside one transaction.
+IMMEDIATE transactions (see api.database) hold the write lock from the
+start, so nothing changes between the two statements.
+
+Reactivating a cancelled booking can collide with the slot constraint on
+(therapist, date, time), so those ids are checked against the active
+bookings first and reported as conflicts instead of failing the whole
+update.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .models import Bookings
+
+
+UPDATED = "updated"
+UNCHANGED = "unchanged"  # Already in the requested state, not written
+NOT_FOUND = "not_found"  # Missing, or not one of the therapist's bookings
+CONFLICT = "conflict"  # Reactivating it would double-book the slot
+
+
+class BulkUpdateConflict(Exception):
+    pass
+
+
+def bulk_update(ids, changes, therapist_id=None):
+    """
+    Apply ``changes`` ({"status": ..., "paid": ...}) to the bookings in ``ids``,
+    limited to ``therapist_id``'s bookings if given. Returns {id: result}.
+    """
+    with transaction.atomic():
+        bookings = Bookings.objects.filter(pk__in=ids)
+        if therapist_id is not None:
+            bookings = bookings.filter(therapist_id=therapist_id)
+        rows = {row["pk"]: row for row in bookings.values("pk", "therapist_id", "date", "time", "status", "paid")}
+
+        results = {}
+        to_update = []
+        for pk in ids:
+            row = rows.get(pk)
+            if row is None:
+                results[pk] = NOT_FOUND
+            elif all(row[field] == value for field, value in changes.items()):
+                results[pk] = UNCHANGED
+            else:
+                to_update.append(pk)
+
+        if changes.get("status") not in (None, "cancelled"):
+            conflicts = _reactivation_conflicts([rows[pk] for pk in to_update])
+            results.update(dict.fromkeys(conflicts, CONFLICT))
+            to_update = [pk for pk in to_update if pk not in conflicts]
+
+        if to_update:
+            try:
+                Bookings.objects.filter(pk__in=to_update).update(**changes)
+            except IntegrityError:  # Rolls back the whole batch
+                raise BulkUpdateConflict("A booking's slot was taken while updating.")
+            results.update(dict.fromkeys(to_update, UPDATED))
+    return results
+
+
+def _reactivation_conflicts(rows):
+    """Ids of the cancelled bookings in ``rows`` whose slot another active booking holds"""
+    cancelled = [
+        (row["pk"], (row["therapist_id"], row["date"], row["time"])) for row in rows
+        if row["status"] == "cancelled" and row["date"] is not None and row["time"] is not None
+    ]
+    if not cancelled:
+        return set()
+    slots = Q()
+    for _, (therapist_id, date, time) in cancelled:
+        slots |= Q(therapist_id=therapist_id, date=date, time=time)
+    taken = set(
+        Bookings.objects.filter(slots).exclude(status="cancelled").values_list("therapist_id", "date", "time")
+    )
+    conflicts = set()
+    for pk, slot in cancelled:
+        if slot in taken:
+            conflicts.add(pk)
+        else:
+            taken.add(slot)  # The first reactivated booking in the batch claims it
+    return conflicts
@@ -0,0 +1,167 @@
+"""
+Versioned response cache and conditional GET for the public read endpoints.
+
+Every model a cached view is built from has a version number stored in the
+cache. The signal handlers in ``api.signals`` bump that number whenever a row
+is saved or deleted, so cached bodies are never deleted explicitly: once any
+of the models behind a response changes, its key is simply never looked up
+again and the entry ages out on its own.
+
+Versions are nanosecond timestamps of the last change, which makes them
+double as validators: the ETag hashes them and Last-Modified is the newest
+one, so a client revalidating with If-None-Match or If-Modified-Since gets a
+304 without any SQL or serializer work.
+
+Bulk ``QuerySet.update()`` / ``QuerySet.delete()`` calls bypass signals, so
+code that uses them on a cached model must call ``bump_version`` itself.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+VERSION_KEY = "api:version:{}"
+RESPONSE_KEY = "api:response:{}:{}:{}"
+
+# Cached bodies are keyed by version, so the timeout only bounds how long an
+# unused entry occupies the cache; it never decides freshness.
+RESPONSE_TIMEOUT = getattr(settings, "API_RESPONSE_CACHE_TIMEOUT", 60 * 60)
+
+
+def _version_key(model):
+    return VERSION_KEY.format(model._meta.label_lower)
+
+
+def _initial_version():
+    # Seeding from the clock means a version that was evicted from the cache
+    # restarts above every number handed out before, so stale bodies stored
+    # under an older version can never be served again.
+    return time.time_ns()
+
+
+def get_versions(models):
+    """Return the current version of each model, in order, with one cache round trip."""
+    keys = [_version_key(model) for model in models]
+    found = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        version = found.get(key)
+        if version is None:
+            version = _initial_version()
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+        versions.append(version)
+    return versions
+
+
+async def aget_versions(models):
+    """get_versions for async views, through the cache's async API"""
+    keys = [_version_key(model) for model in models]
+    found = await cache.aget_many(keys)
+    versions = []
+    for key in keys:
+        version = found.get(key)
+        if version is None:
+            version = _initial_version()
+            if not await cache.aadd(key, version, None):
+                version = await cache.aget(key, version)
+        versions.append(version)
+    return versions
+
+
+def _bump(key):
+    # Concurrent bumps may overwrite each other, which is fine: either way the
+    # version moves away from the one every existing cached body was built under.
+    current = cache.get(key) or 0
+    cache.set(key, max(time.time_ns(), current + 1), None)
+
+
+def bump_version(model):
+    """Invalidate every cached response built from ``model``."""
+    key = _version_key(model)
+    _bump(key)
+    # Bump again once the change is visible to other connections: a request that
+    # read the old rows between the first bump and the commit would otherwise have
+    # cached them under the new version.
+    transaction.on_commit(lambda: _bump(key))
+
+
+def _request_digest(view, request, *parts):
+    # The absolute URI keeps hosts apart, since serialized media URLs embed the host
+    text = "\n".join([view.__class__.__name__, request.build_absolute_uri(), *map(str, parts)])
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+def response_cache_key(view, request, versions=None):
+    if versions is None:
+        versions = get_versions(view.cache_models)
+    path = _request_digest(view, request)
+    return RESPONSE_KEY.format(view.__class__.__name__, path, ".".join(str(version) for version in versions))
+
+
+def validators(view, request, versions):
+    """(ETag, Last-Modified timestamp) of a response built under ``versions``"""
+    # The representation differs per negotiated format, so Accept is part of the tag
+    etag = '"%s"' % _request_digest(view, request, request.META.get("HTTP_ACCEPT", ""), *versions)
+    last_modified = max(versions) // 10**9 if versions else None
+    return etag, last_modified
+
+
+def add_validators(response, etag, last_modified):
+    if response.status_code != 200:
+        return
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = "no-cache"  # Clients may keep it but must revalidate
+    patch_vary_headers(response, ["Accept"])
+
+
+class ConditionalGetMixin:
+    """
+    Answer GET requests carrying a current If-None-Match or If-Modified-Since with
+    304 Not Modified before the view queries or serializes anything. The validators
+    come from the versions of ``cache_models``, the models the response is built from.
+    """
+    cache_models = ()
+
+    def get(self, request, *args, **kwargs):
+        versions = get_versions(self.cache_models)
+        etag, last_modified = validators(self, request, versions)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response = self.get_fresh_response(request, versions, *args, **kwargs)
+        add_validators(response, etag, last_modified)
+        return response
+
+    def get_fresh_response(self, request, versions, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+class CachedResponseMixin(ConditionalGetMixin):
+    """
+    Serve GET requests from the cache, keyed by the versions of ``cache_models``.
+
+    Only the serialized ``response.data`` of successful responses is stored, so
+    content negotiation still happens per request while a hit runs no SQL and
+    no serializer at all.
+    """
+
+    def get_fresh_response(self, request, versions, *args, **kwargs):
+        key = response_cache_key(self, request, versions)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = super().get_fresh_response(request, versions, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, RESPONSE_TIMEOUT)
+        return response
@@ -0,0 +1,219 @@
+"""
+Chatbot replies from a seq2seq model, batched across concurrent requests.
+
+The model backend (``settings.CHATBOT_BACKEND``, any class with a
+``generate(conversations) -> replies`` method) is imported and loaded on the
+first message, in the batching thread, so neither startup nor the
+import of api.views pays for it. ``EchoBackend`` stands in for it in tests
+and development.
+
+Requests don't call the model themselves: ``MicroBatcher`` queues them and
+a single worker thread takes the first waiting request, collects whatever
+else arrives within ``CHATBOT_BATCH_WAIT`` seconds (up to
+``CHATBOT_MAX_BATCH``) and answers them all with one generate() call. A
+batch of eight costs little more than a single reply, so under load the
+throughput scales with the batch instead of queueing request by request.
+
+Conversations live in ``SessionStore``, an LRU keyed by session id that
+keeps the last ``CHATBOT_HISTORY_TURNS`` messages of each session. Its
+order is also last-activity order, so expired sessions are always at the
+front and are dropped in O(1) per session. Like the other caches here it
+is per process: a session moves on without its history if the next message
+lands on another worker.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from functools import partial
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+REPLY_TIMEOUT = getattr(settings, "CHATBOT_REPLY_TIMEOUT", 30)
+
+
+class BlenderbotBackend:
+    """facebook/blenderbot-* models through transformers"""
+    turn_separator = "</s> <s>"
+    max_length = 128  # Blenderbot's positional embeddings stop here
+
+    def __init__(self, model_name):
+        from transformers import BlenderbotForConditionalGeneration, BlenderbotTokenizer
+
+        self.tokenizer = BlenderbotTokenizer.from_pretrained(model_name)
+        self.tokenizer.truncation_side = "left"  # Drop the oldest turns, not the latest message
+        self.model = BlenderbotForConditionalGeneration.from_pretrained(model_name)
+        self.model.eval()
+
+    def generate(self, conversations):
+        import torch
+
+        texts = [self.turn_separator.join(message for _, message in turns) for turns in conversations]
+        inputs = self.tokenizer(
+            texts, return_tensors="pt", padding=True, truncation=True, max_length=self.max_length
+        )
+        with torch.inference_mode():
+            reply_ids = self.model.generate(**inputs)
+        return self.tokenizer.batch_decode(reply_ids, skip_special_tokens=True)
+
+
+class EchoBackend:
+    """Model-free backend for tests and development"""
+
+    def __init__(self, model_name=None):
+        self.batches = []
+
+    def generate(self, conversations):
+        self.batches.append(len(conversations))
+        return [f"You said: {turns[-1][1]}" for turns in conversations]
+
+
+def load_backend():
+    backend_class = import_string(getattr(settings, "CHATBOT_BACKEND", "api.chatbot.BlenderbotBackend"))
+    return backend_class(getattr(settings, "CHATBOT_MODEL", "facebook/blenderbot-400M-distill"))
+
+
+class MicroBatcher:
+    """Answers submitted conversations in batches of up to ``max_batch``, on one worker thread"""
+
+    def __init__(self, load_backend, max_batch=8, max_wait=0.02):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._load_backend = load_backend
+        self._backend = None
+        self._queue = queue.SimpleQueue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def submit(self, conversation):
+        """Future of the reply to ``conversation``, a list of (role, message) turns"""
+        future = Future()
+        self._queue.put((conversation, future))
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="chatbot-batcher", daemon=True)
+                    self._worker.start()
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._process(batch)
+
+    def _process(self, batch):
+        # Requests that gave up waiting have cancelled their future
+        batch = [(conversation, future) for conversation, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            if self._backend is None:
+                self._backend = self._load_backend()
+            replies = self._backend.generate([conversation for conversation, _ in batch])
+        except Exception as error:
+            # A backend that failed to load is retried with the next batch
+            logger.exception("Chatbot batch of %d failed", len(batch))
+            for _, future in batch:
+                future.set_exception(error)
+            return
+        replies = list(replies)
+        if len(replies) != len(batch):
+            logger.error("Chatbot backend returned %d replies for a batch of %d", len(replies), len(batch))
+        for (_, future), reply in zip(batch, replies):
+            future.set_result(reply)
+        # Left waiting, they would only fail at the view's timeout
+        for _, future in batch[len(replies):]:
+            future.set_exception(RuntimeError("The chatbot backend returned no reply."))
+
+
+class SessionStore:
+    """Thread-safe LRU of session id -> last ``max_turns`` (role, message) turns, expiring after ``ttl`` idle seconds"""
+
+    def __init__(self, max_sessions, ttl, max_turns):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self._sessions = OrderedDict()  # session id -> (last active, turns), least recently active first
+        self._lock = threading.Lock()
+
+    def append(self, session_id, role, message):
+        """Add a turn and return the session's turns so far"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._sessions.pop(session_id, None)
+            turns = entry[1] if entry else deque(maxlen=self.max_turns)
+            turns.append((role, message))
+            self._sessions[session_id] = (now, turns)
+            if len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return list(turns)
+
+    def get(self, session_id):
+        with self._lock:
+            self._expire(time.monotonic())
+            entry = self._sessions.get(session_id)
+            return list(entry[1]) if entry else []
+
+    def _expire(self, now):
+        while self._sessions:
+            session_id, (last_active, _) = next(iter(self._sessions.items()))
+            if now - last_active < self.ttl:
+                return
+            del self._sessions[session_id]
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class Chatbot:
+    def __init__(self, sessions, batcher):
+        self.sessions = sessions
+        self.batcher = batcher
+
+    def ask(self, session_id, message):
+        """Future of the reply to ``message``, which is recorded in the session once it arrives"""
+        conversation = self.sessions.append(session_id, "user", message)
+        future = self.batcher.submit(conversation)
+        future.add_done_callback(partial(self._record_reply, session_id))
+        return future
+
+    def _record_reply(self, session_id, future):
+        if not future.cancelled() and future.exception() is None:
+            self.sessions.append(session_id, "bot", future.result())
+
+
+_chatbot = None
+_chatbot_lock = threading.Lock()
+
+
+def get_chatbot():
+    global _chatbot
+    with _chatbot_lock:
+        if _chatbot is None:
+            _chatbot = Chatbot(
+                SessionStore(
+                    max_sessions=getattr(settings, "CHATBOT_MAX_SESSIONS", 10000),
+                    ttl=getattr(settings, "CHATBOT_SESSION_TIMEOUT", 10 * 60),
+                    max_turns=getattr(settings, "CHATBOT_HISTORY_TURNS", 10),
+                ),
+                MicroBatcher(
+                    load_backend,
+                    max_batch=getattr(settings, "CHATBOT_MAX_BATCH", 8),
+                    max_wait=getattr(settings, "CHATBOT_BATCH_WAIT", 0.02),
+                ),
+            )
+    return _chatbot
@@ -0,0 +1,89 @@
+"""
+SQLite tuning and read routing.
+
+``configure_connection`` runs on every new connection (see api.signals) and
+applies ``settings.SQLITE_PRAGMAS``. WAL lets readers carry on while a
+writer commits, and busy_timeout makes writers queue for the lock instead
+of failing with "database is locked". IMMEDIATE transactions (the
+``transaction_mode`` option in settings) take the write lock when the
+transaction starts, so a transaction that reads first never hits an
+unrecoverable lock upgrade.
+
+Reads of safe (GET/HEAD/OPTIONS) requests go to the ``replica`` alias
+through ``ReadOnlyRequestMiddleware`` and ``ReadReplicaRouter``. With SQLite
+that is a second, query_only connection to the same file, so those requests
+never contend with writes on the default connection. Reads inside an atomic
+block on default stay there, so a transaction always sees its own writes.
+"""
+import contextvars
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+REPLICA = "replica"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_read_only = contextvars.ContextVar("read_only_request", default=False)
+
+
+def configure_connection(sender, connection, **kwargs):
+    """connection_created handler"""
+    if connection.vendor != "sqlite":
+        return
+    pragmas = dict(getattr(settings, "SQLITE_PRAGMAS", {}))
+    if connection.alias == REPLICA:
+        pragmas.pop("journal_mode", None)  # Changing it is a write; the default connection sets it
+        pragmas["query_only"] = "ON"
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+class ReadOnlyRequestMiddleware:
+    """Marks safe requests as read-only, which sends their reads to the replica"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _read_only.set(request.method in SAFE_METHODS)
+        try:
+            return self.get_response(request)
+        finally:
+            _read_only.reset(token)
+
+    async def __acall__(self, request):
+        # sync_to_async copies the context, so the ORM threads see the flag
+        token = _read_only.set(request.method in SAFE_METHODS)
+        try:
+            return await self.get_response(request)
+        finally:
+            _read_only.reset(token)
+
+
+class ReadReplicaRouter:
+    def __init__(self):
+        self.enabled = REPLICA in settings.DATABASES
+
+    def db_for_read(self, model, **hints):
+        if self.enabled and _read_only.get() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
@@ -0,0 +1,177 @@
+"""
+Width-bounded WebP/JPEG derivatives of uploaded images.
+
+When a model with an image is saved with a new file, ``schedule_derivatives``
+queues a job on a small thread pool once the transaction commits, so uploads
+never wait for resizing. The job writes each derivative through the field's
+storage and records them in the matching ``*_variants`` JSON field:
+
+    {"source": "blogs/photo.jpg", "width": 612,
+     "webp": {"160": "blogs/derivatives/photo-jpg-160w.webp", ...},
+     "jpeg": {"160": "blogs/derivatives/photo-jpg-160w.jpg", ...}}
+
+Serializers turn that into per-format width -> URL maps (``ImageVariantsField``)
+so clients can pick the smallest adequate file.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from .cache import bump_version
+from .models import User, BlogsCategories, BlogImages, Calculators
+
+
+logger = logging.getLogger(__name__)
+
+# Model -> [(image field, variants field)]
+IMAGE_FIELDS = {
+    User: [("therapist_img", "therapist_img_variants"), ("therapist_popUp", "therapist_popUp_variants")],
+    BlogsCategories: [("img", "img_variants")],
+    BlogImages: [("image", "image_variants")],
+    Calculators: [("img", "img_variants")],
+}
+
+FORMATS = (("webp", "WEBP", {"quality": 80, "method": 4}), ("jpeg", "JPEG", {"quality": 82, "optimize": True, "progressive": True}))
+EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def derivative_widths(source_width):
+    """Configured widths below the source's, plus the source width capped at the largest"""
+    widths = sorted(getattr(settings, "IMAGE_DERIVATIVE_WIDTHS", (160, 320, 640, 1280)))
+    bounded = [width for width in widths if width < source_width]
+    bounded.append(min(source_width, widths[-1]))
+    return sorted(set(bounded))
+
+
+def derivative_name(source_name, width, fmt):
+    directory, filename = os.path.split(source_name)
+    # The source extension stays in the name, so photo.jpg and photo.png don't share derivatives
+    stem = filename.replace(".", "-")
+    return os.path.join(directory, "derivatives", f"{stem}-{width}w.{EXTENSIONS[fmt]}")
+
+
+def generate_derivatives(field_file):
+    """Render and store every derivative of ``field_file``, returning its variants dict"""
+    storage = field_file.storage
+    with field_file.open("rb") as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    variants = {"source": field_file.name, "width": image.width}
+    for fmt, pil_format, options in FORMATS:
+        variants[fmt] = {}
+        for width in derivative_widths(image.width):
+            height = max(1, round(image.height * width / image.width))
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            buffer = io.BytesIO()
+            resized.save(buffer, pil_format, **options)
+            name = derivative_name(field_file.name, width, fmt)
+            if storage.exists(name):
+                storage.delete(name)
+            variants[fmt][str(width)] = storage.save(name, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def _counts_references(storage, name):
+    # api.storage.ContentAddressedStorage: every save of a name adds a reference to it
+    return getattr(storage, "is_addressed", lambda name: False)(name)
+
+
+def _derivative_names(variants):
+    return [name for fmt, _, _ in FORMATS for name in (variants or {}).get(fmt, {}).values()]
+
+
+def _stale_names(storage, old, new):
+    keep = set(_derivative_names(new))
+    return [name for name in _derivative_names(old) if name not in keep or _counts_references(storage, name)]
+
+
+def process_image(model, pk, image_field, variants_field):
+    """Worker job: build derivatives for one image field of one row"""
+    try:
+        instance = model.objects.only("pk", image_field, variants_field).get(pk=pk)
+        field_file = getattr(instance, image_field)
+        old = getattr(instance, variants_field)
+        variants = generate_derivatives(field_file) if field_file else {}
+        # Only record them if no newer upload replaced the file in the meantime
+        if field_file:
+            unchanged = Q(**{image_field: field_file.name})
+        else:
+            unchanged = Q(**{image_field: ""}) | Q(**{f"{image_field}__isnull": True})
+        updated = model.objects.filter(unchanged, pk=pk).update(**{variants_field: variants})
+        if updated:
+            for name in _stale_names(field_file.storage, old, variants):
+                field_file.storage.delete(name)
+            bump_version(model)
+        else:
+            # Superseded by a newer upload: give back the references this run added
+            for name in _derivative_names(variants):
+                if _counts_references(field_file.storage, name):
+                    field_file.storage.delete(name)
+    except Exception:
+        logger.exception("Could not build derivatives for %s %s.%s", model._meta.label, pk, image_field)
+
+
+def _worker_job(*args):
+    try:
+        process_image(*args)
+    finally:
+        # Pool threads outlive requests, so they tidy up their own connection
+        connections.close_all()
+
+
+def _submit(model, pk, image_field, variants_field):
+    global _executor
+    workers = getattr(settings, "IMAGE_DERIVATIVE_WORKERS", 2)
+    if not workers:
+        process_image(model, pk, image_field, variants_field)
+        return
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-derivatives")
+    _executor.submit(_worker_job, model, pk, image_field, variants_field)
+
+
+def needs_derivatives(instance, image_field, variants_field):
+    name = getattr(instance, image_field).name or ""
+    variants = getattr(instance, variants_field) or {}
+    return variants.get("source", "") != name
+
+
+def schedule_derivatives(sender, instance, raw=False, update_fields=None, **kwargs):
+    """post_save handler queueing derivative jobs for image fields whose file changed"""
+    if raw:  # Loading fixtures
+        return
+    sender = sender._meta.concrete_model
+    for image_field, variants_field in IMAGE_FIELDS[sender]:
+        if update_fields is not None and image_field not in update_fields:
+            continue
+        if needs_derivatives(instance, image_field, variants_field):
+            transaction.on_commit(
+                lambda pk=instance.pk, fields=(image_field, variants_field): _submit(sender, pk, *fields)
+            )
+
+
+def variant_url(field_file, variants, min_width, fmt="jpeg"):
+    """
+    URL of the smallest derivative at least ``min_width`` wide (the largest if
+    none is), falling back to the original until derivatives exist
+    """
+    widths = sorted(int(width) for width in (variants or {}).get(fmt, {}))
+    if not (variants and variants.get("source") == field_file.name and widths):
+        return field_file.url
+    width = next((width for width in widths if width >= min_width), widths[-1])
+    return field_file.storage.url(variants[fmt][str(width)])
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import CalculatorScores, CalculatorLatestScore
+from api.scoring import upsert_latest_scores
+
+
+class Command(BaseCommand):
+    help = "Rebuild the latest score of every user and calculator from the CalculatorScores history"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows written per statement")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        batch_size = options["batch_size"]
+        # One ordered pass over the history: the first row of each (user, calculator) is its latest
+        history = (
+            CalculatorScores.objects.order_by("user_id", "calculator_id", "-created_at", "-id")
+            .values_list("user_id", "calculator_id", "score", "created_at")
+            .iterator(chunk_size=batch_size)
+        )
+        batch = []
+        written = 0
+        previous = None
+        with transaction.atomic():
+            CalculatorLatestScore.objects.all().delete()
+            for user_id, calculator_id, score, created_at in history:
+                if (user_id, calculator_id) == previous:
+                    continue
+                previous = (user_id, calculator_id)
+                batch.append(CalculatorLatestScore(
+                    user_id=user_id, calculator_id=calculator_id, score=score, created_at=created_at
+                ))
+                if len(batch) >= batch_size:
+                    upsert_latest_scores(batch)
+                    written += len(batch)
+                    batch = []
+            upsert_latest_scores(batch)
+            written += len(batch)
+        self.stdout.write(f"Wrote {written} latest score(s) in {time.monotonic() - started:.2f}s")
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.cache import bump_version
+from api.richtext import RICH_TEXT_FIELDS, render_all, rendered_fields
+
+
+class Command(BaseCommand):
+    help = "Render the sanitized HTML, excerpt and reading time of every blog and therapist description"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Rows written per statement")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        for model, fields in RICH_TEXT_FIELDS.items():
+            started = time.monotonic()
+            columns = [column for field in fields for column in rendered_fields(field)]
+            pks = list(model.objects.order_by("pk").values_list("pk", flat=True))
+            written = 0
+            with transaction.atomic():
+                for start in range(0, len(pks), batch_size):
+                    batch = list(model.objects.filter(pk__in=pks[start:start + batch_size]).only("pk", *fields))
+                    for instance in batch:
+                        render_all(instance)
+                    written += model.objects.bulk_update(batch, columns)
+                if written:
+                    bump_version(model)
+            self.stdout.write(f"{model._meta.label}: rendered {written} row(s) in {time.monotonic() - started:.2f}s")
@@ -0,0 +1,140 @@
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+from contextlib import ExitStack, contextmanager
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test.utils import override_settings
+
+from api import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database and load-test every API route through the WSGI and ASGI apps, "
+        "writing latency percentiles, throughput and SQL queries per request to a JSON report"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=100, help="Timed requests per route and driver")
+        parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once")
+        parser.add_argument(
+            "--drivers", nargs="+", choices=sorted(benchmark.DRIVERS), default=["wsgi", "asgi"],
+            help="asgi-sync serves every route with the sync views, to compare against asgi's async ones",
+        )
+        parser.add_argument("--routes", nargs="+", choices=list(benchmark.ROUTES), default=list(benchmark.ROUTES))
+        parser.add_argument("--scale", type=int, default=1, help="Multiplies the size of the seeded dataset")
+        parser.add_argument(
+            "--mixed", action="store_true", help="Interleave the routes into one workload instead of one per route"
+        )
+        parser.add_argument(
+            "--untuned", action="store_true",
+            help="Run on SQLite's defaults (no pragmas, replica or persistent connections) for comparison",
+        )
+        parser.add_argument("--output", default="benchmark.json", help="Where to write the report")
+        parser.add_argument("--compare", metavar="BASELINE", help="Fail if the report regressed against this one")
+        parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 slowdown, as a fraction")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"]) as handle:
+                    baseline = json.load(handle)
+            except (OSError, ValueError) as error:
+                raise CommandError(f"Could not read {options['compare']}: {error}")
+
+        # Like the test runner: a migrated database of our own that is thrown away afterwards
+        with tempfile.TemporaryDirectory(prefix="benchmark-") as directory, ExitStack() as stack:
+            if options["untuned"]:
+                stack.enter_context(self.untuned())
+            connection.settings_dict.setdefault("TEST", {})["NAME"] = os.path.join(directory, "db.sqlite3")
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            for alias in connections:
+                if alias != DEFAULT_DB_ALIAS:
+                    connections[alias].creation.set_as_test_mirror(connection.settings_dict)
+            if options["untuned"]:
+                with connection.cursor() as cursor:
+                    cursor.execute("PRAGMA journal_mode = DELETE")
+            try:
+                # DEBUG would log every query in memory and skew timings
+                with override_settings(DEBUG=False):
+                    fixture = benchmark.seed(options["scale"])
+                    results = benchmark.run(
+                        self.applications(options["drivers"]), fixture, options["routes"], options["requests"],
+                        options["concurrency"], mixed=options["mixed"], progress=self.progress,
+                    )
+            finally:
+                connections.close_all()
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {"meta": self.meta(options), "results": results}
+        with open(options["output"], "w") as handle:
+            json.dump(report, handle, indent=2)
+        self.stdout.write(f"Wrote {options['output']}")
+
+        if baseline is not None:
+            regressions = benchmark.compare(report, baseline, options["tolerance"])
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
+
+    @contextmanager
+    def untuned(self):
+        """The database setup from before api/database.py: one alias, no pragmas, a connection per request"""
+        options = connection.settings_dict["OPTIONS"]
+        saved = dict(options), connection.settings_dict["CONN_MAX_AGE"]
+        options.pop("transaction_mode", None)
+        connection.settings_dict["CONN_MAX_AGE"] = 0
+        try:
+            with override_settings(SQLITE_PRAGMAS={}, DATABASE_ROUTERS=[]):
+                yield
+        finally:
+            options.clear()
+            options.update(saved[0])
+            connection.settings_dict["CONN_MAX_AGE"] = saved[1]
+
+    def applications(self, drivers):
+        applications = {}
+        if "wsgi" in drivers:
+            from backend.wsgi import application
+            applications["wsgi"] = application
+        if "asgi" in drivers:
+            from backend.asgi import application
+            applications["asgi"] = application
+        if "asgi-sync" in drivers:
+            # backend/asgi.py without its async views: every route on the sync views
+            from django.core.handlers.asgi import ASGIHandler
+            applications["asgi-sync"] = ASGIHandler()
+        return applications
+
+    def progress(self, driver, route, stats):
+        self.stdout.write(
+            f"{driver:9} {route:20} p50 {stats['p50_ms']:8.2f}ms  p95 {stats['p95_ms']:8.2f}ms  "
+            f"p99 {stats['p99_ms']:8.2f}ms  {stats['throughput_rps']:8.1f} req/s  "
+            f"{stats['queries_mean']:5.1f} queries  {stats['errors']} errors"
+        )
+
+    def meta(self, options):
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            "commit": commit,
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "requests": options["requests"],
+            "concurrency": options["concurrency"],
+            "scale": options["scale"],
+            "mixed": options["mixed"],
+            "untuned": options["untuned"],
+        }
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from api.storage import dedupe
+
+
+class Command(BaseCommand):
+    help = (
+        "Rename uploaded media to content hashes, dropping duplicate copies, and count the references "
+        "to each file; best run while no uploads are in progress"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+
+    def handle(self, *args, **options):
+        files, renamed, duplicates, saved = dedupe(dry_run=options["dry_run"])
+        verb = "Would rename" if options["dry_run"] else "Renamed"
+        self.stdout.write(
+            f"{verb} {renamed} of {files} file(s); {duplicates} duplicate(s), {saved / 1024:.1f} KiB reclaimed"
+        )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from api.images import IMAGE_FIELDS, needs_derivatives, process_image
+
+
+class Command(BaseCommand):
+    help = "Build WebP/JPEG derivatives for uploaded images that don't have current ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Rebuild derivatives that are already up to date")
+
+    def handle(self, *args, **options):
+        for model, fields in IMAGE_FIELDS.items():
+            for image_field, variants_field in fields:
+                with_file = model.objects.exclude(Q(**{image_field: ""}) | Q(**{f"{image_field}__isnull": True}))
+                # Materialized up front: process_image writes while we walk the rows
+                rows = list(with_file.only("pk", image_field, variants_field))
+                built = 0
+                for instance in rows:
+                    if options["force"] or needs_derivatives(instance, image_field, variants_field):
+                        process_image(model, instance.pk, image_field, variants_field)
+                        built += 1
+                self.stdout.write(f"{model._meta.label}.{image_field}: {built} image(s) processed")
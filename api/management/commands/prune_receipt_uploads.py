@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from api.uploads import prune
+
+
+class Command(BaseCommand):
+    help = "Delete receipt uploads that were never finished, with their partial files; run it daily"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Pruned {prune()} abandoned upload(s)")
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from api.revocation import prune
+
+
+class Command(BaseCommand):
+    help = "Delete revoked refresh token JTIs whose tokens have expired; run it daily"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Pruned {prune()} expired revocation(s)")
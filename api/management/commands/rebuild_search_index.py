@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of blogs, news and therapists"
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError("The search index needs the SQLite FTS5 extension.")
+        started = time.monotonic()
+        with transaction.atomic():
+            total = search.rebuild()
+        self.stdout.write(f"Indexed {total} document(s) in {time.monotonic() - started:.2f}s")
@@ -0,0 +1,223 @@
+"""
+Production delivery of uploaded media, routed at MEDIA_URL by backend/urls.py.
+
+* With MEDIA_SENDFILE set, the response is headers only: X-Accel-Redirect
+  (nginx) or X-Sendfile (Apache mod_xsendfile, lighttpd) tells the proxy
+  which file to send, and it serves the bytes and any Range request from
+  its own workers. For nginx, MEDIA_ACCEL_REDIRECT_PREFIX must be an
+  internal location aliased to MEDIA_ROOT:
+
+      location /protected-media/ { internal; alias /srv/hiba/media/; }
+
+* Without a proxy, a full response is a FileResponse, which WSGI servers
+  pass to sendfile(2) through wsgi.file_wrapper. A single Range gets a 206
+  of just that range. Several ranges get the whole file, which RFC 9110
+  allows. Under ASGI, where Django would read a sync file iterator into
+  memory, the file is read a block at a time on asgiref's thread.
+
+Content-addressed names (api.storage) never change, so their responses are
+cached for a year as immutable with the hash as ETag. Other names are
+revalidated after MEDIA_CACHE_MAX_AGE against Last-Modified and an ETag
+built from the file's mtime and size.
+
+Receipts are private: only staff and the patient or therapist of a booking
+holding the file get it, signed in by session or bearer token, and the
+response may only be cached by their own browser. Anyone else gets a 404,
+so guessable legacy names don't reveal which receipts exist.
+"""
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import APIException
+
+from .authentication import ClaimsJWTAuthentication
+from .models import Bookings
+from .storage import is_content_name
+
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+PRIVATE = "private, no-cache"
+PRIVATE_PREFIXES = ("receipts/",)
+BLOCK_SIZE = 64 * 1024
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def media_file(path):
+    """(absolute path, stat result) of a file under MEDIA_ROOT; Http404 for anything else"""
+    if any(part.startswith(".") for part in path.split("/")):  # Includes api.storage's saves in progress
+        raise Http404
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        result = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404
+    if not stat.S_ISREG(result.st_mode):
+        raise Http404
+    return full_path, result
+
+
+def is_private(path):
+    return path.startswith(PRIVATE_PREFIXES)
+
+
+def request_user(request):
+    """The session user, else the user of a valid bearer token, else None"""
+    if request.user.is_authenticated:
+        return request.user
+    try:
+        authenticated = ClaimsJWTAuthentication().authenticate(request)
+    except APIException:
+        return None
+    return authenticated[0] if authenticated else None
+
+
+def can_read_private(request, path):
+    user = request_user(request)
+    if user is None or not user.is_active:
+        return False
+    if user.is_staff:
+        return True
+    return Bookings.objects.filter(Q(user=user) | Q(therapist=user), receipt=path).exists()
+
+
+def is_immutable(path):
+    return getattr(default_storage, "is_addressed", lambda name: False)(path) and is_content_name(path)
+
+
+def validators(path, result):
+    """(ETag, Last-Modified timestamp)"""
+    if is_immutable(path):
+        etag = '"%s"' % os.path.splitext(os.path.basename(path))[0]
+    else:
+        etag = '"%x-%x"' % (result.st_mtime_ns, result.st_size)
+    return etag, int(result.st_mtime)
+
+
+def byte_range(request, size, etag, last_modified):
+    """
+    (first, last) byte of the one range asked for, or None to send the whole
+    file (no Range, a stale If-Range, several ranges or a malformed header).
+    Raises RangeNotSatisfiable when the range starts past the end.
+    """
+    match = RANGE.match(request.headers.get("Range", "").replace(" ", ""))
+    if match is None:
+        return None
+    if_range = request.headers.get("If-Range")
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified:
+        return None
+    first, last = match.groups()
+    if not first:  # The last N bytes
+        if not last or int(last) == 0:
+            raise RangeNotSatisfiable
+        return max(size - int(last), 0), size - 1
+    first = int(first)
+    if first >= size:
+        raise RangeNotSatisfiable
+    last = min(int(last), size - 1) if last else size - 1
+    if last < first:
+        return None
+    return first, last
+
+
+def _blocks(full_path, offset, length):
+    with open(full_path, "rb") as handle:
+        handle.seek(offset)
+        while length > 0 and (block := handle.read(min(BLOCK_SIZE, length))):
+            length -= len(block)
+            yield block
+
+
+async def _ablocks(full_path, offset, length):
+    handle = await sync_to_async(open)(full_path, "rb")
+    try:
+        await sync_to_async(handle.seek)(offset)
+        while length > 0 and (block := await sync_to_async(handle.read)(min(BLOCK_SIZE, length))):
+            length -= len(block)
+            yield block
+    finally:
+        handle.close()
+
+
+def _body(request, full_path, offset, length, content_type, status=200):
+    if isinstance(request, ASGIRequest):
+        return StreamingHttpResponse(_ablocks(full_path, offset, length), content_type=content_type, status=status)
+    if status == 200:
+        # The whole file: open files go through wsgi.file_wrapper, i.e. sendfile(2)
+        return FileResponse(open(full_path, "rb"), content_type=content_type)
+    return StreamingHttpResponse(_blocks(full_path, offset, length), content_type=content_type, status=status)
+
+
+def _send(request, path, full_path, result, etag, last_modified):
+    content_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+    accel = getattr(settings, "MEDIA_SENDFILE", "")
+    if accel == "x-accel-redirect":
+        response = HttpResponse(content_type=content_type)
+        prefix = getattr(settings, "MEDIA_ACCEL_REDIRECT_PREFIX", "/protected-media/")
+        response["X-Accel-Redirect"] = quote(f"{prefix.rstrip('/')}/{path}")
+        return response
+    if accel == "x-sendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = full_path
+        return response
+
+    size = result.st_size
+    if request.method == "HEAD":
+        response = HttpResponse(content_type=content_type)
+        response["Content-Length"] = size
+        return response
+    try:
+        requested = byte_range(request, size, etag, last_modified)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+    if requested is None:
+        response = _body(request, full_path, 0, size, content_type)
+        response["Content-Length"] = size
+        return response
+    first, last = requested
+    response = _body(request, full_path, first, last - first + 1, content_type, status=206)
+    response["Content-Range"] = f"bytes {first}-{last}/{size}"
+    response["Content-Length"] = last - first + 1
+    return response
+
+
+@require_safe
+def serve(request, path):
+    private = is_private(path)
+    if private and not can_read_private(request, path):
+        raise Http404
+    full_path, result = media_file(path)
+    etag, last_modified = validators(path, result)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = _send(request, path, full_path, result, etag, last_modified)
+    if response.status_code in (200, 206, 304):
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        if private:
+            response["Cache-Control"] = PRIVATE
+        elif is_immutable(path):
+            response["Cache-Control"] = IMMUTABLE
+        else:
+            response["Cache-Control"] = f"public, max-age={getattr(settings, 'MEDIA_CACHE_MAX_AGE', 3600)}"
+    response["Accept-Ranges"] = "bytes"
+    return response
@@ -0,0 +1,204 @@
+"""
+Per-request performance numbers: Server-Timing headers and Prometheus histograms.
+
+``PerformanceMiddleware`` measures each request's total time, the number
+and duration of its SQL queries (through ``time_queries``, an execute
+wrapper installed on every connection, which finds the request through a
+context variable, so queries the async views run in sync_to_async threads
+are counted too),
+the time spent in serializers using ``TimedSerializerMixin``, and the
+response size. The numbers go back to the client as a Server-Timing header,
+so they show up in the browser's network panel, and they are aggregated per
+view into fixed-bucket histograms served in the Prometheus text format by
+``metrics_view``.
+
+Histograms live in process memory, so each worker process reports its own
+series, distinguished by the ``instance`` label Prometheus adds per target.
+Recording costs a few perf_counter() calls and one short lock per
+histogram, which is cheap enough to leave on.
+"""
+import bisect
+import contextvars
+import hmac
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+_current = contextvars.ContextVar("request_timings", default=None)
+_serializing = contextvars.ContextVar("serializing", default=False)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label tuple, in the Prometheus sense"""
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in sorted(self._series.items())}
+        for label_values, series in snapshot.items():
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return "\n".join(lines)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_DURATION = Histogram(
+    "api_request_duration_seconds", "Time from the middleware to the response", ("view", "method"), DURATION_BUCKETS
+)
+DB_QUERIES = Histogram("api_request_db_queries", "SQL queries run per request", ("view", "method"), QUERY_BUCKETS)
+DB_DURATION = Histogram(
+    "api_request_db_duration_seconds", "Time spent in SQL per request", ("view", "method"), DURATION_BUCKETS
+)
+SERIALIZE_DURATION = Histogram(
+    "api_request_serialize_duration_seconds", "Time spent in serializers per request", ("view", "method"),
+    DURATION_BUCKETS,
+)
+RESPONSE_SIZE = Histogram("api_response_size_bytes", "Size of the response body", ("view", "method"), SIZE_BUCKETS)
+HISTOGRAMS = (REQUEST_DURATION, DB_QUERIES, DB_DURATION, SERIALIZE_DURATION, RESPONSE_SIZE)
+
+
+class RequestTimings:
+    __slots__ = ("queries", "db", "serialize")
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+
+
+def time_queries(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db += time.perf_counter() - started
+        timings.queries += 1
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """connection_created handler"""
+    # The wrapper list outlives reconnects of the same connection object
+    if time_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_queries)
+
+
+class TimedSerializerMixin:
+    """
+    Adds the serializer's to_representation time to the current request's timings.
+    Nested serializers are covered by the outermost one, so only top-level ones need it.
+    """
+
+    def to_representation(self, instance):
+        timings = _current.get()
+        if timings is None or _serializing.get():
+            return super().to_representation(instance)
+        token = _serializing.set(True)
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            timings.serialize += time.perf_counter() - started
+            _serializing.reset(token)
+
+
+def view_label(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    return match.view_name or match.route
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.record(request, response, timings, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.record(request, response, timings, time.perf_counter() - started)
+
+    def record(self, request, response, timings, total):
+        response["Server-Timing"] = (
+            f'total;dur={total * 1000:.1f}, db;dur={timings.db * 1000:.1f};desc="{timings.queries} queries", '
+            f"serialize;dur={timings.serialize * 1000:.1f}"
+        )
+        labels = (view_label(request), request.method)
+        REQUEST_DURATION.observe(labels, total)
+        DB_QUERIES.observe(labels, timings.queries)
+        DB_DURATION.observe(labels, timings.db)
+        SERIALIZE_DURATION.observe(labels, timings.serialize)
+        if not response.streaming:
+            RESPONSE_SIZE.observe(labels, len(response.content))
+        return response
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, for staff users or a bearer METRICS_TOKEN"""
+    token = getattr(settings, "METRICS_TOKEN", "")
+    bearer = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if not (request.user.is_staff or (token and hmac.compare_digest(bearer, token))):
+        return HttpResponseForbidden()
+    body = "\n".join(histogram.render() for histogram in HISTOGRAMS) + "\n"
+    return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")
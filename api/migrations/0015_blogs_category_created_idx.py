@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0014_bookings_receipt"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="blogs",
+            index=models.Index(
+                fields=["category", "created_at", "id"],
+                name="blogs_category_created_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def check_duplicate_bookings(apps, schema_editor):
+    """
+    Stop before adding the constraint if active bookings share a therapist
+    slot. Those are real patients' appointments, so someone has to cancel or
+    move them by hand rather than have the migration pick one.
+    """
+    Bookings = apps.get_model("api", "Bookings")
+    slots = {}
+    # Undated bookings hold no slot: NULLs never collide in the unique index
+    active = Bookings.objects.exclude(status="cancelled").filter(date__isnull=False, time__isnull=False)
+    for booking in active.order_by("created_at", "id").only("id", "therapist_id", "date", "time"):
+        slots.setdefault((booking.therapist_id, booking.date, booking.time), []).append(booking.id)
+    conflicts = [ids for ids in slots.values() if len(ids) > 1]
+    if conflicts:
+        raise RuntimeError(
+            "Active bookings share a therapist slot, so unique_active_booking_slot can't be added. "
+            "Cancel or reschedule all but one booking of each group, then migrate again: "
+            + "; ".join(", ".join(map(str, ids)) for ids in conflicts)
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0016_user_role_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TherapistAvailability",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "weekday",
+                    models.PositiveSmallIntegerField(
+                        blank=True,
+                        choices=[
+                            (0, "Monday"),
+                            (1, "Tuesday"),
+                            (2, "Wednesday"),
+                            (3, "Thursday"),
+                            (4, "Friday"),
+                            (5, "Saturday"),
+                            (6, "Sunday"),
+                        ],
+                        null=True,
+                    ),
+                ),
+                ("date", models.DateField(blank=True, null=True)),
+                ("start_time", models.TimeField(blank=True, null=True)),
+                ("end_time", models.TimeField(blank=True, null=True)),
+                ("is_available", models.BooleanField(default=True)),
+            ],
+        ),
+        migrations.RunPython(check_duplicate_bookings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="bookings",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status", "cancelled"), _negated=True),
+                fields=("therapist", "date", "time"),
+                name="unique_active_booking_slot",
+            ),
+        ),
+        migrations.AddField(
+            model_name="therapistavailability",
+            name="therapist",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="availability",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0017_therapistavailability_unique_active_booking_slot"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="blogimages",
+            name="image_variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name="blogscategories",
+            name="img_variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name="calculators",
+            name="img_variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="therapist_img_variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="therapist_popUp_variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,108 @@
+import re
+from html.parser import HTMLParser
+
+from django.db import migrations
+
+
+# Frozen copies of api.search as of this migration, so later changes there
+# don't change what it does on a fresh database.
+CREATE_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS api_search_index USING fts5("
+    "kind UNINDEXED, object_id UNINDEXED, title, body, "
+    "prefix = '2 3', tokenize = 'porter unicode61 remove_diacritics 2')"
+)
+DROP_TABLE = "DROP TABLE IF EXISTS api_search_index"
+INSERT = "INSERT INTO api_search_index (rowid, kind, object_id, title, body) VALUES (%s, %s, %s, %s, %s)"
+# rowid = pk * 4 + code of the kind
+DOCUMENTS = (
+    ("blog", 1, "SELECT id, title, content FROM api_blogs ORDER BY id"),
+    ("news", 2, "SELECT id, title, content FROM api_news ORDER BY id"),
+    (
+        "therapist", 3,
+        "SELECT id, COALESCE(NULLIF(TRIM(first_name || ' ' || last_name), ''), username), "
+        "COALESCE(therapist_expertise, '') FROM api_user WHERE role = 'therapist' ORDER BY id",
+    ),
+)
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "figcaption", "figure",
+    "footer", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "ol", "p", "pre", "section",
+    "table", "td", "th", "tr", "ul",
+}
+SKIPPED_TAGS = {"script", "style", "template"}
+WHITESPACE = re.compile(r"\s+")
+
+
+class TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skipping += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in BLOCK_TAGS:
+            self.parts.append(" ")
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.parts.append(data)
+
+
+def strip_html(html):
+    if not html:
+        return ""
+    parser = TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return WHITESPACE.sub(" ", "".join(parser.parts)).strip()
+
+
+def fill_search_index(connection, batch_size=500):
+    with connection.cursor() as read, connection.cursor() as write:
+        write.execute("DELETE FROM api_search_index")
+        for kind, code, select in DOCUMENTS:
+            read.execute(select)
+            while rows := read.fetchmany(batch_size):
+                write.executemany(INSERT, [
+                    (pk * 4 + code, kind, pk, title, strip_html(body) if kind == "blog" else body)
+                    for pk, title, body in rows
+                ])
+        write.execute("INSERT INTO api_search_index (api_search_index) VALUES ('optimize')")
+
+
+def has_fts5(connection):
+    if connection.vendor != "sqlite":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pragma_compile_options WHERE compile_options = 'ENABLE_FTS5'")
+        return cursor.fetchone() is not None
+
+
+def create_search_index(apps, schema_editor):
+    # Without FTS5 search stays off (api.search.is_available) rather than failing here
+    if not has_fts5(schema_editor.connection):
+        return
+    schema_editor.execute(CREATE_TABLE)
+    fill_search_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(DROP_TABLE)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0019_calculatorlatestscore"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
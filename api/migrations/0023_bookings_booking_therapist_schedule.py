@@ -0,0 +1,16 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0022_revokedtoken"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="bookings",
+            index=models.Index(fields=["therapist", "date", "time"], name="booking_therapist_schedule"),
+        ),
+    ]
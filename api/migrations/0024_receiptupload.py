@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:20
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0023_bookings_booking_therapist_schedule"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReceiptUpload",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ("filename", models.CharField(max_length=255)),
+                ("size", models.PositiveBigIntegerField()),
+                ("sha256", models.CharField(blank=True, max_length=64)),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+                ("booking", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="receipt_uploads", to="api.bookings")),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="receipt_uploads", to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
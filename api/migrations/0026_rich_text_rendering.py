@@ -0,0 +1,240 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:40
+
+import html
+import math
+import re
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+from django.db import migrations, models
+
+
+# Frozen copies of api.richtext as of this migration, so later changes there
+# don't change what it does on a fresh database.
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "figcaption", "figure",
+    "footer", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "ol", "p", "pre", "section",
+    "table", "td", "th", "tr", "ul",
+}
+SKIPPED_TAGS = {"script", "style", "template"}
+WHITESPACE = re.compile(r"\s+")
+EXCERPT_LENGTH = 280
+WORDS_PER_MINUTE = 200
+# What CKEditor's toolbar produces; everything else is dropped, keeping the text
+ALLOWED_TAGS = {
+    "a", "b", "blockquote", "br", "caption", "code", "div", "em", "figcaption", "figure", "h1", "h2", "h3",
+    "h4", "h5", "h6", "hr", "i", "img", "li", "ol", "p", "pre", "s", "span", "strike", "strong", "sub",
+    "sup", "table", "tbody", "td", "tfoot", "th", "thead", "tr", "u", "ul",
+}
+ALLOWED_ATTRIBUTES = {
+    "a": {"href", "title", "target"},
+    "img": {"src", "alt", "title", "width", "height"},
+    "ol": {"start"},
+    "td": {"colspan", "rowspan"},
+    "th": {"colspan", "rowspan"},
+}
+VOID_TAGS = {"br", "hr", "img"}
+# Open tags that a start tag closes, as browsers do with <li>one<li>two
+IMPLIED_END_TAGS = {"li": {"li"}, "p": {"p"}, "tr": {"tr", "td", "th"}, "td": {"td", "th"}, "th": {"td", "th"}}
+DROPPED_TAGS = SKIPPED_TAGS | {"iframe", "object", "embed", "noscript", "svg", "math"}
+URL_SCHEMES = {"http", "https", "mailto", "tel"}
+CONTROL_AND_SPACE = re.compile(r"[\x00-\x20]+")
+
+
+class TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skipping += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in BLOCK_TAGS:
+            self.parts.append(" ")
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.parts.append(data)
+
+
+def strip_html(html):
+    if not html:
+        return ""
+    parser = TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return WHITESPACE.sub(" ", "".join(parser.parts)).strip()
+
+
+def safe_url(value, tag):
+    try:
+        scheme = urlsplit(CONTROL_AND_SPACE.sub("", value)).scheme.lower()
+    except ValueError:  # Malformed, e.g. an unclosed [ of an IPv6 host
+        return False
+    if not scheme or scheme in URL_SCHEMES:
+        return True
+    # Inline images as CKEditor pastes them; SVG could carry script
+    return tag == "img" and re.match(r"data:image/(png|jpe?g|gif|webp);", value.strip(), re.I) is not None
+
+
+class Sanitizer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self.open_tags = []
+        self.dropping = 0
+        self.strip_next = True  # Leading whitespace of the next text is insignificant
+
+    def _boundary(self):
+        # Whitespace next to a block boundary doesn't render
+        if self.out and self.out[-1].endswith(" ") and "pre" not in self.open_tags:
+            self.out[-1] = self.out[-1].rstrip(" ")
+        self.strip_next = True
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROPPED_TAGS:
+            self.dropping += tag not in VOID_TAGS
+            return
+        if self.dropping or tag not in ALLOWED_TAGS:
+            return
+        allowed = ALLOWED_ATTRIBUTES.get(tag, ())
+        kept = []
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name in ("href", "src") and not safe_url(value, tag):
+                continue
+            if name == "target":
+                if value != "_blank":
+                    continue
+                kept.append(("rel", "noopener noreferrer"))
+            kept.append((name, value.strip()))
+        while self.open_tags and self.open_tags[-1] in IMPLIED_END_TAGS.get(tag, ()):
+            self.handle_endtag(self.open_tags[-1])
+        if tag in BLOCK_TAGS:
+            self._boundary()
+        self.out.append("<%s%s>" % (tag, "".join(f' {name}="{html.escape(value)}"' for name, value in kept)))
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self.open_tags and self.open_tags[-1] == tag and not self.dropping:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROPPED_TAGS:
+            self.dropping = max(0, self.dropping - 1)
+            return
+        if self.dropping or tag not in self.open_tags:
+            return
+        while self.open_tags:  # Closes whatever was left open inside it
+            if self.open_tags[-1] in BLOCK_TAGS:
+                self._boundary()
+            closing = self.open_tags.pop()
+            self.out.append(f"</{closing}>")
+            if closing == tag:
+                break
+        if tag in BLOCK_TAGS:
+            self.strip_next = True
+
+    def handle_data(self, data):
+        if self.dropping:
+            return
+        if "pre" not in self.open_tags:
+            data = WHITESPACE.sub(" ", data)
+            if self.strip_next or (self.out and self.out[-1].endswith(" ")):
+                data = data.lstrip(" ")
+        if data:
+            self.strip_next = False
+            self.out.append(html.escape(data, quote=False))
+
+    def close(self):
+        super().close()
+        while self.open_tags:
+            self.out.append(f"</{self.open_tags.pop()}>")
+        self._boundary()
+        return "".join(self.out)
+
+
+def sanitize_html(value):
+    if not value:
+        return ""
+    parser = Sanitizer()
+    parser.feed(value)
+    return parser.close()
+
+
+def excerpt(text, length=EXCERPT_LENGTH):
+    if len(text) <= length:
+        return text
+    cut = text[:length + 1].rsplit(" ", 1)[0] if " " in text[:length + 1] else text[:length]
+    return cut[:length].rstrip(" ,.;:-") + "…"
+
+
+def reading_minutes(text):
+    return math.ceil(len(text.split()) / WORDS_PER_MINUTE)
+
+
+def render_rich_text(apps, schema_editor, batch_size=500):
+    """Fill the new columns, so responses don't go blank until backfill_rich_text runs"""
+    for model_name, field in (("Blogs", "content"), ("User", "therapist_description")):
+        model = apps.get_model("api", model_name)
+        columns = [f"{field}_html", f"{field}_excerpt", f"{field}_reading_minutes"]
+        pks = list(model._base_manager.order_by("pk").values_list("pk", flat=True))
+        for start in range(0, len(pks), batch_size):
+            batch = list(model._base_manager.filter(pk__in=pks[start:start + batch_size]).only("pk", field))
+            for instance in batch:
+                value = getattr(instance, field)
+                text = strip_html(value)
+                setattr(instance, columns[0], sanitize_html(value))
+                setattr(instance, columns[1], excerpt(text))
+                setattr(instance, columns[2], reading_minutes(text))
+            model._base_manager.bulk_update(batch, columns)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0025_storedfile"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="blogs",
+            name="content_excerpt",
+            field=models.CharField(blank=True, editable=False, max_length=300),
+        ),
+        migrations.AddField(
+            model_name="blogs",
+            name="content_html",
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name="blogs",
+            name="content_reading_minutes",
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="therapist_description_excerpt",
+            field=models.CharField(blank=True, editable=False, max_length=300),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="therapist_description_html",
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="therapist_description_reading_minutes",
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(render_rich_text, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,6 @@
+import uuid
+
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from ckeditor.fields import RichTextField
@@ -13,25 +16,65 @@ class User(AbstractUser):
     therapist_expertise = models.CharField(max_length=300, null=True, blank=True)
     therapist_experience = models.IntegerField(null=True, blank=True)
     therapist_description = RichTextField()
+    # Rendered from therapist_description on save by api/richtext.py
+    therapist_description_html = models.TextField(blank=True, editable=False)
+    therapist_description_excerpt = models.CharField(max_length=300, blank=True, editable=False)
+    therapist_description_reading_minutes = models.PositiveSmallIntegerField(default=0, editable=False)
     therapist_img = models.ImageField(upload_to="therapists/", null=True, blank=True)
     therapist_popUp = models.ImageField(upload_to="therapists/", null=True, blank=True)
+    # Resized copies of the images above, filled in by api/images.py
+    therapist_img_variants = models.JSONField(default=dict, blank=True, editable=False)
+    therapist_popUp_variants = models.JSONField(default=dict, blank=True, editable=False)
     therapist_fee = models.IntegerField(null=True, blank=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Therapist listings filter on role and page through it by id
+            models.Index(fields=["role", "id"], name="user_role_idx"),
+        ]
+
+class ClaimsUser(User):
+    """
+    User rebuilt from access token claims by api.authentication.ClaimsJWTAuthentication.
+    Only the identity fields are set; the first access to any other field loads all of
+    the remaining columns in one query instead of one query per field.
+    """
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred.issuperset(fields):
+            fields = list(deferred)
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+
 class BlogsCategories(models.Model):
     name = models.CharField(max_length=100)
     description = models.CharField(max_length=1000, null=True, blank=True)
     img = models.ImageField(upload_to="categories/", null=True, blank=True)
+    img_variants = models.JSONField(default=dict, blank=True, editable=False)
 
 class Blogs(models.Model):
     category = models.ForeignKey(BlogsCategories, on_delete=models.CASCADE, null=True, blank=True)
     title = models.CharField(max_length=200)
     content = RichTextField()
+    # Rendered from content on save by api/richtext.py
+    content_html = models.TextField(blank=True, editable=False)
+    content_excerpt = models.CharField(max_length=300, blank=True, editable=False)
+    content_reading_minutes = models.PositiveSmallIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [
+            # Serves BlogsByCategoryView's keyset pages as a single range scan
+            models.Index(fields=["category", "created_at", "id"], name="blogs_category_created_idx"),
+        ]
     
 class BlogImages(models.Model):
     blog = models.ForeignKey(Blogs, on_delete=models.CASCADE)
     image = models.ImageField(upload_to="blogs/")
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     
 class News(models.Model):
     title = models.CharField(max_length=200)
@@ -58,6 +101,54 @@ class Bookings(models.Model):
     payment_method = models.CharField(max_length=10, choices=PAYMENT_CHOICE, default='physical')
     paid = models.BooleanField(default=False)
     receipt = models.ImageField(upload_to="receipts/", null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # A therapist slot can only be held by one active booking; enforced by the
+            # database so two concurrent requests can't both claim it
+            models.UniqueConstraint(
+                fields=["therapist", "date", "time"],
+                condition=~models.Q(status="cancelled"),
+                name="unique_active_booking_slot",
+            ),
+        ]
+        indexes = [
+            # A therapist's schedule by date range; the constraint above is partial, so can't serve it
+            models.Index(fields=["therapist", "date", "time"], name="booking_therapist_schedule"),
+        ]
+
+
+class TherapistAvailability(models.Model):
+    """
+    Working hours of a therapist. Rows with a weekday repeat every week; rows with a
+    date are exceptions for that day only: extra hours when available, otherwise a
+    blocked window, or the whole day off when no times are given.
+    """
+    WEEKDAY_CHOICE = (
+        (0, "Monday"),
+        (1, "Tuesday"),
+        (2, "Wednesday"),
+        (3, "Thursday"),
+        (4, "Friday"),
+        (5, "Saturday"),
+        (6, "Sunday"),
+    )
+    therapist = models.ForeignKey(User, on_delete=models.CASCADE, related_name='availability')
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICE, null=True, blank=True)
+    date = models.DateField(null=True, blank=True)
+    start_time = models.TimeField(null=True, blank=True)
+    end_time = models.TimeField(null=True, blank=True)
+    is_available = models.BooleanField(default=True)
+
+    def clean(self):
+        if (self.weekday is None) == (self.date is None):
+            raise ValidationError("Set either a weekday for weekly hours or a date for an exception.")
+        if (self.start_time is None) != (self.end_time is None):
+            raise ValidationError("Set both start and end time, or neither for a whole day.")
+        if self.start_time is None and (self.is_available or self.date is None):
+            raise ValidationError("Only a date exception marking the day unavailable can leave out the times.")
+        if self.start_time is not None and self.start_time >= self.end_time:
+            raise ValidationError("End time must be after start time.")
     
 
 class Calculators(models.Model):
@@ -70,6 +161,7 @@ class Calculators(models.Model):
     calculation_para = models.TextField()
     result_line = models.CharField(max_length=100)
     img = models.ImageField(upload_to="calculators/", null=True, blank=True)
+    img_variants = models.JSONField(default=dict, blank=True, editable=False)
     
 class CalculatorQuestions(models.Model):
     calculator = models.ForeignKey(Calculators, on_delete=models.CASCADE, related_name="calculator_questions")
@@ -79,6 +171,14 @@ class CalculatorQuestions(models.Model):
     option3 = models.CharField(max_length=200, null=True, blank=True)
     option4 = models.CharField(max_length=200, null=True, blank=True)
 
+    def clean(self):
+        # Answers are option slot indexes (see api.scoring), so a gap would shift every later option
+        filled = [bool(getattr(self, f"option{number}")) for number in range(1, 5)]
+        if not any(filled):
+            raise ValidationError("Add at least one option.")
+        if filled != sorted(filled, reverse=True):  # Filled ones first
+            raise ValidationError("Fill the options in order, without leaving one empty in between.")
+
 class CalculatorResults(models.Model):
     calculator = models.ForeignKey(Calculators, on_delete=models.CASCADE, related_name="calculator_results")
     min = models.IntegerField()
@@ -90,5 +190,38 @@ class CalculatorScores(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     score = models.IntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    
-    
+
+
+class CalculatorLatestScore(models.Model):
+    """Latest CalculatorScores row of each user and calculator, maintained by api.scoring.record_score"""
+    calculator = models.ForeignKey(Calculators, on_delete=models.CASCADE, related_name="latest_user_scores")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="latest_calculator_scores")
+    score = models.IntegerField(null=True, blank=True)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            # Also the index UserLatestScoresView reads through
+            models.UniqueConstraint(fields=["user", "calculator"], name="unique_latest_score"),
+        ]
+
+class RevokedToken(models.Model):
+    """JTI of a refresh token that may not be used again, kept only until the token expires (see api.revocation)"""
+    jti = models.CharField(max_length=64, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+class ReceiptUpload(models.Model):
+    """A receipt being uploaded in chunks; the bytes so far live in a file named after the id (see api.uploads)"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    booking = models.ForeignKey(Bookings, on_delete=models.CASCADE, related_name="receipt_uploads")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="receipt_uploads")
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True)  # Checked on completion when the client gives it
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+class StoredFile(models.Model):
+    """A content-addressed media file and the number of references to it (see api.storage)"""
+    name = models.CharField(max_length=255, primary_key=True)
+    size = models.PositiveBigIntegerField()
+    references = models.PositiveIntegerField(default=1)
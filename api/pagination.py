@@ -0,0 +1,169 @@
+"""
+Keyset (cursor) pagination, and async page fetching for the views in api.async_views.
+
+Unlike ``PageNumberPagination`` this never runs a COUNT(*) and never OFFSETs:
+each page is a range scan that starts right after the last row of the
+previous page, so every page costs the same no matter how deep it is. The
+ordering must be total, which is why it always ends in the primary key.
+"""
+import base64
+import datetime
+import decimal
+import json
+
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    page_size = 12
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    # (key field, "id"), both sorted in the same direction. The key field must
+    # not be NULL for any row, otherwise rows would fall out of the keyset.
+    ordering = ("-created_at", "-id")
+
+    def get_ordering(self, request, queryset, view):
+        # Views with user-selectable sorting expose the ordering they resolved
+        return getattr(view, "keyset_ordering", None) or self.ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset, position, reverse = self._page_queryset(queryset, request, view)
+        return self._set_page(list(queryset), position, reverse)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset, position, reverse = self._page_queryset(queryset, request, view)
+        # chunk_size lets aiterator() run the queryset's prefetch_related lookups
+        results = [obj async for obj in queryset.aiterator(chunk_size=self.page_size + 1)]
+        return self._set_page(results, position, reverse)
+
+    def _page_queryset(self, queryset, request, view):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        ordering = self.get_ordering(request, queryset, view)
+        self.key_fields = [name.lstrip("-") for name in ordering]
+        descending = ordering[0].startswith("-")
+
+        position, reverse = self.decode_cursor(request, queryset)
+        if reverse:
+            # Walking back towards the first page: scan in the opposite
+            # direction from the cursor and flip the rows afterwards.
+            descending = not descending
+
+        if position is not None:
+            queryset = queryset.filter(self._after(position, descending))
+        prefix = "-" if descending else ""
+        queryset = queryset.order_by(*(prefix + name for name in self.key_fields))
+        return queryset[:self.page_size + 1], position, reverse
+
+    def _set_page(self, results, position, reverse):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.page = results
+        return results
+
+    def _after(self, position, descending):
+        key, tiebreak = self.key_fields
+        key_value, tiebreak_value = position
+        lookup = "lt" if descending else "gt"
+        return Q(**{f"{key}__{lookup}": key_value}) | Q(**{key: key_value, f"{tiebreak}__{lookup}": tiebreak_value})
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, obj, reverse):
+        values = [_dump(getattr(obj, name)) for name in self.key_fields]
+        payload = json.dumps({"p": values, "r": int(reverse)}, separators=(",", ":"))
+        encoded = base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            padded = encoded + "=" * (-len(encoded) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            values = payload["p"]
+            if len(values) != len(self.key_fields):
+                raise ValueError
+            position = [
+                _field(queryset, name).to_python(value)
+                for name, value in zip(self.key_fields, values)
+            ]
+            return position, bool(payload.get("r"))
+        except Exception:
+            raise ValidationError({self.cursor_query_param: self.invalid_cursor_message})
+
+
+def _field(queryset, name):
+    annotation = queryset.query.annotations.get(name)
+    if annotation is not None:
+        return annotation.output_field
+    return queryset.model._meta.get_field(name)
+
+
+def _dump(value):
+    # isoformat() keeps microseconds, which the keyset comparison needs exactly
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+class AsyncPageNumberPagination(PageNumberPagination):
+    """PageNumberPagination that can also fetch its page with the async ORM"""
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = self.django_paginator_class(queryset, self.get_page_size(request))
+        paginator.count = await queryset.acount()  # Paginator would COUNT(*) synchronously
+        page_number = self.get_page_number(request, paginator)
+        try:
+            number = paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        bottom = (number - 1) * paginator.per_page
+        rows = queryset[bottom:bottom + paginator.per_page]
+        results = [obj async for obj in rows.aiterator(chunk_size=paginator.per_page)]
+        self.page = paginator._get_page(results, number, paginator)
+        return results
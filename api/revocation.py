@@ -0,0 +1,76 @@
+"""
+Revocation of rotated refresh tokens.
+
+simplejwt's token_blacklist app keeps an OutstandingToken row for every token
+ever issued plus a BlacklistedToken row per rotation, and nothing removes
+them. Here only the JTIs of refresh tokens that were used up are stored,
+each with the token's own expiry, and ``prune`` (run by the
+prune_revoked_tokens command) drops rows whose token could not be accepted
+anyway. The table therefore holds at most one refresh lifetime of rotations.
+
+Revoking is a primary-key INSERT, which doubles as the reuse check: a
+second refresh with the same token, even a concurrent one on another
+process, violates the key and is refused. Each process also remembers the
+JTIs it has seen revoked, so replays it already knows about are refused
+without touching the database.
+"""
+import threading
+import time
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .models import RevokedToken
+
+
+class RecentlyRevoked:
+    """Thread-safe jti -> expiry (epoch seconds) map that forgets expired entries"""
+
+    def __init__(self, prune_every=1024):
+        self.prune_every = prune_every
+        self._expiries = {}
+        self._lock = threading.Lock()
+        self._adds = 0
+
+    def add(self, jti, exp):
+        with self._lock:
+            self._expiries[jti] = exp
+            self._adds += 1
+            if self._adds % self.prune_every == 0:
+                now = time.time()
+                self._expiries = {jti: exp for jti, exp in self._expiries.items() if exp > now}
+
+    def __contains__(self, jti):
+        with self._lock:
+            exp = self._expiries.get(jti)
+        return exp is not None and exp > time.time()
+
+    def clear(self):
+        with self._lock:
+            self._expiries.clear()
+
+
+recently_revoked = RecentlyRevoked()
+
+
+def revoke(token):
+    """Revoke ``token``, returning False if it had already been revoked"""
+    jti, exp = token[api_settings.JTI_CLAIM], token["exp"]
+    if jti in recently_revoked:
+        return False
+    try:
+        with transaction.atomic():
+            RevokedToken.objects.create(jti=jti, expires_at=datetime_from_epoch(exp))
+        revoked = True
+    except IntegrityError:
+        revoked = False
+    recently_revoked.add(jti, exp)
+    return revoked
+
+
+def prune(now=None):
+    """Delete revocations of tokens that have expired; returns how many were removed"""
+    deleted, _ = RevokedToken.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
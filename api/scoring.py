@@ -0,0 +1,121 @@
+"""
+Server-side scoring of calculator answers.
+
+Each answer is the 0-based index of the chosen option slot (option1 is 0,
+option4 is 3), and a calculator's score is the sum of its answers. An
+answer must name a filled slot. Questions without any option can't be
+answered, so they expect no answer (CalculatorQuestions.clean rejects new
+ones). The score is mapped to a CalculatorResults
+band through a table sorted by ``min``, searched with bisect. Tables are
+compiled once per process and reused until the version of Calculators,
+CalculatorQuestions or CalculatorResults changes (see api.cache), so scoring
+a submission costs one cache lookup and no SQL.
+"""
+import bisect
+import threading
+
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+
+from .cache import get_versions
+from .models import Calculators, CalculatorQuestions, CalculatorResults, CalculatorScores, CalculatorLatestScore
+
+
+OPTION_FIELDS = ("option1", "option2", "option3", "option4")
+TABLE_MODELS = (Calculators, CalculatorQuestions, CalculatorResults)
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+class ScoringTable:
+    def __init__(self, calculator_id, options, bands):
+        if not all(options):
+            raise ValueError("Every question needs at least one option.")
+        self.calculator_id = calculator_id
+        self.options = [frozenset(slots) for slots in options]  # Filled option slots of each question, in order
+        self.bands = sorted(bands, key=lambda band: band[0])  # (min, max or None, result)
+        self.mins = [band[0] for band in self.bands]
+        self.max_score = sum(max(slots) for slots in self.options)
+
+    def score(self, answers):
+        """Sum the chosen option indexes, raising ValueError for an invalid answer sheet"""
+        if len(answers) != len(self.options):
+            raise ValueError(f"Expected {len(self.options)} answers, got {len(answers)}.")
+        for number, (answer, slots) in enumerate(zip(answers, self.options), start=1):
+            if answer not in slots:
+                choices = ", ".join(map(str, sorted(slots)))
+                raise ValueError(f"Answer {number} must be one of {choices}.")
+        return sum(answers)
+
+    def band(self, score):
+        """Result text of the band containing ``score``, or None if it falls in a gap"""
+        index = bisect.bisect_right(self.mins, score) - 1
+        if index < 0:
+            return None
+        _, maximum, result = self.bands[index]
+        if maximum is not None and score > maximum:
+            return None
+        return result
+
+
+def option_slots(question):
+    """Indexes of the filled option fields of ``question``"""
+    return [index for index, field in enumerate(OPTION_FIELDS) if getattr(question, field)]
+
+
+def compile_table(name):
+    calculator = get_object_or_404(
+        Calculators.objects.only("id").prefetch_related("calculator_questions", "calculator_results"), name=name
+    )
+    questions = sorted(calculator.calculator_questions.all(), key=lambda question: question.id)
+    options = [option_slots(question) for question in questions]
+    bands = [(result.min, result.max, result.result) for result in calculator.calculator_results.all()]
+    return ScoringTable(calculator.id, [slots for slots in options if slots], bands)
+
+
+def get_table(name):
+    """Compiled table of the calculator called ``name``; raises Http404 if there is none"""
+    versions = tuple(get_versions(TABLE_MODELS))
+    cached = _tables.get(name)
+    if cached is not None and cached[0] == versions:
+        return cached[1]
+    table = compile_table(name)
+    with _tables_lock:
+        _tables[name] = (versions, table)
+    return table
+
+
+def upsert_latest_scores(entries):
+    """Insert or overwrite CalculatorLatestScore rows in one statement"""
+    CalculatorLatestScore.objects.bulk_create(
+        entries,
+        update_conflicts=True,
+        unique_fields=["user", "calculator"],
+        update_fields=["score", "created_at"],
+    )
+
+
+def record_score(user, calculator_id, score):
+    """Save a score to the history and make it the user's latest for that calculator"""
+    with transaction.atomic():
+        entry = CalculatorScores.objects.create(user=user, calculator_id=calculator_id, score=score)
+        upsert_latest_scores([
+            CalculatorLatestScore(user=user, calculator_id=calculator_id, score=score, created_at=entry.created_at)
+        ])
+    return entry
+
+
+def refresh_latest_score(user_id, calculator_id):
+    """Recompute one user's latest score for a calculator from the history, e.g. after a delete"""
+    latest = (
+        CalculatorScores.objects.filter(user_id=user_id, calculator_id=calculator_id)
+        .order_by("-created_at", "-id")
+        .first()
+    )
+    if latest is None:
+        CalculatorLatestScore.objects.filter(user_id=user_id, calculator_id=calculator_id).delete()
+    else:
+        upsert_latest_scores([CalculatorLatestScore(
+            user_id=user_id, calculator_id=calculator_id, score=latest.score, created_at=latest.created_at
+        )])
@@ -0,0 +1,181 @@
+"""
+Full-text search over blogs, news and therapists backed by an SQLite FTS5 table.
+
+Every indexed object has one row in ``api_search_index`` whose rowid encodes
+the object's kind and primary key, so keeping the index in sync (see
+api.signals) is a primary-key delete plus an insert instead of a scan.
+Queries are ranked with bm25, weighting title matches above body matches.
+Indexed text is plain (entities decoded), so snippets are HTML-escaped
+before the matches are wrapped in <mark>.
+"""
+import functools
+import html
+import re
+import sqlite3
+from contextlib import closing
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import User, Blogs, News
+from .richtext import strip_html
+
+
+TABLE = "api_search_index"
+CREATE_TABLE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+    "kind UNINDEXED, object_id UNINDEXED, title, body, "
+    # Extra prefix indexes keep the "word"* queries of search-as-you-type cheap
+    "prefix = '2 3', tokenize = 'porter unicode61 remove_diacritics 2')"
+)
+DROP_TABLE = f"DROP TABLE IF EXISTS {TABLE}"
+FTS5_COMPILED = "SELECT 1 FROM pragma_compile_options WHERE compile_options = 'ENABLE_FTS5'"
+INSERT = f"INSERT INTO {TABLE} (rowid, kind, object_id, title, body) VALUES (%s, %s, %s, %s, %s)"
+
+# kind -> code folded into the rowid (rowid = pk * KIND_SLOTS + code)
+KIND_CODES = {"blog": 1, "news": 2, "therapist": 3}
+KIND_SLOTS = 4
+TITLE_WEIGHT = 10.0
+BODY_WEIGHT = 1.0
+
+TOKEN = re.compile(r"\w+")
+# Placeholders snippet() puts around matches, swapped for <mark> once the text is escaped
+MARK_START, MARK_END = "\ue000", "\ue001"
+
+
+@functools.cache
+def sqlite_has_fts5():
+    """Whether the SQLite library Django's backend is built on was compiled with FTS5"""
+    with closing(sqlite3.connect(":memory:")) as db:
+        return db.execute(FTS5_COMPILED).fetchone() is not None
+
+
+def is_available():
+    return connection.vendor == "sqlite" and sqlite_has_fts5()
+
+
+def blog_document(blog):
+    return blog.title, strip_html(blog.content)
+
+
+def news_document(news):
+    return news.title, news.content
+
+
+def therapist_document(user):
+    if user.role != "therapist":
+        return None
+    name = f"{user.first_name} {user.last_name}".strip() or user.username
+    return name, user.therapist_expertise or ""
+
+
+DOCUMENTS = {
+    "blog": blog_document,
+    "news": news_document,
+    "therapist": therapist_document,
+}
+MODELS = {"blog": Blogs, "news": News, "therapist": User}
+KINDS = {model: kind for kind, model in MODELS.items()}
+
+
+def rowid(kind, pk):
+    return pk * KIND_SLOTS + KIND_CODES[kind]
+
+
+def index_rows(kind, objects):
+    """(rowid, kind, object_id, title, body) tuples for the objects that belong in the index"""
+    build = DOCUMENTS[kind]
+    for obj in objects:
+        document = build(obj)
+        if document is not None:
+            yield (rowid(kind, obj.pk), kind, obj.pk, *document)
+
+
+def update_object(kind, obj):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [rowid(kind, obj.pk)])
+        cursor.executemany(INSERT, list(index_rows(kind, [obj])))
+
+
+def add_objects(kind, objects):
+    """Index objects known not to be in the index yet, e.g. after a bulk_create"""
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(INSERT, list(index_rows(kind, objects)))
+
+
+def remove_object(kind, pk):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [rowid(kind, pk)])
+
+
+def rebuild(models=MODELS, batch_size=500):
+    """Refill the whole index; ``models`` maps kinds to (possibly historical) model classes"""
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+        total = 0
+        for kind, model in models.items():
+            queryset = model.objects.order_by("pk")
+            if kind == "therapist":
+                queryset = queryset.filter(role="therapist")
+            rows = []
+            for obj in queryset.iterator(chunk_size=batch_size):
+                rows.extend(index_rows(kind, [obj]))
+                if len(rows) >= batch_size:
+                    cursor.executemany(INSERT, rows)
+                    total += len(rows)
+                    rows = []
+            if rows:
+                cursor.executemany(INSERT, rows)
+                total += len(rows)
+        # Merge the b-tree segments written above into one
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+    return total
+
+
+def match_expression(query):
+    """
+    Turn free text into an FTS5 expression: every word must match, as a prefix.
+    Quoting each token keeps FTS5 operators and punctuation in user input inert.
+    """
+    tokens = TOKEN.findall(query)
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def highlight(snippet):
+    """HTML of a snippet() result: the text escaped, the matches in <mark>"""
+    return html.escape(snippet).replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+
+
+def search(query, kind=None, limit=12, offset=0):
+    """Best matches first, as dicts with kind, object_id, title, snippet and rank"""
+    expression = match_expression(query)
+    if not expression:
+        return []
+    sql = (
+        f"SELECT kind, object_id, title, snippet({TABLE}, 3, %s, %s, '…', 16), "
+        f"bm25({TABLE}, 0, 0, %s, %s) AS rank FROM {TABLE} WHERE {TABLE} MATCH %s"
+    )
+    params = [MARK_START, MARK_END, TITLE_WEIGHT, BODY_WEIGHT, expression]
+    if kind is not None:
+        sql += " AND kind = %s"
+        params.append(kind)
+    sql += " ORDER BY rank LIMIT %s OFFSET %s"
+    params += [limit, offset]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [
+            {"type": row[0], "id": row[1], "title": row[2], "snippet": highlight(row[3]), "rank": row[4]}
+            for row in cursor.fetchall()
+        ]
+
+
+def matching_ids(kind, query):
+    """Subquery of the ids of one kind matching ``query``, for ``pk__in=``"""
+    sql = f"SELECT object_id FROM {TABLE} WHERE {TABLE} MATCH %s AND kind = %s"
+    return RawSQL(sql, (match_expression(query), kind))
@@ -1,13 +1,47 @@
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
 from django.contrib.auth import get_user_model
-from .models import BlogsCategories, Blogs, BlogImages, News, Bookings,Calculators, CalculatorQuestions, CalculatorResults, CalculatorScores
-from rest_framework_simplejwt.tokens import RefreshToken
+from django.utils.translation import gettext_lazy as _
+from .models import BlogsCategories, Blogs, BlogImages, News, Bookings, ReceiptUpload, Calculators, CalculatorQuestions, CalculatorResults, CalculatorLatestScore
+from .authentication import add_claims, tokens_for_user
+from . import revocation
+from .availability import is_slot_free
+from .images import FORMATS
+from .metrics import TimedSerializerMixin
+from . import uploads
 
 
 User = get_user_model()
 
+
+class ImageVariantsField(serializers.Field):
+    """Read-only {format: {width: url}} map of an image's derivatives, like a srcset"""
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs.update(source="*", read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        field_file = getattr(instance, self.image_field)
+        variants = getattr(instance, f"{self.image_field}_variants") or {}
+        if not field_file or variants.get("source") != field_file.name:
+            return None  # Not generated yet, clients fall back to the original
+        request = self.context.get("request")
+        absolute = request.build_absolute_uri if request else str
+        return {
+            fmt: {width: absolute(field_file.storage.url(name)) for width, name in variants.get(fmt, {}).items()}
+            for fmt, _, _ in FORMATS
+        }
+
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return add_claims(super().get_token(user), user)
+
     def validate(self, attrs):
         data = super().validate(attrs)  # Get the original token response
 
@@ -22,8 +56,40 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         })
 
         return data
-    
-class UserSignupSerializer(serializers.ModelSerializer):
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Token refresh that re-stamps the user's current claims onto the new tokens and,
+    when rotating, revokes the old refresh token through api.revocation
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        rotating = api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION
+        # Revoke up front, so two requests racing with the same token can't both succeed
+        if rotating and not revocation.revoke(refresh):
+            raise TokenError(_("Token is blacklisted"))
+
+        user = User.objects.filter(**{api_settings.USER_ID_FIELD: refresh.payload.get(api_settings.USER_ID_CLAIM)}).first()
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages["no_active_account"], "no_active_account")
+        add_claims(refresh, user)
+
+        data = {"access": str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+
+            data["refresh"] = str(refresh)
+
+        return data
+
+
+class UserSignupSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=8)
 
     class Meta:
@@ -32,14 +98,15 @@ class UserSignupSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         password = validated_data.pop("password")
-        user = User.objects.create(**validated_data)
-        user.set_password(password)  # Hash password
+        user = User(**validated_data)
+        user.set_password(password)  # Hash password before the single INSERT
         user.save()
+        self.refresh = tokens_for_user(user)  # Minted once for the response body and the view's cookie
         return user
 
     def to_representation(self, instance):
         """Customize response to include tokens"""
-        refresh = RefreshToken.for_user(instance)
+        refresh = getattr(self, "refresh", None) or tokens_for_user(instance)
         return {
             "user": {
                 "id": instance.id,
@@ -54,48 +121,88 @@ class UserSignupSerializer(serializers.ModelSerializer):
         }
 
     
-class TherapistSerializer(serializers.ModelSerializer):
+class TherapistSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    therapist_img_srcset = ImageVariantsField('therapist_img')
+    therapist_popUp_srcset = ImageVariantsField('therapist_popUp')
+    therapist_description = serializers.CharField(source='therapist_description_html', read_only=True)  # Sanitized
+
     class Meta:
         model = User
         fields = [
             'id', 'username', 'email', 'phone', 'role',
             'therapist_expertise', 'therapist_experience',
-            'therapist_description', 'therapist_img',
-            'therapist_popUp', 'therapist_fee', "first_name", "last_name"
+            'therapist_description', 'therapist_img', 'therapist_img_srcset',
+            'therapist_popUp', 'therapist_popUp_srcset', 'therapist_fee', "first_name", "last_name"
+        ]
+
+# The therapists list: the description's excerpt only, the detail endpoint has the rest
+class TherapistSummarySerializer(TherapistSerializer):
+    class Meta(TherapistSerializer.Meta):
+        fields = [
+            'id', 'username', 'email', 'phone', 'role',
+            'therapist_expertise', 'therapist_experience',
+            'therapist_description_excerpt', 'therapist_img', 'therapist_img_srcset',
+            'therapist_popUp', 'therapist_popUp_srcset', 'therapist_fee', "first_name", "last_name"
+        ]
+
+# Compact therapist row for the directory, the description comes from the detail endpoint
+class TherapistListSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    therapist_img_srcset = ImageVariantsField('therapist_img')
+
+    class Meta:
+        model = User
+        fields = [
+            'id', 'username', 'first_name', 'last_name',
+            'therapist_expertise', 'therapist_experience',
+            'therapist_fee', 'therapist_img', 'therapist_img_srcset', 'therapist_description_excerpt',
         ]
 
 
-class BlogCategorySerializer(serializers.ModelSerializer):
+class BlogCategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    img_srcset = ImageVariantsField('img')
+
     class Meta:
         model = BlogsCategories
-        fields = '__all__'
+        exclude = ['img_variants']
 
 class BlogImageSerializer(serializers.ModelSerializer):
+    image_srcset = ImageVariantsField('image')
+
     class Meta:
         model = BlogImages
-        fields = '__all__'
+        exclude = ['image_variants']
 
 
 class BlogsTherapistSerializer(serializers.ModelSerializer):
+    therapist_img_srcset = ImageVariantsField('therapist_img')
+
     class Meta:
         model = User
         fields = [
             'id', 'username', 'email',  'role',
             'therapist_expertise', 'therapist_experience',
-             'therapist_img',
+             'therapist_img', 'therapist_img_srcset',
              'therapist_fee', "first_name", "last_name"
         ]
-class BlogSerializer(serializers.ModelSerializer):
+class BlogSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     category = BlogCategorySerializer(read_only=True)
     images = BlogImageSerializer(source='blogimages_set', many=True, read_only=True)
     owner = BlogsTherapistSerializer(read_only=True)  # Use the nested UserSerializer
+    content = serializers.CharField(source='content_html', read_only=True)  # Sanitized
+    excerpt = serializers.CharField(source='content_excerpt', read_only=True)
+    reading_minutes = serializers.IntegerField(source='content_reading_minutes', read_only=True)
 
 
     class Meta:
         model = Blogs
-        fields = ['id', 'category', 'title', 'content', 'created_at', 'owner', 'images']
+        fields = ['id', 'category', 'title', 'content', 'excerpt', 'reading_minutes', 'created_at', 'owner', 'images']
+
+# Blog pages and the latest blogs: the excerpt instead of the content
+class BlogListSerializer(BlogSerializer):
+    class Meta(BlogSerializer.Meta):
+        fields = ['id', 'category', 'title', 'excerpt', 'reading_minutes', 'created_at', 'owner', 'images']
         
-class NewsSerializer(serializers.ModelSerializer):
+class NewsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = News
         fields = '__all__'
@@ -107,7 +214,7 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = '__all__'
 
-class BookingSerializer(serializers.ModelSerializer):
+class BookingSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     therapist = UserSerializer(read_only=True)  # For GET request
     therapist_id = serializers.PrimaryKeyRelatedField(
         queryset=User.objects.filter(role="therapist"),
@@ -123,12 +230,53 @@ class BookingSerializer(serializers.ModelSerializer):
             'created_at': {'read_only': True},
             'status': {'read_only': True}  # Default is 'pending'
         }
+
+    def validate(self, attrs):
+        therapist, date, time = attrs.get("therapist"), attrs.get("date"), attrs.get("time")
+        if therapist and date and time and not is_slot_free(therapist.id, date, time):
+            raise serializers.ValidationError({"time": "The therapist is not available at this time."})
+        return attrs
         
+class BookingPatientSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'first_name', 'last_name', 'email', 'phone']
+
+# A booking as its therapist sees it
+class TherapistBookingSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    patient = BookingPatientSerializer(source='user', read_only=True)
+
+    class Meta:
+        model = Bookings
+        fields = ['id', 'patient', 'date', 'time', 'status', 'payment_method', 'paid', 'receipt', 'created_at']
+
+# Starts a chunked receipt upload (api/uploads.py)
+class ReceiptUploadSerializer(serializers.ModelSerializer):
+    sha256 = serializers.RegexField(r"^[0-9a-fA-F]{64}$", required=False, allow_blank=True)
+
+    class Meta:
+        model = ReceiptUpload
+        fields = ["id", "filename", "size", "sha256", "created_at"]
+        read_only_fields = ["id", "created_at"]
+
+    def validate_size(self, value):
+        if not 0 < value <= uploads.max_size():
+            raise serializers.ValidationError(f"Receipts are between 1 byte and {uploads.max_size()} bytes.")
+        return value
+
+    def validate_filename(self, value):
+        name = value.replace("\\", "/").rsplit("/", 1)[-1]
+        if not name:
+            raise serializers.ValidationError("Give the file's name, not a directory.")
+        return name
+
 # For listing all calculators
-class CalculatorListSerializer(serializers.ModelSerializer):
+class CalculatorListSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    img_srcset = ImageVariantsField("img")
+
     class Meta:
         model = Calculators
-        fields = ["name", "desc", "img"]  # Only these fields
+        fields = ["name", "desc", "img", "img_srcset"]  # Only these fields
 
 # For detailed calculator view
 class CalculatorQuestionSerializer(serializers.ModelSerializer):
@@ -141,23 +289,44 @@ class CalculatorResultSerializer(serializers.ModelSerializer):
         model = CalculatorResults
         fields = ["min", "max", "result"]
 
-class CalculatorDetailSerializer(serializers.ModelSerializer):
+class CalculatorDetailSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     calculator_questions = CalculatorQuestionSerializer(many=True, read_only=True)
     calculator_results = CalculatorResultSerializer(many=True, read_only=True)
+    img_srcset = ImageVariantsField("img")
 
     class Meta:
         model = Calculators
-        fields = "__all__"  # Include all fields in response
+        exclude = ["img_variants"]  # Include all other fields in response
 
 # For user scores
-class UserLatestScoreSerializer(serializers.ModelSerializer):
+class UserLatestScoreSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     calculator_name = serializers.CharField(source="calculator.name")
 
     class Meta:
-        model = CalculatorScores
+        model = CalculatorLatestScore
         fields = ["calculator_name", "score", "created_at"]
 
-# For saving user scores
-class SaveCalculatorScoreSerializer(serializers.Serializer):
+# For scoring answers on the server
+class SubmitCalculatorAnswersSerializer(serializers.Serializer):
+    answers = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+
+# Deprecated save-score/ body: answers are scored on the server like calculator-submit's
+class SaveCalculatorScoreSerializer(SubmitCalculatorAnswersSerializer):
     calculator_name = serializers.CharField()
-    score = serializers.IntegerField()
\ No newline at end of file
+
+# One chatbot message; without a session_id a new session is started
+class ChatbotMessageSerializer(serializers.Serializer):
+    session_id = serializers.CharField(max_length=64, required=False, allow_blank=True)
+    message = serializers.CharField(max_length=1000)
+
+# Bulk status / payment change; ids keep their order, duplicates dropped
+class BookingBulkUpdateSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=500)
+    status = serializers.ChoiceField(choices=Bookings.CHOICE, required=False)
+    paid = serializers.BooleanField(required=False)
+
+    def validate(self, attrs):
+        if "status" not in attrs and "paid" not in attrs:
+            raise serializers.ValidationError("Give a status, paid, or both.")
+        attrs["ids"] = list(dict.fromkeys(attrs["ids"]))
+        return attrs
@@ -0,0 +1,99 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, post_delete
+
+from .authentication import remember_user, forget_user
+from .cache import bump_version
+from .database import configure_connection
+from .images import IMAGE_FIELDS, schedule_derivatives
+from .metrics import install_query_timer
+from .models import User, ClaimsUser, BlogsCategories, Blogs, BlogImages, News, Bookings, Calculators, CalculatorQuestions, CalculatorResults, CalculatorScores
+from .richtext import RICH_TEXT_FIELDS, render_rich_text
+from .scoring import refresh_latest_score
+from .storage import release_deleted_files, release_replaced_files
+from . import search
+
+
+# Models whose rows end up in cached public responses (see api.cache)
+CACHED_MODELS = (User, BlogsCategories, Blogs, BlogImages, News, Calculators, CalculatorQuestions, CalculatorResults)
+
+
+def bump_version_on_save(sender, instance, created=False, update_fields=None, **kwargs):
+    sender = sender._meta.concrete_model
+    if sender is User:
+        # Logging in only touches last_login, which no public response exposes
+        if update_fields is not None and set(update_fields) == {"last_login"}:
+            return
+        # Public responses show therapists and blog owners, and a new patient is neither
+        if created and instance.role != "therapist":
+            return
+    bump_version(sender)
+
+
+def bump_version_on_delete(sender, instance, **kwargs):
+    sender = sender._meta.concrete_model
+    # A deleted owner's blogs are deleted with them and bump Blogs themselves
+    if sender is User and instance.role != "therapist":
+        return
+    bump_version(sender)
+
+
+# Saving the request.user of api.authentication sends signals for the proxy
+SIGNAL_SENDERS = {User: (User, ClaimsUser)}
+
+
+def senders(model):
+    return SIGNAL_SENDERS.get(model, (model,))
+
+
+for model in CACHED_MODELS:
+    for sender in senders(model):
+        post_save.connect(bump_version_on_save, sender=sender, dispatch_uid=f"bump_version_on_save:{sender._meta.label}")
+        post_delete.connect(bump_version_on_delete, sender=sender, dispatch_uid=f"bump_version_on_delete:{sender._meta.label}")
+
+for model in IMAGE_FIELDS:
+    for sender in senders(model):
+        post_save.connect(schedule_derivatives, sender=sender, dispatch_uid=f"schedule_derivatives:{sender._meta.label}")
+
+# Models with uploaded files, whose stored copies are reference counted (see api.storage)
+for model in (*IMAGE_FIELDS, Bookings):
+    for sender in senders(model):
+        pre_save.connect(release_replaced_files, sender=sender, dispatch_uid=f"release_replaced_files:{sender._meta.label}")
+        post_delete.connect(release_deleted_files, sender=sender, dispatch_uid=f"release_deleted_files:{sender._meta.label}")
+
+for model in RICH_TEXT_FIELDS:
+    for sender in senders(model):
+        pre_save.connect(render_rich_text, sender=sender, dispatch_uid=f"render_rich_text:{sender._meta.label}")
+
+for sender in senders(User):
+    post_save.connect(remember_user, sender=sender, dispatch_uid=f"remember_user:{sender._meta.label}")
+    post_delete.connect(forget_user, sender=sender, dispatch_uid=f"forget_user:{sender._meta.label}")
+
+
+def refresh_latest_score_on_delete(sender, instance, origin=None, **kwargs):
+    # Deleting the user or calculator cascades to the latest score row as well
+    if isinstance(origin, (User, Calculators)):
+        return
+    refresh_latest_score(instance.user_id, instance.calculator_id)
+
+
+post_delete.connect(refresh_latest_score_on_delete, sender=CalculatorScores, dispatch_uid="refresh_latest_score_on_delete")
+
+
+def update_search_index(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields is not None and set(update_fields) == {"last_login"}):
+        return
+    search.update_object(search.KINDS[sender._meta.concrete_model], instance)
+
+
+def remove_from_search_index(sender, instance, **kwargs):
+    search.remove_object(search.KINDS[sender._meta.concrete_model], instance.pk)
+
+
+for model in search.KINDS:
+    for sender in senders(model):
+        post_save.connect(update_search_index, sender=sender, dispatch_uid=f"update_search_index:{sender._meta.label}")
+        post_delete.connect(remove_from_search_index, sender=sender, dispatch_uid=f"remove_from_search_index:{sender._meta.label}")
+
+
+connection_created.connect(configure_connection, dispatch_uid="configure_connection")
+connection_created.connect(install_query_timer, dispatch_uid="install_query_timer")
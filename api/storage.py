@@ -0,0 +1,255 @@
+"""
+Content-addressed storage for uploaded media.
+
+Files saved under one of ``directories`` (the models' upload_to
+directories) are named after the SHA-256 of their bytes:
+``blogs/photo.jpg`` is stored as ``blogs/<sha256>.jpg``. The hash is
+computed while the upload streams into a temporary file next to its
+destination, so nothing is held in memory. Saving bytes that are already
+there drops the copy and returns the existing name. Derivatives saved by
+api.images get the same treatment inside their own directory.
+
+Each stored name has a StoredFile row counting the references to it: a
+save adds one, a delete removes one, and the file only goes away with the
+last reference. Both run in one transaction with the file operation, and
+IMMEDIATE transactions (see api.database) serialize them, so a save can't
+reuse a file that a concurrent delete is about to remove. Files from before
+this storage have no row and are deleted outright, as before; the
+dedupe_media command (``dedupe``) renames them to their hashes and
+counts the references.
+
+Replacing or deleting a row's file only releases it once the transaction
+commits (``release_replaced_files``, ``release_deleted_files``).
+
+Names outside ``directories`` (e.g. CKEditor uploads) are stored as
+FileSystemStorage would.
+"""
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from collections import Counter
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import router, transaction
+from django.db.models import F, FileField
+
+from .cache import bump_version
+from .images import IMAGE_FIELDS
+from .models import StoredFile
+
+
+HASHED_NAME = re.compile(r"^[0-9a-f]{64}$")
+
+
+def content_name(name, digest):
+    """``name`` moved to its hash, keeping the directory and (lowercased) extension"""
+    directory, filename = os.path.split(name)
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join(directory, f"{digest}{extension}").replace("\\", "/")
+
+
+def is_content_name(name):
+    return bool(HASHED_NAME.match(os.path.splitext(os.path.basename(name))[0]))
+
+
+def file_digest(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as handle:
+        while block := handle.read(64 * 1024):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def __init__(self, directories=(), **kwargs):
+        super().__init__(**kwargs)
+        self.directories = tuple(directory.strip("/") for directory in directories)
+
+    def is_addressed(self, name):
+        return name.replace("\\", "/").split("/", 1)[0] in self.directories
+
+    def get_available_name(self, name, max_length=None):
+        if self.is_addressed(name):
+            return name  # _save picks the real name from the content
+        return super().get_available_name(name, max_length=max_length)
+
+    def _save(self, name, content):
+        if not self.is_addressed(name):
+            return super()._save(name, content)
+
+        directory = os.path.dirname(self.path(name))
+        os.makedirs(directory, exist_ok=True)
+        temporary = tempfile.NamedTemporaryFile(dir=directory, prefix=".upload-", delete=False)
+        try:
+            hasher = hashlib.sha256()
+            size = 0
+            with temporary:
+                if hasattr(content, "seek"):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    temporary.write(chunk)
+                    hasher.update(chunk)
+                    size += len(chunk)
+
+            name = content_name(name, hasher.hexdigest())
+            with transaction.atomic(using=router.db_for_write(StoredFile)):
+                if not StoredFile.objects.filter(name=name).update(references=F("references") + 1):
+                    StoredFile.objects.create(name=name, size=size)
+                if not os.path.exists(self.path(name)):
+                    if self.file_permissions_mode is not None:
+                        os.chmod(temporary.name, self.file_permissions_mode)
+                    os.replace(temporary.name, self.path(name))
+        finally:
+            if os.path.exists(temporary.name):
+                os.remove(temporary.name)  # A duplicate, or a failed save
+        return name
+
+    def delete(self, name):
+        if not name or not self.is_addressed(name):
+            return super().delete(name)
+        with transaction.atomic(using=router.db_for_write(StoredFile)):
+            stored = StoredFile.objects.filter(name=name)
+            if stored.filter(references__gt=1).update(references=F("references") - 1):
+                return  # Still referenced elsewhere
+            stored.delete()
+            super().delete(name)
+
+    def references(self, name):
+        return StoredFile.objects.filter(name=name).values_list("references", flat=True).first() or 0
+
+
+def file_fields(model):
+    return [field for field in model._meta.concrete_fields if isinstance(field, FileField)]
+
+
+def release_on_commit(model, files):
+    files = [(storage, name) for storage, name in files if name]
+    if files:
+        transaction.on_commit(
+            lambda: [storage.delete(name) for storage, name in files], using=router.db_for_write(model)
+        )
+
+
+def release_replaced_files(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    pre_save handler releasing the files that newly assigned uploads replace.
+    Only fields holding an uncommitted file are looked up, so most saves cost
+    no query; code that assigns a stored name directly releases the old one itself.
+    """
+    if raw or instance._state.adding:
+        return
+    fields = [
+        field for field in file_fields(sender)
+        if (update_fields is None or field.name in update_fields)
+        and not getattr(getattr(instance, field.attname), "_committed", True)
+    ]
+    if not fields:
+        return
+    old = sender._base_manager.filter(pk=instance.pk).values(*(field.attname for field in fields)).first()
+    if old is not None:
+        release_on_commit(sender, [(field.storage, old[field.attname]) for field in fields])
+
+
+def release_deleted_files(sender, instance, **kwargs):
+    """post_delete handler releasing the files of a deleted row, and their derivatives"""
+    files = []
+    for field in file_fields(sender):
+        files.append((field.storage, getattr(instance, field.attname).name))
+    for image_field, variants_field in IMAGE_FIELDS.get(sender._meta.concrete_model, ()):
+        storage = sender._meta.get_field(image_field).storage
+        for value in (getattr(instance, variants_field) or {}).values():
+            if isinstance(value, dict):  # The per-format width -> name maps
+                files.extend((storage, name) for name in value.values())
+    release_on_commit(sender, files)
+
+
+def _variant_names(variants):
+    for value in (variants or {}).values():
+        if isinstance(value, dict):
+            yield from value.values()
+
+
+def _renamed_variants(variants, moves):
+    renamed = {
+        key: {width: moves.get(name, name) for width, name in value.items()} if isinstance(value, dict) else value
+        for key, value in variants.items()
+    }
+    renamed["source"] = moves.get(variants.get("source"), variants.get("source"))
+    return renamed
+
+
+def dedupe(storage=None, dry_run=False, batch_size=500):
+    """
+    Move every file under the storage's directories to its content name,
+    point the rows at the new names and recount the references. Copies are
+    removed only after the rows are updated. Returns (files, renamed, duplicates, bytes saved).
+    """
+    storage = storage or default_storage
+    sizes, moves = {}, {}
+    for directory in storage.directories:
+        for root, _, filenames in os.walk(storage.path(directory)):
+            for filename in filenames:
+                if filename.startswith(".upload-"):
+                    continue  # A save in progress
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, storage.location).replace(os.sep, "/")
+                sizes[name] = os.path.getsize(path)
+                target = content_name(name, file_digest(path))
+                if target != name:
+                    moves[name] = target
+
+    final = {moves.get(name, name): size for name, size in sizes.items()}  # Equal content, equal size
+    duplicates, saved = len(sizes) - len(final), sum(sizes.values()) - sum(final.values())
+    if dry_run:
+        return len(sizes), len(moves), duplicates, saved
+
+    for name, target in moves.items():
+        if not os.path.exists(storage.path(target)):
+            shutil.copy2(storage.path(name), storage.path(target))
+
+    references = Counter()
+    with transaction.atomic(using=router.db_for_write(StoredFile)):
+        for model in apps.get_models():
+            if model._meta.proxy:
+                continue  # Its rows are counted with the concrete model's (e.g. ClaimsUser's with User's)
+            fields = [field.attname for field in file_fields(model) if field.storage is storage]
+            if not fields:
+                continue
+            variants_fields = [variants for _, variants in IMAGE_FIELDS.get(model, ())]
+            updates = []
+            # Collected first: SQLite doesn't isolate a running iterator from updates to its table
+            for row in model._base_manager.values("pk", *fields, *variants_fields).iterator(chunk_size=batch_size):
+                changes = {field: moves[row[field]] for field in fields if row[field] in moves}
+                for variants_field in variants_fields:
+                    if row[variants_field]:
+                        renamed = _renamed_variants(row[variants_field], moves)
+                        if renamed != row[variants_field]:
+                            changes[variants_field] = renamed
+                        references.update(_variant_names(renamed))
+                references.update(changes.get(field, row[field]) for field in fields)
+                if changes:
+                    updates.append((row["pk"], changes))
+            for pk, changes in updates:
+                model._base_manager.filter(pk=pk).update(**changes)
+            if updates:
+                bump_version(model)
+
+        StoredFile.objects.all().delete()
+        StoredFile.objects.bulk_create(
+            StoredFile(name=name, size=os.path.getsize(storage.path(name)), references=count)
+            for name, count in references.items()
+            if name and storage.is_addressed(name) and is_content_name(name) and os.path.exists(storage.path(name))
+        )
+        transaction.on_commit(lambda: _remove_all(storage, moves), using=router.db_for_write(StoredFile))
+    return len(sizes), len(moves), duplicates, saved
+
+
+def _remove_all(storage, names):
+    for name in names:
+        try:
+            os.remove(storage.path(name))
+        except FileNotFoundError:
+            pass
@@ -1,3 +1,1550 @@
-from django.test import TestCase
+import base64
+import datetime
+import hashlib
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+from urllib.parse import urlsplit
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.signals import request_finished
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, connections, transaction
+from django.core.management import call_command
+from django.http import UnreadablePostError
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from .authentication import ClaimsJWTAuthentication, tokens_for_user, user_cache
+from .availability import subtract
+from .cache import aget_versions, get_versions
+from .models import User, BlogsCategories, Blogs, BlogImages, News, Bookings, ReceiptUpload, TherapistAvailability, Calculators, CalculatorQuestions, CalculatorResults, CalculatorScores, CalculatorLatestScore, RevokedToken, StoredFile
+from .revocation import recently_revoked
+from .richtext import sanitize_html, strip_html
+from .scoring import ScoringTable
+from . import benchmark, chatbot, database, images, metrics, search, storage, uploads
+from .database import ReadReplicaRouter
+
+
+def create_therapist(username="therapist", **kwargs):
+    return User.objects.create(username=username, role="therapist", **kwargs)
+
+
+def create_blogs(category, owner, count, title=None, images=2):
+    blogs = Blogs.objects.bulk_create(
+        Blogs(category=category, owner=owner, title=title or f"Blog {i}", content="<p>Content</p>")
+        for i in range(count)
+    )
+    BlogImages.objects.bulk_create(
+        BlogImages(blog=blog, image=f"blogs/{blog.id}-{i}.jpg")
+        for blog in blogs
+        for i in range(images)
+    )
+    return blogs
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_hit_runs_no_queries(self):
+        News.objects.create(title="Clinic opens", content="On Saturdays")
+        url = reverse("latest_news")
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second.json(), first.json())
+
+    def test_saves_and_deletes_invalidate(self):
+        url = reverse("latest_news")
+        self.assertEqual(self.client.get(url).json(), [])
+        news = News.objects.create(title="Clinic opens", content="On Saturdays")
+        self.assertEqual([item["title"] for item in self.client.get(url).json()], ["Clinic opens"])
+        news.delete()
+        self.assertEqual(self.client.get(url).json(), [])
+
+    def test_version_moves_again_on_commit(self):
+        # A request between the save and the commit may cache the old rows under the bumped version
+        with self.captureOnCommitCallbacks() as callbacks:
+            News.objects.create(title="Clinic opens", content="On Saturdays")
+            bumped = get_versions([News])
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_versions([News]), bumped)
+
+    def test_last_login_saves_keep_the_cache(self):
+        user = User.objects.create(username="patient")
+        versions = get_versions([User])
+        user.save(update_fields=["last_login"])
+        self.assertEqual(get_versions([User]), versions)
+
+    def test_only_therapist_signups_invalidate(self):
+        versions = get_versions([User])
+        patient = User.objects.create(username="patient")
+        self.assertEqual(get_versions([User]), versions)
+        patient.delete()
+        self.assertEqual(get_versions([User]), versions)
+        User.objects.create(username="therapist", role="therapist")
+        self.assertNotEqual(get_versions([User]), versions)
+
+
+class BlogQueryBudgetTests(TestCase):
+    """Every blog endpoint must cost a constant number of queries, whatever the page size"""
+
+    ROW_COUNTS = (1, 12, 100)
+
+    def setUp(self):
+        cache.clear()
+
+    def seed(self, count, title=None):
+        category = BlogsCategories.objects.create(name=f"Anxiety {count}")
+        owner = create_therapist(username=f"owner-{count}")
+        create_blogs(category, owner, count, title=title)
+        return category
+
+    def test_blogs_by_category_page_number(self):
+        for count in self.ROW_COUNTS:
+            with self.subTest(rows=count):
+                category = self.seed(count)
+                url = reverse("blogs_by_category", args=[category.name])
+                # Category, COUNT(*), blogs with category and owner joined, images
+                with self.assertNumQueries(4):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data["results"]), min(count, 12))
+                self.assertEqual(len(response.data["results"][0]["images"]), 2)
+
+    def test_blogs_by_category_cursor(self):
+        for count in self.ROW_COUNTS:
+            with self.subTest(rows=count):
+                category = self.seed(count)
+                url = reverse("blogs_by_category", args=[category.name]) + "?pagination=cursor"
+                # Category, blogs with category and owner joined, images
+                with self.assertNumQueries(3):
+                    response = self.client.get(url)
+                self.assertEqual(len(response.data["results"]), min(count, 12))
+                if response.data["next"]:
+                    with self.assertNumQueries(3):
+                        self.client.get(response.data["next"])
+
+    def test_blog_detail(self):
+        for count in self.ROW_COUNTS:
+            with self.subTest(rows=count):
+                category = self.seed(count, title="Same title")
+                url = reverse("blog", args=[category.name, "Same title"])
+                with self.assertNumQueries(2):
+                    response = self.client.get(url)
+                self.assertEqual(len(response.data), count)
+                self.assertEqual(response.data[0]["owner"]["username"], f"owner-{count}")
+                self.assertEqual(response.data[0]["category"]["name"], category.name)
+
+    def test_latest_blogs(self):
+        for count in self.ROW_COUNTS:
+            with self.subTest(rows=count):
+                cache.clear()
+                self.seed(count)
+                with self.assertNumQueries(2):
+                    response = self.client.get(reverse("latest_blogs"))
+                self.assertEqual(len(response.data), 4 if count > 1 else 1)
+                # Served from the response cache afterwards
+                with self.assertNumQueries(0):
+                    self.client.get(reverse("latest_blogs"))
+
+
+class BlogCursorPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = BlogsCategories.objects.create(name="Anxiety")
+        blogs = create_blogs(self.category, create_therapist(), 30, images=0)
+        # Every row ties on created_at, so only the id orders them
+        Blogs.objects.update(created_at=timezone.now())
+        self.ids = sorted((blog.id for blog in blogs), reverse=True)
+        self.url = reverse("blogs_by_category", args=[self.category.name]) + "?pagination=cursor"
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_ties_are_paged_once_in_order(self):
+        seen, url = [], self.url
+        while url:
+            page = self.get(url)
+            seen += [blog["id"] for blog in page["results"]]
+            url = page["next"]
+        self.assertEqual(seen, self.ids)
+
+    def test_links(self):
+        first = self.get(self.url)
+        self.assertIsNone(first["previous"])
+        second = self.get(first["next"])
+        self.assertIsNotNone(second["previous"])
+        last = self.get(second["next"])
+        self.assertEqual([blog["id"] for blog in last["results"]], self.ids[24:])
+        self.assertIsNone(last["next"])
+        self.assertIsNotNone(last["previous"])
+
+    def test_walking_backwards(self):
+        pages = [self.get(self.url)]
+        while pages[-1]["next"]:
+            pages.append(self.get(pages[-1]["next"]))
+        page = pages[-1]
+        for expected in reversed(pages[:-1]):
+            page = self.get(page["previous"])
+            self.assertEqual(page["results"], expected["results"])
+            self.assertIsNotNone(page["next"])
+        self.assertIsNone(page["previous"])
+
+    def test_invalid_cursors(self):
+        def encode(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+        for cursor in ("garbage", encode({"p": [1], "r": 0}), encode({"p": ["not a date", 1], "r": 0}), encode([1, 2])):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(self.url + "&cursor=" + cursor)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("cursor", response.data)
+
+
+class TherapistDirectoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cheap = create_therapist("cheap", first_name="Amna", therapist_fee=1000, therapist_experience=2,
+                                      therapist_expertise="Anxiety, Stress", therapist_description="<p>Long bio</p>")
+        self.mid = create_therapist("mid", first_name="Bushra", therapist_fee=3000, therapist_experience=8,
+                                    therapist_expertise="Depression")
+        self.pricey = create_therapist("pricey", first_name="Hiba", therapist_fee=5000, therapist_experience=12,
+                                       therapist_expertise="Anxiety")
+        User.objects.create(username="patient", first_name="Aaron")
+
+    def ids(self, query=""):
+        response = self.client.get(reverse("therapist_directory") + query)
+        self.assertEqual(response.status_code, 200)
+        return [row["id"] for row in response.data["results"]]
+
+    def test_lists_only_therapists_without_description(self):
+        response = self.client.get(reverse("therapist_directory"))
+        self.assertEqual([row["username"] for row in response.data["results"]], ["cheap", "mid", "pricey"])
+        self.assertNotIn("therapist_description", response.data["results"][0])
+        self.assertNotIn("count", response.data)
+
+    def test_filters(self):
+        self.assertEqual(self.ids("?expertise=anxiety"), [self.cheap.id, self.pricey.id])
+        self.assertEqual(self.ids("?fee_min=2000&fee_max=5000"), [self.mid.id, self.pricey.id])
+        self.assertEqual(self.ids("?experience_min=5&experience_max=10"), [self.mid.id])
+        response = self.client.get(reverse("therapist_directory") + "?fee_min=cheap")
+        self.assertEqual(response.status_code, 400)
+
+    def test_sorting(self):
+        self.assertEqual(self.ids("?sort=-fee"), [self.pricey.id, self.mid.id, self.cheap.id])
+        self.assertEqual(self.ids("?sort=experience"), [self.cheap.id, self.mid.id, self.pricey.id])
+        response = self.client.get(reverse("therapist_directory") + "?sort=password")
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_walks_every_therapist_once(self):
+        for i in range(25):
+            create_therapist(f"extra-{i}", first_name="Sana", therapist_fee=2000)
+        seen = []
+        url = reverse("therapist_directory") + "?sort=-fee"
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            seen += [row["id"] for row in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(len(seen), 28)
+        self.assertEqual(len(set(seen)), 28)
+
+    def test_detail_includes_description(self):
+        response = self.client.get(reverse("therapist_detail", args=[self.cheap.id]))
+        self.assertEqual(response.data["therapist_description"], "<p>Long bio</p>")
+        patient = User.objects.get(username="patient")
+        response = self.client.get(reverse("therapist_detail", args=[patient.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        self.therapist = create_therapist()
+        self.patient = User.objects.create(username="patient")
+        self.monday = datetime.date(2030, 1, 7)
+        # Mondays 09:00-13:00 and 14:00-17:00
+        TherapistAvailability.objects.create(therapist=self.therapist, weekday=0, start_time=datetime.time(9), end_time=datetime.time(13))
+        TherapistAvailability.objects.create(therapist=self.therapist, weekday=0, start_time=datetime.time(14), end_time=datetime.time(17))
+
+    def slots(self, start, end):
+        url = reverse("therapist_slots", args=[self.therapist.id])
+        response = self.client.get(url, {"start": start.isoformat(), "end": end.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        return {day["date"]: day["slots"] for day in response.data["days"]}
+
+    def test_subtract(self):
+        self.assertEqual(subtract([(540, 1020)], [(600, 660), (650, 700), (1000, 1100)]), [(540, 600), (700, 1000)])
+        self.assertEqual(subtract([(0, 60), (120, 180)], [(30, 150)]), [(0, 30), (150, 180)])
+
+    def test_weekly_hours_minus_bookings_and_exceptions(self):
+        Bookings.objects.create(user=self.patient, therapist=self.therapist, date=self.monday, time=datetime.time(10))
+        Bookings.objects.create(user=self.patient, therapist=self.therapist, date=self.monday, time=datetime.time(11), status="cancelled")
+        next_monday = self.monday + datetime.timedelta(days=7)
+        TherapistAvailability.objects.create(therapist=self.therapist, date=next_monday, is_available=False)
+        tuesday = self.monday + datetime.timedelta(days=1)
+        TherapistAvailability.objects.create(therapist=self.therapist, date=tuesday, start_time=datetime.time(18), end_time=datetime.time(20))
+
+        slots = self.slots(self.monday, next_monday)
+        self.assertEqual(slots[self.monday], ["09:00", "11:00", "12:00", "14:00", "15:00", "16:00"])
+        self.assertEqual(slots[tuesday], ["18:00", "19:00"])
+        self.assertEqual(slots[next_monday], [])
+        self.assertEqual(len(slots), 8)
+
+    def test_month_of_slots_runs_constant_queries(self):
+        url = reverse("therapist_slots", args=[self.therapist.id])
+        # Therapist, availability rows, bookings
+        with self.assertNumQueries(3):
+            self.client.get(url, {"start": "2030-01-01", "end": "2030-01-31"})
+
+    def test_booking_conflicts_are_rejected(self):
+        self.client.force_login(self.patient)
+        data = {"therapist_id": self.therapist.id, "date": self.monday.isoformat(), "time": "09:00"}
+        self.assertEqual(self.client.post(reverse("user_bookings"), data).status_code, 201)
+        self.assertEqual(self.client.post(reverse("user_bookings"), data).status_code, 400)
+        outside = dict(data, time="13:00")
+        self.assertEqual(self.client.post(reverse("user_bookings"), outside).status_code, 400)
+
+    def test_database_rejects_double_booking(self):
+        Bookings.objects.create(user=self.patient, therapist=self.therapist, date=self.monday, time=datetime.time(9))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Bookings.objects.create(user=self.patient, therapist=self.therapist, date=self.monday, time=datetime.time(9))
+        # A cancelled booking frees the slot again
+        Bookings.objects.filter(therapist=self.therapist).update(status="cancelled")
+        Bookings.objects.create(user=self.patient, therapist=self.therapist, date=self.monday, time=datetime.time(9))
+
+    def test_constraint_migration_ignores_undated_bookings(self):
+        migration = importlib.import_module("api.migrations.0017_therapistavailability_unique_active_booking_slot")
+        undated = [Bookings.objects.create(user=self.patient, therapist=self.therapist) for _ in range(2)]
+        migration.check_duplicate_bookings(apps, None)  # Doesn't raise
+        self.assertEqual({booking.status for booking in Bookings.objects.filter(id__in=[b.id for b in undated])}, {"pending"})
+
+
+def image_upload(name="photo.png", size=(700, 350)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, "teal").save(buffer, "PNG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+
+class ImageDerivativeTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, IMAGE_DERIVATIVE_WORKERS=0)
+        self.settings_override.enable()
+        cache.clear()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_derivatives_are_built_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            category = BlogsCategories.objects.create(name="Sleep", img=image_upload())
+        category.refresh_from_db()
+        self.assertEqual(category.img_variants["source"], category.img.name)
+        self.assertEqual(sorted(category.img_variants["webp"], key=int), ["160", "320", "640", "700"])
+        for name in category.img_variants["jpeg"].values():
+            with category.img.storage.open(name) as derivative:
+                self.assertLessEqual(Image.open(derivative).width, 700)
+
+        srcset = self.client.get(reverse("categories")).data[0]["img_srcset"]
+        self.assertTrue(srcset["webp"]["160"].startswith("http://testserver/media/categories/derivatives/"))
+        self.assertNotIn("img_variants", self.client.get(reverse("categories")).data[0])
+
+    def test_unrelated_saves_do_not_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            category = BlogsCategories.objects.create(name="Sleep", img=image_upload())
+        category.refresh_from_db()
+        with mock.patch("api.images._submit") as submit, self.captureOnCommitCallbacks(execute=True):
+            category.description = "Rest better"
+            category.save()
+        submit.assert_not_called()
+
+    def test_small_images_are_not_upscaled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            category = BlogsCategories.objects.create(name="Tiny", img=image_upload(size=(120, 80)))
+        category.refresh_from_db()
+        self.assertEqual(list(category.img_variants["jpeg"]), ["120"])
+
+    def test_admin_previews_use_a_derivative(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            category = BlogsCategories.objects.create(name="Sleep", img=image_upload())
+        category.refresh_from_db()
+        admin_user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(admin_user)
+        response = self.client.get(reverse("admin:api_blogscategories_changelist"))
+        self.assertContains(response, category.img.storage.url(category.img_variants["jpeg"]["160"]))
+        self.assertNotContains(response, f'src="{category.img.url}"')
+
+    def test_sources_differing_in_extension_keep_their_own_derivatives(self):
+        self.assertNotEqual(
+            images.derivative_name("blogs/photo.jpg", 160, "webp"), images.derivative_name("blogs/photo.png", 160, "webp")
+        )
+        self.assertEqual(images.derivative_name("blogs/photo.jpg", 160, "webp"), "blogs/derivatives/photo-jpg-160w.webp")
+
+
+def create_calculator(name="Depression", questions=3):
+    calculator = Calculators.objects.create(
+        name=name, desc="", sub_desc="", caution="", scoring_name="", leveling_name="", calculation_para="", result_line=""
+    )
+    for i in range(questions):
+        CalculatorQuestions.objects.create(calculator=calculator, question=f"Q{i}", option1="Never", option2="Sometimes",
+                                           option3="Often", option4="Always")
+    CalculatorResults.objects.create(calculator=calculator, min=0, max=3, result="Minimal")
+    CalculatorResults.objects.create(calculator=calculator, min=4, max=6, result="Moderate")
+    CalculatorResults.objects.create(calculator=calculator, min=7, max=None, result="Severe")
+    return calculator
+
+
+class CalculatorScoringTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calculator = create_calculator()
+        self.user = User.objects.create(username="patient")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse("calculator-submit", args=[self.calculator.name])
+
+    def test_band_lookup(self):
+        table = ScoringTable(1, [range(4), range(4)], [(10, None, "High"), (0, 2, "Low"), (5, 9, "Mid")])
+        self.assertEqual([table.band(score) for score in (0, 2, 3, 5, 9, 10, 99, -1)],
+                         ["Low", "Low", None, "Mid", "Mid", "High", "High", None])
+
+    def test_submission_is_scored_and_saved(self):
+        response = self.client.post(self.url, {"answers": [1, 2, 3]}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["score"], 6)
+        self.assertEqual(response.data["result"], "Moderate")
+        self.assertEqual(response.data["max_score"], 9)
+        self.assertEqual(CalculatorScores.objects.get().score, 6)
+
+    def test_compiled_table_is_reused_until_results_change(self):
+        self.client.post(self.url, {"answers": [0, 0, 0]}, format="json")
+        # Savepoint, score insert, latest score upsert, release
+        with self.assertNumQueries(4):
+            response = self.client.post(self.url, {"answers": [3, 3, 3]}, format="json")
+        self.assertEqual(response.data["result"], "Severe")
+
+        CalculatorResults.objects.filter(result="Severe").delete()
+        CalculatorResults.objects.create(calculator=self.calculator, min=7, max=9, result="Very severe")
+        response = self.client.post(self.url, {"answers": [3, 3, 3]}, format="json")
+        self.assertEqual(response.data["result"], "Very severe")
+
+    def test_invalid_answers(self):
+        self.assertEqual(self.client.post(self.url, {"answers": [1, 1]}, format="json").status_code, 400)
+        self.assertEqual(self.client.post(self.url, {"answers": [1, 1, 4]}, format="json").status_code, 400)
+        missing = reverse("calculator-submit", args=["Unknown"])
+        self.assertEqual(self.client.post(missing, {"answers": [1]}, format="json").status_code, 404)
+
+    def test_answers_name_filled_option_slots(self):
+        question = self.calculator.calculator_questions.first()
+        question.option2 = ""
+        question.save()
+        self.assertEqual(self.client.post(self.url, {"answers": [1, 0, 0]}, format="json").status_code, 400)
+        response = self.client.post(self.url, {"answers": [2, 0, 0]}, format="json")
+        self.assertEqual(response.data["score"], 2)
+
+    def test_questions_without_options_are_rejected(self):
+        with self.assertRaises(DjangoValidationError):
+            CalculatorQuestions(calculator=self.calculator, question="Empty").full_clean()
+        with self.assertRaises(DjangoValidationError):
+            CalculatorQuestions(calculator=self.calculator, question="Gap", option1="Yes", option3="No").full_clean()
+        # Ones saved before the check expect no answer
+        CalculatorQuestions.objects.create(calculator=self.calculator, question="Empty")
+        self.assertEqual(self.client.post(self.url, {"answers": [1, 1, 1]}, format="json").status_code, 201)
+
+    def test_deprecated_save_score_scores_on_the_server(self):
+        url = reverse("save-calculator-score")
+        response = self.client.post(url, {"calculator_name": self.calculator.name, "score": 99}, format="json")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, {"calculator_name": self.calculator.name, "answers": [1, 1, 1]}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(CalculatorScores.objects.get().score, 3)
+
+
+class LatestScoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username="patient")
+        self.first = create_calculator("Anxiety")
+        self.second = create_calculator("Stress")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def save(self, calculator, answers):
+        response = self.client.post(reverse("calculator-submit", args=[calculator.name]), {"answers": answers}, format="json")
+        self.assertEqual(response.status_code, 201)
+
+    def test_latest_scores_come_from_one_query(self):
+        self.save(self.first, [3, 0, 0])
+        self.save(self.first, [3, 2, 0])
+        self.save(self.second, [1, 0, 0])
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("user-latest-scores"))
+        scores = {row["calculator_name"]: row["score"] for row in response.data}
+        self.assertEqual(scores, {"Anxiety": 5, "Stress": 1})
+
+    def test_deleting_the_latest_entry_falls_back_to_the_previous(self):
+        self.save(self.first, [3, 0, 0])
+        self.save(self.first, [3, 2, 0])
+        CalculatorScores.objects.filter(score=5).delete()
+        self.assertEqual(CalculatorLatestScore.objects.get().score, 3)
+
+    def test_backfill(self):
+        CalculatorScores.objects.create(user=self.user, calculator=self.first, score=2)
+        CalculatorScores.objects.create(user=self.user, calculator=self.first, score=8)
+        CalculatorScores.objects.create(user=self.user, calculator=self.second, score=4)
+        call_command("backfill_latest_scores", batch_size=1, stdout=io.StringIO())
+        latest = dict(CalculatorLatestScore.objects.values_list("calculator__name", "score"))
+        self.assertEqual(latest, {"Anxiety": 8, "Stress": 4})
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.category = BlogsCategories.objects.create(name="Anxiety")
+        self.owner = create_therapist("hiba", first_name="Hiba", last_name="Hassan", therapist_expertise="Panic disorders")
+        self.breathing = Blogs.objects.create(category=self.category, owner=self.owner, title="Breathing for calm",
+                                              content="<p>Slow <b>breathing</b> &amp; grounding</p>")
+        self.sleep = Blogs.objects.create(category=self.category, owner=self.owner, title="Better sleep",
+                                          content="<p>Breathing before bed helps too</p>")
+        News.objects.create(title="Clinic opens", content="Walk-in breathing workshops")
+
+    def search(self, **params):
+        response = self.client.get(reverse("search"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_strip_html(self):
+        self.assertEqual(strip_html("<p>One<br>two &amp; <script>x()</script>three</p>"), "One two & three")
+
+    def test_ranked_prefix_matches_across_kinds(self):
+        results = self.search(q="breath")["results"]
+        self.assertEqual(len(results), 3)
+        # Title matches rank first
+        self.assertEqual((results[0]["type"], results[0]["id"]), ("blog", self.breathing.id))
+        self.assertEqual(results[0]["category"], "Anxiety")
+        self.assertIn("<mark>", results[0]["snippet"])
+        self.assertEqual([r["type"] for r in self.search(q="breathing", type="news")["results"]], ["news"])
+        self.assertEqual(self.search(q="panic")["results"][0]["title"], "Hiba Hassan")
+
+    def test_index_follows_saves_and_deletes(self):
+        self.sleep.title = "Insomnia guide"
+        self.sleep.content = "<p>Rest</p>"
+        self.sleep.save()
+        self.assertEqual([r["id"] for r in self.search(q="breathing", type="blog")["results"]], [self.breathing.id])
+        self.breathing.delete()
+        self.assertEqual(self.search(q="breathing", type="blog")["results"], [])
+        self.owner.role = "user"
+        self.owner.save()
+        self.assertEqual(self.search(q="panic")["results"], [])
+
+    def test_operators_in_input_are_harmless(self):
+        self.assertEqual(self.search(q='"breathing* (')["results"][0]["id"], self.breathing.id)
+        self.assertEqual(self.search(q="***")["results"], [])
+
+    def test_pagination(self):
+        for i in range(15):
+            News.objects.create(title=f"Mindful update {i}", content="")
+        first = self.search(q="mindful")
+        self.assertEqual(len(first["results"]), 12)
+        second = self.client.get(first["next"]).data
+        self.assertEqual(len(second["results"]), 3)
+        self.assertIsNone(second["next"])
+
+    def test_snippets_escape_indexed_text(self):
+        Blogs.objects.create(category=self.category, owner=self.owner, title="Markup",
+                             content="<p>Calm &lt;img src=x onerror=alert(1)&gt; breathing</p>")
+        snippet = self.search(q="onerror")["results"][0]["snippet"]
+        self.assertNotIn("<img", snippet)
+        self.assertIn("&lt;img src=x <mark>onerror</mark>=alert(1)&gt;", snippet)
+
+    def test_unavailable_without_sqlite(self):
+        with mock.patch("api.search.is_available", return_value=False):
+            response = self.client.get(reverse("search"), {"q": "breathing"})
+        self.assertEqual(response.status_code, 503)
+
+    def test_unavailable_without_fts5(self):
+        with mock.patch("api.search.sqlite_has_fts5", return_value=False):
+            self.assertFalse(search.is_available())
+            response = self.client.get(reverse("search"), {"q": "breathing"})
+        self.assertEqual(response.status_code, 503)
+        self.assertTrue(search.sqlite_has_fts5())
+
+    def test_migration_fills_the_index(self):
+        migration = importlib.import_module("api.migrations.0020_search_index")
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.TABLE}")
+        migration.fill_search_index(connection)
+        self.assertEqual(len(self.search(q="breath")["results"]), 3)
+        self.assertEqual(self.search(q="grounding")["results"][0]["id"], self.breathing.id)
+        self.assertEqual(self.search(q="panic")["results"][0]["title"], "Hiba Hassan")
+
+    def test_admin_search_uses_index(self):
+        admin_user = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(admin_user)
+        response = self.client.get(reverse("admin:api_blogs_changelist"), {"q": "grounding"})
+        self.assertEqual(list(response.context["cl"].queryset), [self.breathing])
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = BlogsCategories.objects.create(name="Anxiety")
+
+    def test_revalidation_returns_304_without_queries(self):
+        url = reverse("categories")
+        response = self.client.get(url)
+        self.assertTrue(response["ETag"].startswith('"'))
+        self.assertIn("Last-Modified", response)
+
+        with self.assertNumQueries(0):
+            revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.content, b"")
+        since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(since.status_code, 304)
+
+    def test_changes_produce_a_new_etag(self):
+        url = reverse("categories")
+        etag = self.client.get(url)["ETag"]
+        self.category.name = "Stress"
+        self.category.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data[0]["name"], "Stress")
+
+    def test_uncached_views_skip_queries_on_304(self):
+        create_blogs(self.category, create_therapist(), 3)
+        url = reverse("blogs_by_category", args=["Anxiety"])
+        etag = self.client.get(url)["ETag"]
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        other_page = self.client.get(url + "?pagination=cursor", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(other_page.status_code, 200)
+
+    def test_errors_carry_no_validators(self):
+        response = self.client.get(reverse("calculator-detail", args=["Unknown"]))
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn("ETag", response)
+
+
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create(username="client", role="client", email="client@example.com")
+        self.client = APIClient()
+        self.url = reverse("user-latest-scores")
+
+    def authenticate(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_claims_token_costs_no_auth_query(self):
+        self.authenticate(tokens_for_user(self.user).access_token)
+        user_cache.clear()
+        with self.assertNumQueries(1):  # The scores themselves
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_token_without_claims_is_looked_up_once(self):
+        self.authenticate(RefreshToken.for_user(self.user).access_token)
+        user_cache.clear()
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+    def test_deactivation_applies_to_existing_tokens(self):
+        self.authenticate(tokens_for_user(self.user).access_token)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        user_cache.clear()
+        self.user.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_other_fields_load_on_first_access(self):
+        user = ClaimsJWTAuthentication().get_user(tokens_for_user(self.user).access_token)
+        self.assertEqual(user.role, "client")
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, "client@example.com")
+            self.assertEqual(user.username, "client")
+
+    def test_refresh_restamps_claims(self):
+        refresh = tokens_for_user(self.user)
+        self.user.role = "therapist"
+        self.user.save()
+        self.client.cookies["refresh_token"] = str(refresh)
+        response = self.client.post(reverse("token_refresh"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AccessToken(response.data["access"])["role"], "therapist")
+
+
+class RefreshRotationTests(TestCase):
+    def setUp(self):
+        recently_revoked.clear()
+        self.user = User.objects.create(username="client", role="client")
+        self.client = APIClient()
+        self.url = reverse("token_refresh")
+
+    def refresh(self, token):
+        self.client.cookies["refresh_token"] = str(token)
+        return self.client.post(self.url)
+
+    def test_rotation_moves_cookie_and_revokes_old_token(self):
+        old = tokens_for_user(self.user)
+        response = self.refresh(old)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("refresh", response.data)
+        rotated = response.cookies["refresh_token"].value
+        self.assertNotEqual(rotated, str(old))
+
+        self.assertEqual(self.refresh(old).status_code, 401)
+        recently_revoked.clear()  # As seen from another process
+        self.assertEqual(self.refresh(old).status_code, 401)
+        self.assertEqual(self.refresh(rotated).status_code, 200)
+
+    def test_prune_removes_only_expired_revocations(self):
+        now = timezone.now()
+        RevokedToken.objects.create(jti="expired", expires_at=now - datetime.timedelta(seconds=1))
+        RevokedToken.objects.create(jti="live", expires_at=now + datetime.timedelta(days=1))
+        call_command("prune_revoked_tokens", stdout=io.StringIO())
+        self.assertEqual(list(RevokedToken.objects.values_list("jti", flat=True)), ["live"])
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class UserImportTests(TestCase):
+    def test_import_creates_new_users_and_skips_the_rest(self):
+        User.objects.create(username="taken")
+        rows = (
+            "username,email,role,password,first_name,therapist_expertise,therapist_fee\n"
+            "ayesha,a@example.com,therapist,secret123,Ayesha,Anxiety and panic,3000\n"
+            "bilal,b@example.com,user,,Bilal,,\n"
+            "taken,t@example.com,user,secret123,,,\n"
+            "bilal,b2@example.com,user,secret123,,,\n"
+            "carla,c@example.com,admin,secret123,,,\n"
+        )
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as handle:
+            handle.write(rows)
+        self.addCleanup(os.remove, handle.name)
+
+        out, err = io.StringIO(), io.StringIO()
+        call_command("import_users", handle.name, "--workers=0", "--batch-size=2", stdout=out, stderr=err)
+
+        self.assertIn("Created 2 user(s), skipped 3", out.getvalue())
+        self.assertIn("Row 5: Unknown role 'admin'.", err.getvalue())
+        ayesha = User.objects.get(username="ayesha")
+        self.assertTrue(ayesha.check_password("secret123"))
+        self.assertEqual(ayesha.therapist_fee, 3000)
+        self.assertFalse(User.objects.get(username="bilal").has_usable_password())
+        self.assertEqual([hit["id"] for hit in search.search("panic")], [ayesha.id])
+
+    def test_signup_inserts_once_and_mints_one_token(self):
+        with CaptureQueriesContext(connection) as queries, \
+                mock.patch.object(RefreshToken, "for_user", wraps=RefreshToken.for_user) as for_user:
+            response = APIClient().post(reverse("signup"), {"username": "dana", "password": "secret123"})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(for_user.call_count, 1)
+        self.assertIn("refresh_token", response.cookies)
+        user_queries = [query["sql"].split()[0] for query in queries if '"api_user"' in query["sql"]]
+        self.assertEqual(user_queries, ["SELECT", "INSERT"])  # Username uniqueness check, then the row
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        # As django.test.Client does: finishing a request must not close the test's connection
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+
+    def test_every_route_succeeds_against_the_wsgi_app(self):
+        from backend.wsgi import application
+
+        fixture = benchmark.seed()
+        benchmark.install_query_counter(connection)
+        self.addCleanup(connection.execute_wrappers.remove, benchmark.count_queries)
+        for route in benchmark.ROUTES:
+            with self.subTest(route=route):
+                counter = [0]
+                token = benchmark._queries.set(counter)
+                status = benchmark.send_wsgi(application, benchmark.build_request(route, fixture))
+                benchmark._queries.reset(token)
+                self.assertLess(status, 400)
+        self.assertGreater(counter[0], 0)
+
+    def test_compare_flags_slower_and_chattier_routes(self):
+        stats = {"p95_ms": 10.0, "queries_mean": 2.0, "errors": 0}
+        baseline = {"results": {"wsgi": {"therapists": stats, "search": stats}}}
+        report = {"results": {"wsgi": {
+            "therapists": {**stats, "p95_ms": 11.5},
+            "search": {**stats, "p95_ms": 13.0, "queries_mean": 3.0},
+            "signup": {**stats, "p95_ms": 500.0},  # Not in the baseline
+        }}}
+        self.assertEqual(benchmark.compare(report, baseline, tolerance=0.2), [
+            "wsgi search: p95 10.0ms -> 13.0ms",
+            "wsgi search: 2.0 -> 3.0 queries per request",
+        ])
+        self.assertEqual(benchmark.percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(benchmark.percentile(list(range(1, 101)), 99), 99)
+
+
+@override_settings(METRICS_TOKEN="scrape-me")
+class PerformanceMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for histogram in metrics.HISTOGRAMS:
+            histogram.clear()
+
+    def test_server_timing_reports_queries_and_serialization(self):
+        owner = create_therapist()
+        category = BlogsCategories.objects.create(name="Anxiety")
+        create_blogs(category, owner, 3)
+        response = self.client.get(reverse("blogs_by_category", args=["Anxiety"]))
+        self.assertEqual(response.status_code, 200)
+        timing = dict(
+            (part.split(";")[0].strip(), part) for part in response["Server-Timing"].split(",")
+        )
+        self.assertEqual(set(timing), {"total", "db", "serialize"})
+        self.assertIn('desc="4 queries"', timing["db"])
+
+    def test_metrics_endpoint_exposes_histograms(self):
+        self.client.get(reverse("latest_news"))
+        self.client.get(reverse("latest_news"))
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+
+        response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer scrape-me")
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn("# TYPE api_request_duration_seconds histogram", body)
+        self.assertIn('api_request_duration_seconds_count{view="latest_news",method="GET"} 2', body)
+        self.assertIn('api_request_db_queries_bucket{view="latest_news",method="GET",le="+Inf"} 2', body)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram("test_seconds", "Test", ("view",), (1, 5))
+        for value in (0.5, 1, 3, 7):
+            histogram.observe(("a",), value)
+        self.assertEqual(histogram.render().splitlines()[2:], [
+            'test_seconds_bucket{view="a",le="1"} 2',
+            'test_seconds_bucket{view="a",le="5"} 3',
+            'test_seconds_bucket{view="a",le="+Inf"} 4',
+            'test_seconds_sum{view="a"} 11.5',
+            'test_seconds_count{view="a"} 4',
+        ])
+
+
+class DatabaseTuningTests(TestCase):
+    databases = {"default", "replica"}
+
+    def pragma(self, alias, name):
+        with connections[alias].cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas_are_applied_to_new_connections(self):
+        self.assertEqual(self.pragma("default", "busy_timeout"), settings.SQLITE_PRAGMAS["busy_timeout"])
+        self.assertEqual(self.pragma("default", "synchronous"), 1)  # NORMAL
+        self.assertEqual(self.pragma("default", "query_only"), 0)
+        self.assertEqual(self.pragma("replica", "query_only"), 1)
+
+    def test_safe_requests_read_from_the_replica_outside_transactions(self):
+        router = ReadReplicaRouter()
+        self.assertIsNone(router.db_for_read(User))
+        token = database._read_only.set(True)
+        self.addCleanup(database._read_only.reset, token)
+        self.assertIsNone(router.db_for_read(User))  # The test's own transaction must see its rows
+        with mock.patch.object(connections["default"], "in_atomic_block", False):
+            self.assertEqual(router.db_for_read(User), "replica")
+        self.assertEqual(router.db_for_write(User), "default")
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = create_therapist(first_name="Ada")
+        self.category = BlogsCategories.objects.create(name="Anxiety")
+        create_blogs(self.category, owner, 14)
+        News.objects.create(title="Opening", content="<p>Open</p>")
+        Calculators.objects.create(name="GAD-7", desc="Anxiety")
+        self.async_client = AsyncClient()
+
+    def get_async(self, url, **headers):
+        with override_settings(ROOT_URLCONF="backend.asgi_urls"):
+            return async_to_sync(self.async_client.get)(url, headers={"Accept": "application/json", **headers})
+
+    def test_async_views_match_the_sync_ones(self):
+        blogs = reverse("blogs_by_category", args=["anxiety"])
+        cursor = self.client.get(blogs + "?pagination=cursor").json()["next"]
+        urls = [
+            reverse("therapists"), reverse("categories"), blogs, blogs + "?page=2", blogs + "?pagination=cursor",
+            cursor, reverse("latest_blogs"), reverse("latest_news"), reverse("calculator-list"),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertTrue(iscoroutinefunction(resolve(urlsplit(url).path, "backend.asgi_urls").func))
+                expected = self.client.get(url, HTTP_ACCEPT="application/json")
+                self.assertEqual(self.get_async(url)["ETag"], expected["ETag"])
+                cache.clear()  # Rebuilt by the async view this time
+                response = self.get_async(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, expected.content)
+
+    def test_errors_and_revalidation(self):
+        missing = self.get_async(reverse("blogs_by_category", args=["Unknown"]))
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(missing.json(), {"detail": "No BlogsCategories matches the given query."})
+        self.assertNotIn("ETag", missing)
+        self.assertEqual(self.get_async(reverse("blogs_by_category", args=["Anxiety"]) + "?page=9").status_code, 404)
+
+        url = reverse("categories")
+        etag = self.get_async(url)["ETag"]
+        with self.assertNumQueries(0):
+            revalidated = self.get_async(url, **{"If-None-Match": etag})
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_async_versions_match_the_sync_ones(self):
+        created = async_to_sync(aget_versions)([News, Blogs])
+        self.assertEqual(get_versions([News, Blogs]), created)
+        self.assertEqual(async_to_sync(aget_versions)([News, Blogs]), created)
+
+
+class ChatbotTests(TestCase):
+    def test_concurrent_messages_share_a_generate_call(self):
+        backend = chatbot.EchoBackend()
+        release = threading.Event()
+        generate = backend.generate
+
+        def slow_generate(conversations):
+            release.wait(5)
+            return generate(conversations)
+
+        backend.generate = slow_generate
+        batcher = chatbot.MicroBatcher(lambda: backend, max_batch=4, max_wait=0)
+        first = batcher.submit([("user", "first")])
+        while not first.running():
+            time.sleep(0.001)
+        # Queued while the model is busy with the first one
+        futures = [batcher.submit([("user", f"message {i}")]) for i in range(6)]
+        futures[5].cancel()
+        release.set()
+        self.assertEqual(first.result(5), "You said: first")
+        self.assertEqual([future.result(5) for future in futures[:5]], [f"You said: message {i}" for i in range(5)])
+        self.assertEqual(backend.batches, [1, 4, 1])
+
+    def test_failed_backend_fails_its_batch_and_is_retried(self):
+        attempts = []
+
+        def load():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise ImportError("No module named 'transformers'")
+            return chatbot.EchoBackend()
+
+        batcher = chatbot.MicroBatcher(load, max_wait=0)
+        with self.assertLogs("api.chatbot", "ERROR"):
+            with self.assertRaises(ImportError):
+                batcher.submit([("user", "hi")]).result(5)
+        self.assertEqual(batcher.submit([("user", "hi")]).result(5), "You said: hi")
+
+    def test_missing_replies_fail_their_requests(self):
+        backend = mock.Mock()
+        backend.generate.side_effect = lambda conversations: ["Only one"]
+        batcher = chatbot.MicroBatcher(lambda: backend, max_batch=2, max_wait=5)  # Waits for both
+        futures = [batcher.submit([("user", f"message {i}")]) for i in range(2)]
+        with self.assertLogs("api.chatbot", "ERROR"):
+            self.assertEqual(futures[0].result(5), "Only one")
+            with self.assertRaises(RuntimeError):
+                futures[1].result(5)
+
+    def test_sessions_are_bounded_and_expire(self):
+        sessions = chatbot.SessionStore(max_sessions=2, ttl=60, max_turns=3)
+        for i in range(4):
+            sessions.append("a", "user", f"message {i}")
+        self.assertEqual([message for _, message in sessions.get("a")], ["message 1", "message 2", "message 3"])
+        sessions.append("b", "user", "hi")
+        sessions.append("a", "user", "again")  # a is now the most recent
+        sessions.append("c", "user", "hi")
+        self.assertEqual(sessions.get("b"), [])
+        self.assertEqual(len(sessions), 2)
+        with mock.patch("api.chatbot.time.monotonic", return_value=time.monotonic() + 61):
+            self.assertEqual(sessions.get("c"), [])
+            self.assertEqual(len(sessions), 0)
+
+    def test_view_keeps_the_conversation(self):
+        bot = chatbot.Chatbot(chatbot.SessionStore(10, 60, 10), chatbot.MicroBatcher(chatbot.EchoBackend, max_wait=0))
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.object(chatbot, "_chatbot", bot).start()
+        url = reverse("chatbot_response")
+        self.assertEqual(self.client.post(url, {}, content_type="application/json").status_code, 400)
+
+        reply = self.client.post(url, {"message": "hello"}, content_type="application/json").json()
+        self.assertEqual(reply["response"], "You said: hello")
+        with override_settings(ROOT_URLCONF="backend.asgi_urls"):
+            again = async_to_sync(AsyncClient().post)(
+                url, {"session_id": reply["session_id"], "message": "bye"}, content_type="application/json"
+            )
+        self.assertEqual(again.json(), {"session_id": reply["session_id"], "response": "You said: bye"})
+        self.assertEqual(len(bot.sessions.get(reply["session_id"])), 4)
+
+        failing = chatbot.MicroBatcher(mock.Mock(side_effect=OSError("no model")), max_wait=0)
+        with mock.patch.object(bot, "batcher", failing), self.assertLogs("api.chatbot", "ERROR"):
+            self.assertEqual(self.client.post(url, {"message": "hi"}, content_type="application/json").status_code, 503)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        therapist = create_therapist(first_name="Ada")
+        patient = User.objects.create(username="patient", email="patient@example.com")
+        self.bookings = []
+        for day in (1, 2, 3):
+            booking = Bookings.objects.create(
+                user=patient, therapist=therapist, date=datetime.date(2025, 3, day), time=datetime.time(9),
+                payment_method="online", paid=day == 2,
+            )
+            Bookings.objects.filter(pk=booking.pk).update(
+                created_at=timezone.make_aware(datetime.datetime(2025, 2, day, 12))
+            )
+            self.bookings.append(booking)
+        calculator = Calculators.objects.create(name="GAD-7")
+        CalculatorScores.objects.create(calculator=calculator, user=patient, score=7)
+        staff = User.objects.create(username="staff", is_staff=True)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(staff).access_token}")
+        self.url = reverse("export", args=["bookings"])
+
+    def test_ndjson_streams_rows_in_chunks(self):
+        with mock.patch("api.exports.CHUNK_SIZE", 2), self.assertNumQueries(1):
+            response = self.client.get(self.url)
+            chunks = [chunk.decode() for chunk in response.streaming_content]
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(len(chunks), 2)
+        rows = [json.loads(line) for line in "".join(chunks).splitlines()]
+        self.assertEqual([row["id"] for row in rows], [booking.pk for booking in self.bookings])
+        self.assertEqual(rows[1]["therapist"], "therapist")
+        self.assertEqual(rows[1]["patient_email"], "patient@example.com")
+        self.assertEqual((rows[1]["payment_method"], rows[1]["paid"]), ("online", True))
+
+    def test_csv_with_date_range(self):
+        response = self.client.get(self.url, {"output": "csv", "since": "2025-02-02", "until": "2025-02-02"})
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(",")[:3], ["id", "created_at", "date"])
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[1].split(",")[2:4], ["2025-03-02", "09:00:00"])
+        self.assertIn('filename="bookings-', response["Content-Disposition"])
+
+        scores = self.client.get(reverse("export", args=["scores"]), {"output": "csv"}, HTTP_ACCEPT="text/csv")
+        self.assertEqual(b"".join(scores.streaming_content).decode().splitlines()[1].split(",")[2:4], ["GAD-7", "7"])
+
+    def test_asgi_streams_from_the_async_iterator(self):
+        with override_settings(ROOT_URLCONF="backend.asgi_urls"):
+            response = async_to_sync(AsyncClient().get)(
+                self.url, headers={"Authorization": self.client._credentials["HTTP_AUTHORIZATION"]}
+            )
+        self.assertTrue(response.is_async)
+        lines = async_to_sync(self.collect)(response)
+        self.assertEqual(len(lines), 3)
+
+    async def collect(self, response):
+        return b"".join([chunk async for chunk in response.streaming_content]).decode().splitlines()
+
+    def test_staff_only_and_validated(self):
+        self.assertEqual(self.client.get(self.url, {"since": "March"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"output": "xml"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("export", args=["users"])).status_code, 404)
+        patient = User.objects.get(username="patient")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(patient).access_token}")
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class BookingBulkUpdateTests(TestCase):
+    def setUp(self):
+        self.therapist = create_therapist()
+        other = create_therapist("other")
+        self.patient = User.objects.create(username="patient")
+        day = datetime.date(2025, 3, 3)
+        self.own = Bookings.objects.bulk_create(
+            Bookings(user=self.patient, therapist=self.therapist, date=day, time=datetime.time(8 + i // 4, 15 * (i % 4)))
+            for i in range(40)
+        )
+        self.foreign = Bookings.objects.create(user=self.patient, therapist=other, date=day, time=datetime.time(9))
+        self.client = APIClient()
+        self.url = reverse("bookings_bulk_update")
+
+    def login(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(user).access_token}")
+
+    def test_confirming_a_day_is_one_select_and_one_update(self):
+        self.login(self.therapist)
+        ids = [booking.pk for booking in self.own]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {"ids": ids, "status": "confirmed"}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["updated"], 40)
+        statements = [query["sql"].split()[0] for query in queries if "SAVEPOINT" not in query["sql"]]
+        self.assertEqual(statements, ["SELECT", "UPDATE"])
+        self.assertEqual(Bookings.objects.filter(status="confirmed").count(), 40)
+
+    def test_per_id_results_and_ownership(self):
+        self.login(self.therapist)
+        first = self.own[0]
+        Bookings.objects.filter(pk=first.pk).update(paid=True)
+        response = self.client.post(
+            self.url, {"ids": [first.pk, self.own[1].pk, self.foreign.pk, 9999, first.pk], "paid": True}, format="json"
+        )
+        self.assertEqual(response.data["results"], [
+            {"id": first.pk, "result": "unchanged"},
+            {"id": self.own[1].pk, "result": "updated"},
+            {"id": self.foreign.pk, "result": "not_found"},
+            {"id": 9999, "result": "not_found"},
+        ])
+        self.assertFalse(Bookings.objects.get(pk=self.foreign.pk).paid)
+
+        self.login(User.objects.create(username="staff", is_staff=True))
+        response = self.client.post(self.url, {"ids": [self.foreign.pk], "paid": True}, format="json")
+        self.assertEqual(response.data["results"], [{"id": self.foreign.pk, "result": "updated"}])
+
+    def test_reactivating_into_a_taken_slot_is_a_conflict(self):
+        cancelled = self.own[0]
+        Bookings.objects.filter(pk=cancelled.pk).update(status="cancelled")
+        Bookings.objects.create(user=self.patient, therapist=self.therapist, date=cancelled.date, time=cancelled.time)
+        self.login(self.therapist)
+        response = self.client.post(self.url, {"ids": [cancelled.pk, self.own[1].pk], "status": "confirmed"}, format="json")
+        self.assertEqual(response.data["results"], [
+            {"id": cancelled.pk, "result": "conflict"}, {"id": self.own[1].pk, "result": "updated"},
+        ])
+        self.assertEqual(Bookings.objects.get(pk=cancelled.pk).status, "cancelled")
+
+    def test_patients_and_bad_input_are_refused(self):
+        self.login(self.patient)
+        self.assertEqual(self.client.post(self.url, {"ids": [self.own[0].pk], "paid": True}, format="json").status_code, 403)
+        self.login(self.therapist)
+        self.assertEqual(self.client.post(self.url, {"ids": [self.own[0].pk]}, format="json").status_code, 400)
+        self.assertEqual(self.client.post(self.url, {"ids": [], "paid": True}, format="json").status_code, 400)
+        self.assertEqual(
+            self.client.post(self.url, {"ids": [self.own[0].pk], "status": "done"}, format="json").status_code, 400
+        )
+
+    def test_admin_action_updates_the_selection(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        response = self.client.post(reverse("admin:api_bookings_changelist"), {
+            "action": "mark_paid", "_selected_action": [booking.pk for booking in self.own[:3]],
+        }, follow=True)
+        self.assertContains(response, "Updated 3 booking(s), 0 already were.")
+        self.assertEqual(Bookings.objects.filter(paid=True).count(), 3)
+
+
+class TherapistBookingsTests(TestCase):
+    def setUp(self):
+        self.therapist = create_therapist()
+        self.patient = User.objects.create(username="patient", first_name="Pat")
+        other = create_therapist("other")
+        day = datetime.date(2025, 3, 3)
+        for offset, hour, status in ((0, 9, "pending"), (0, 10, "confirmed"), (0, 11, "cancelled"), (1, 9, "pending"), (9, 9, "pending")):
+            Bookings.objects.create(
+                user=self.patient, therapist=self.therapist, date=day + datetime.timedelta(days=offset),
+                time=datetime.time(hour), status=status,
+            )
+        Bookings.objects.create(user=self.patient, therapist=other, date=day, time=datetime.time(9))
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.therapist).access_token}")
+        self.url = reverse("therapist_bookings")
+        self.params = {"start": "2025-03-03", "end": "2025-03-09"}
+
+    def test_schedule_with_grouped_counts(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {**self.params, "status": "pending,confirmed"})
+        self.assertEqual(response.status_code, 200)
+        counts = response.data["counts"]
+        self.assertEqual(counts["total"], 4)
+        self.assertEqual(counts["by_status"], {"pending": 2, "confirmed": 1, "cancelled": 1})
+        self.assertEqual(
+            [(str(day["date"]), day["total"], day["cancelled"]) for day in counts["by_day"]],
+            [("2025-03-03", 3, 1), ("2025-03-04", 1, 0)],
+        )
+        results = response.data["results"]
+        self.assertEqual([(row["date"], row["time"]) for row in results], [
+            ("2025-03-03", "09:00:00"), ("2025-03-03", "10:00:00"), ("2025-03-04", "09:00:00"),
+        ])
+        self.assertEqual(results[0]["patient"]["first_name"], "Pat")
+
+    def test_range_uses_the_schedule_index(self):
+        plan = Bookings.objects.filter(therapist=self.therapist, date__range=("2025-03-03", "2025-03-09")).explain()
+        self.assertIn("booking_therapist_schedule", plan)
+
+    def test_only_therapists_and_valid_filters(self):
+        self.assertEqual(self.client.get(self.url, {**self.params, "status": "done"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"start": "2025-03-03", "end": "2025-06-03"}).status_code, 400)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.patient).access_token}")
+        self.assertEqual(self.client.get(self.url, self.params).status_code, 403)
+
+
+class DroppedStream:
+    """Request body that breaks off after ``limit`` bytes, like a client going away"""
+
+    def __init__(self, data, limit):
+        self.stream = io.BytesIO(data[:limit])
+
+    def read(self, size):
+        block = self.stream.read(size)
+        if not block:
+            raise UnreadablePostError("connection reset")
+        return block
+
+
+class ReceiptUploadTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, RECEIPT_UPLOAD_DIR=os.path.join(self.media_root, "partial")
+        )
+        self.settings_override.enable()
+        self.patient = User.objects.create(username="patient")
+        self.booking = Bookings.objects.create(
+            user=self.patient, therapist=create_therapist(), date=datetime.date(2025, 3, 3), time=datetime.time(9)
+        )
+        buffer = io.BytesIO()
+        Image.frombytes("RGB", (200, 200), os.urandom(200 * 200 * 3)).save(buffer, "PNG")  # Noise doesn't compress
+        self.data = buffer.getvalue()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.patient).access_token}")
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def start(self, **body):
+        response = self.client.post(
+            reverse("receipt_upload_create", args=[self.booking.pk]),
+            {"filename": "receipt.png", "size": len(self.data), **body}, format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        return ReceiptUpload.objects.get(pk=response.data["id"])
+
+    def send(self, upload, offset, chunk):
+        return self.client.generic(
+            "PATCH", reverse("receipt_upload", args=[upload.pk]), chunk,
+            content_type="application/offset+octet-stream", HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_interrupted_chunk_resumes_and_finalizes(self):
+        upload = self.start(sha256=hashlib.sha256(self.data).hexdigest())
+        # The client drops 100000 bytes into a chunk meant to be the whole file
+        offset = uploads.append(upload, 0, len(self.data), DroppedStream(self.data, 100000))
+        self.assertEqual(offset, 100000)
+        uploads.running_hashes.discard(upload.pk)  # As if the next chunk reached another process
+
+        response = self.client.get(reverse("receipt_upload", args=[upload.pk]))
+        self.assertEqual((response.data["offset"], response["Upload-Offset"]), (100000, "100000"))
+        response = self.send(upload, 100000, self.data[100000:])
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.json()["id"], str(upload.pk))
+        self.assertEqual(response.data["offset"], len(self.data))
+        self.assertTrue(response.data["receipt"].endswith(f"/media/receipts/{hashlib.sha256(self.data).hexdigest()}.png"))
+
+        self.booking.refresh_from_db()
+        with self.booking.receipt.open("rb") as stored:
+            self.assertEqual(stored.read(), self.data)
+        self.assertFalse(ReceiptUpload.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media_root, "partial")), [])
+
+    def test_wrong_offsets_and_sizes_are_refused(self):
+        upload = self.start()
+        self.assertEqual(self.send(upload, 0, self.data[:1000]).status_code, 200)
+        response = self.send(upload, 0, self.data[:1000])
+        self.assertEqual((response.status_code, response.data["offset"]), (409, 1000))
+        self.assertEqual(self.send(upload, 1000, self.data[1000:] + b"extra").status_code, 400)
+        self.assertEqual(uploads.offset_of(upload), 1000)
+
+        self.assertEqual(self.client.post(
+            reverse("receipt_upload_create", args=[self.booking.pk]),
+            {"filename": "huge.png", "size": uploads.max_size() + 1}, format="json",
+        ).status_code, 400)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.booking.therapist).access_token}")
+        self.assertEqual(self.client.get(reverse("receipt_upload", args=[upload.pk])).status_code, 404)
+
+    def test_checksum_mismatch_discards_the_upload(self):
+        upload = self.start(sha256="0" * 64)
+        response = self.send(upload, 0, self.data)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ReceiptUpload.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media_root, "partial")), [])
+        self.booking.refresh_from_db()
+        self.assertFalse(self.booking.receipt)
+
+    def test_prune_drops_abandoned_uploads(self):
+        upload = self.start()
+        self.send(upload, 0, self.data[:1000])
+        ReceiptUpload.objects.update(created_at=timezone.now() - datetime.timedelta(days=2))
+        call_command("prune_receipt_uploads", stdout=io.StringIO())
+        self.assertFalse(ReceiptUpload.objects.exists())
+        self.assertFalse(os.path.exists(uploads.partial_path(upload)))
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, IMAGE_DERIVATIVE_WORKERS=0)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_identical_uploads_are_stored_once(self):
+        first = default_storage.save("blogs/photo.jpg", ContentFile(b"same bytes"))
+        second = default_storage.save("blogs/Copy of photo.JPG", ContentFile(b"same bytes"))
+        self.assertEqual(first, f"blogs/{hashlib.sha256(b'same bytes').hexdigest()}.jpg")
+        self.assertEqual(second, first)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, "blogs")), [os.path.basename(first)])
+        self.assertEqual(default_storage.references(first), 2)
+
+        default_storage.delete(first)
+        self.assertTrue(default_storage.exists(first))
+        default_storage.delete(first)
+        self.assertFalse(default_storage.exists(first))
+        self.assertFalse(StoredFile.objects.exists())
+        # Other directories keep their names
+        self.assertEqual(default_storage.save("ckeditor/notes.txt", ContentFile(b"same bytes")), "ckeditor/notes.txt")
+
+    def test_replaced_and_deleted_files_are_released_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = BlogsCategories.objects.create(name="Sleep", img=image_upload())
+            second = BlogsCategories.objects.create(name="Stress", img=image_upload())
+        self.assertEqual(first.img.name, second.img.name)
+        shared = first.img.name
+        self.assertEqual(default_storage.references(shared), 2)
+
+        first.refresh_from_db()  # With its derivatives, as an edit form would load it
+        with self.captureOnCommitCallbacks(execute=True):
+            first.img = image_upload(size=(300, 150))
+            first.save()
+        self.assertEqual(default_storage.references(shared), 1)
+
+        second.refresh_from_db()
+        derivatives = list(storage._variant_names(second.img_variants))
+        self.assertTrue(derivatives)
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(default_storage.exists(shared))
+        first.refresh_from_db()
+        kept = set(storage._variant_names(first.img_variants))  # Solid colours: some sizes come out identical
+        self.assertEqual({name for name in derivatives if default_storage.exists(name)}, kept & set(derivatives))
+        self.assertTrue(all(default_storage.exists(name) for name in [first.img.name, *kept]))
+
+    def test_dedupe_media_converts_the_existing_tree(self):
+        legacy = storage.FileSystemStorage(location=self.media_root)
+        data = image_upload().read()
+        names = [legacy.save(name, ContentFile(data)) for name in ("blogs/stock.jpg", "blogs/stock_IFPfL7x.jpg", "categories/stock.jpg")]
+        other = legacy.save("therapists/portrait.png", ContentFile(b"unreferenced"))
+        blog = create_blogs(BlogsCategories.objects.create(name="Sleep"), create_therapist(), 1, images=0)[0]
+        BlogImages.objects.bulk_create(BlogImages(blog=blog, image=name) for name in names[:2])
+        category = BlogsCategories.objects.create(name="Stress", img=names[2])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("dedupe_media", stdout=io.StringIO())
+        digest = hashlib.sha256(data).hexdigest()
+        self.assertEqual(sorted(os.listdir(os.path.join(self.media_root, "blogs"))), [f"{digest}.jpg"])
+        self.assertEqual(set(BlogImages.objects.values_list("image", flat=True)), {f"blogs/{digest}.jpg"})
+        category.refresh_from_db()
+        self.assertEqual(category.img.name, f"categories/{digest}.jpg")
+        self.assertEqual(default_storage.references(f"blogs/{digest}.jpg"), 2)
+        self.assertEqual(default_storage.references(f"categories/{digest}.jpg"), 1)
+        self.assertFalse(os.path.exists(legacy.path(other)))
+        self.assertEqual(default_storage.references(storage.content_name(other, hashlib.sha256(b"unreferenced").hexdigest())), 0)
+
+    def test_dedupe_media_counts_each_row_once(self):
+        legacy = storage.FileSystemStorage(location=self.media_root)
+        name = legacy.save("therapists/portrait.png", ContentFile(b"portrait"))
+        therapist = create_therapist(therapist_img=name)  # User, with the ClaimsUser proxy over the same table
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("dedupe_media", stdout=io.StringIO())
+        therapist.refresh_from_db()
+        self.assertEqual(therapist.therapist_img.name, storage.content_name(name, hashlib.sha256(b"portrait").hexdigest()))
+        self.assertEqual(default_storage.references(therapist.therapist_img.name), 1)
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.data = bytes(range(256)) * 4
+        self.name = default_storage.save("blogs/photo.jpg", ContentFile(self.data))
+        self.url = f"/media/{self.name}"
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_content_addressed_files_are_immutable(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.data)
+        self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+        self.assertEqual(response["ETag"], f'"{hashlib.sha256(self.data).hexdigest()}"')
+        self.assertEqual((response["Content-Type"], response["Accept-Ranges"]), ("image/jpeg", "bytes"))
+
+        response = self.client.get(self.url, headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("immutable", response["Cache-Control"])
+
+        legacy = storage.FileSystemStorage(location=self.media_root).save("ckeditor/notes.txt", ContentFile(b"notes"))
+        self.assertEqual(self.client.get(f"/media/{legacy}")["Cache-Control"], "public, max-age=3600")
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, headers={"Range": "bytes=10-19"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), self.data[10:20])
+        self.assertEqual((response["Content-Range"], response["Content-Length"]), ("bytes 10-19/1024", "10"))
+
+        response = self.client.get(self.url, headers={"Range": "bytes=-24"})
+        self.assertEqual(b"".join(response.streaming_content), self.data[-24:])
+        response = self.client.get(self.url, headers={"Range": "bytes=1000-"})
+        self.assertEqual(response["Content-Range"], "bytes 1000-1023/1024")
+
+        response = self.client.get(self.url, headers={"Range": "bytes=2048-"})
+        self.assertEqual((response.status_code, response["Content-Range"]), (416, "bytes */1024"))
+        # Several ranges, or a range of an older version, get the whole file
+        self.assertEqual(self.client.get(self.url, headers={"Range": "bytes=0-1,5-6"}).status_code, 200)
+        self.assertEqual(self.client.get(self.url, headers={"Range": "bytes=0-1", "If-Range": '"other"'}).status_code, 200)
+
+    def test_proxy_offload_sends_headers_only(self):
+        with override_settings(MEDIA_SENDFILE="x-accel-redirect"):
+            response = self.client.get(self.url)
+        self.assertEqual((response.status_code, response.content), (200, b""))
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-media/{self.name}")
+        self.assertIn("immutable", response["Cache-Control"])
+        with override_settings(MEDIA_SENDFILE="x-sendfile"):
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Sendfile"], os.path.join(self.media_root, self.name))
+
+    def test_asgi_reads_the_range_in_blocks(self):
+        response = async_to_sync(AsyncClient().get)(self.url, headers={"Range": "bytes=100-"})
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response.is_async)
+        body = async_to_sync(self.collect)(response)
+        self.assertEqual(body, self.data[100:])
+
+    async def collect(self, response):
+        return b"".join([chunk async for chunk in response.streaming_content])
+
+    def test_only_files_under_media_root(self):
+        open(os.path.join(self.media_root, "blogs", ".upload-partial"), "wb").close()
+        for url in ("/media/../backend/settings.py", "/media/blogs/.upload-partial", "/media/blogs/", "/media/blogs/missing.jpg"):
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+    def test_receipts_only_reach_their_booking(self):
+        patient = User.objects.create(username="patient")
+        therapist = create_therapist()
+        name = default_storage.save("receipts/Patient.png", ContentFile(b"receipt"))
+        Bookings.objects.create(user=patient, therapist=therapist, receipt=name)
+        url = f"/media/{name}"
+
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(User.objects.create(username="stranger"))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.client.force_login(therapist)
+        response = self.client.get(url)
+        self.assertEqual((response.status_code, response["Cache-Control"]), (200, "private, no-cache"))
+        self.client.logout()
+        response = self.client.get(url, headers={"Authorization": f"Bearer {tokens_for_user(patient).access_token}"})
+        self.assertEqual((response.status_code, response["Cache-Control"]), (200, "private, no-cache"))
+
+
+class RichTextRenderingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = BlogsCategories.objects.create(name="Sleep")
+        self.therapist = create_therapist(first_name="Hina", therapist_description="<p>Calm   <b>support</b></p>\r\n")
+        self.body = "<p>" + " ".join(["restful"] * 450) + '</p><script>track()</script><p onclick="x()">End</p>'
+
+    def test_sanitizer_keeps_only_safe_markup(self):
+        self.assertEqual(
+            sanitize_html('<p>Hi  <a href="javascript:alert(1)" onclick="x()">there</a></p>\n\n<!-- note --><iframe src="/x"></iframe>'),
+            "<p>Hi <a>there</a></p>",
+        )
+        self.assertEqual(
+            sanitize_html('<ul><li>One<li>Two</ul><div><a href="/a" target="_blank">A &amp; B'),
+            '<ul><li>One</li><li>Two</li></ul><div><a href="/a" rel="noopener noreferrer" target="_blank">A &amp; B</a></div>',
+        )
+        self.assertEqual(sanitize_html("<pre>  keep\n  this </pre>"), "<pre>  keep\n  this </pre>")
+        self.assertEqual(sanitize_html('<a href="http://[x">Link</a>'), "<a>Link</a>")
+
+    def test_lists_ship_excerpts_and_details_the_sanitized_content(self):
+        blog = Blogs.objects.create(category=self.category, owner=self.therapist, title="Rest", content=self.body)
+        self.assertEqual(blog.content_reading_minutes, 3)
+        self.assertTrue(blog.content_excerpt.endswith("restful…"))
+        self.assertLessEqual(len(blog.content_excerpt), 281)
+
+        latest = self.client.get(reverse("latest_blogs")).json()[0]
+        self.assertNotIn("content", latest)
+        self.assertEqual((latest["excerpt"], latest["reading_minutes"]), (blog.content_excerpt, 3))
+        page = self.client.get(reverse("blogs_by_category", args=["sleep"])).json()["results"]
+        self.assertEqual(page[0].keys(), latest.keys())
+
+        detail = self.client.get(reverse("blog", args=["Sleep", "Rest"])).json()[0]
+        self.assertEqual(detail["content"], blog.content_html)
+        self.assertNotIn("script", detail["content"])
+        self.assertTrue(detail["content"].endswith("<p>End</p>"))
+
+        therapist = self.client.get(reverse("therapists")).json()[0]
+        self.assertNotIn("therapist_description", therapist)
+        self.assertEqual(therapist["therapist_description_excerpt"], "Calm support")
+        detail = self.client.get(reverse("therapist_detail", args=[self.therapist.pk])).json()
+        self.assertEqual(detail["therapist_description"], "<p>Calm <b>support</b></p>")
+
+    def test_list_queries_leave_the_full_text_behind(self):
+        Blogs.objects.create(category=self.category, owner=self.therapist, title="Rest", content=self.body)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("latest_blogs"))
+        blog_query = next(query["sql"] for query in queries if 'FROM "api_blogs"' in query["sql"])
+        self.assertNotIn('"api_blogs"."content"', blog_query)
+        self.assertNotIn("therapist_description_html", blog_query)
+
+    def test_backfill_renders_rows_saved_without_signals(self):
+        create_blogs(self.category, self.therapist, 3)  # bulk_create
+        User.objects.filter(pk=self.therapist.pk).update(therapist_description_html="")
+        self.assertFalse(Blogs.objects.exclude(content_excerpt="").exists())
+
+        call_command("backfill_rich_text", "--batch-size", "2", stdout=io.StringIO())
+        self.assertEqual(set(Blogs.objects.values_list("content_html", "content_excerpt", "content_reading_minutes")), {("<p>Content</p>", "Content", 1)})
+        self.therapist.refresh_from_db()
+        self.assertEqual(self.therapist.therapist_description_html, "<p>Calm <b>support</b></p>")
+
+    def test_migration_renders_existing_rows(self):
+        migration = importlib.import_module("api.migrations.0026_rich_text_rendering")
+        create_blogs(self.category, self.therapist, 3)
+        User.objects.filter(pk=self.therapist.pk).update(therapist_description_html="", therapist_description_excerpt="")
+
+        migration.render_rich_text(apps, None, batch_size=2)
+        self.assertEqual(set(Blogs.objects.values_list("content_html", "content_excerpt", "content_reading_minutes")), {("<p>Content</p>", "Content", 1)})
+        self.therapist.refresh_from_db()
+        self.assertEqual(self.therapist.therapist_description_html, "<p>Calm <b>support</b></p>")
+        self.assertEqual(self.therapist.therapist_description_excerpt, "Calm support")
+        self.assertEqual(migration.sanitize_html('<a href="http://[x">Link</a>'), "<a>Link</a>")
@@ -0,0 +1,214 @@
+"""
+Chunked, resumable receipt uploads.
+
+A client declares the upload (size, filename, optionally its SHA-256), then
+sends the bytes in any number of PATCH requests, each starting at the
+offset the server reports. The bytes go straight from the request stream
+to ``<RECEIPT_UPLOAD_DIR>/<id>.part`` in 64 KiB blocks, so memory use does
+not depend on the chunk or file size. The partial file is the only record
+of progress: its length is the offset, so a chunk cut off midway keeps
+what arrived and the client resumes from there.
+
+An exclusive lock on the partial file (django.core.files.locks) admits one
+writer per upload across processes. The running SHA-256 of each upload is
+kept in memory with the offset it covers. A process that doesn't have it,
+or has a stale one, rebuilds it from the file.
+
+The last chunk finalizes the upload: the checksum and image are verified,
+the file is copied into the receipt field's storage, and Bookings.receipt
+and the ReceiptUpload row change in one transaction. The stored copy is
+deleted again if that transaction fails. Uploads that are never finished
+are discarded by the prune_receipt_uploads command after RECEIPT_UPLOAD_TTL.
+"""
+import datetime
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.files import File, locks
+from django.db import transaction
+from django.http import UnreadablePostError
+from django.utils import timezone
+from PIL import Image
+
+from .models import Bookings, ReceiptUpload
+from .storage import release_on_commit
+
+
+BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+class UploadBusy(UploadError):
+    """Another request is writing to the upload"""
+
+
+class OffsetMismatch(UploadError):
+    def __init__(self, offset):
+        super().__init__(f"The upload continues at offset {offset}.")
+        self.offset = offset
+
+
+class InvalidReceipt(UploadError):
+    """The finished file failed its checks and was discarded"""
+
+
+def max_size():
+    return getattr(settings, "RECEIPT_MAX_SIZE", 20 * 1024 * 1024)
+
+
+def partial_path(upload):
+    directory = getattr(settings, "RECEIPT_UPLOAD_DIR", os.path.join(settings.BASE_DIR, "partial_uploads"))
+    return os.path.join(directory, f"{upload.pk.hex}.part")
+
+
+def offset_of(upload):
+    try:
+        return os.path.getsize(partial_path(upload))
+    except FileNotFoundError:
+        return 0
+
+
+class RunningHashes:
+    """Bounded upload id -> (offset, sha256 object) map"""
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, upload_id, offset):
+        with self._lock:
+            entry = self._entries.pop(upload_id, None)
+        if entry is not None and entry[0] == offset:
+            return entry[1]
+        return None
+
+    def set(self, upload_id, offset, hasher):
+        with self._lock:
+            self._entries[upload_id] = (offset, hasher)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, upload_id):
+        with self._lock:
+            self._entries.pop(upload_id, None)
+
+
+running_hashes = RunningHashes()
+
+
+def _hash_of(handle, length):
+    hasher = hashlib.sha256()
+    handle.seek(0)
+    remaining = length
+    while remaining:
+        block = handle.read(min(BLOCK_SIZE, remaining))
+        if not block:
+            break
+        hasher.update(block)
+        remaining -= len(block)
+    return hasher
+
+
+def append(upload, offset, length, stream):
+    """
+    Write ``length`` bytes from ``stream`` at ``offset``, finalizing the upload once
+    it is complete. Returns the new offset; raises UploadError subclasses.
+    """
+    path = partial_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a+b") as handle:
+        if not locks.lock(handle, locks.LOCK_EX | locks.LOCK_NB):
+            raise UploadBusy("Another request is uploading to this receipt.")
+        try:
+            current = os.fstat(handle.fileno()).st_size
+            if offset != current:
+                raise OffsetMismatch(current)
+            if current + length > upload.size:
+                raise UploadError(f"The upload is {upload.size} bytes; this chunk would go past the end.")
+
+            hasher = running_hashes.get(upload.pk, current) or _hash_of(handle, current)
+            handle.seek(current)
+            remaining = length
+            try:
+                while remaining:
+                    block = stream.read(min(BLOCK_SIZE, remaining))
+                    if not block:
+                        break
+                    handle.write(block)
+                    hasher.update(block)
+                    remaining -= len(block)
+            except (UnreadablePostError, OSError):
+                pass  # The client went away; what arrived is kept and resumed from
+            handle.flush()
+            current = handle.tell()
+            running_hashes.set(upload.pk, current, hasher)
+
+            if current == upload.size:
+                _finalize(upload, handle, hasher.hexdigest())
+            return current
+        finally:
+            locks.unlock(handle)
+
+
+def _finalize(upload, handle, digest):
+    try:
+        if upload.sha256 and upload.sha256.lower() != digest:
+            raise InvalidReceipt("The uploaded bytes don't match the SHA-256 given when the upload started.")
+        try:
+            handle.seek(0)
+            with Image.open(handle) as image:
+                image.verify()
+        except Exception:
+            raise InvalidReceipt("Upload a valid image. The file you uploaded was either not an image or a corrupted image.")
+    except InvalidReceipt:
+        discard(upload)
+        raise
+
+    booking = upload.booking
+    field = booking.receipt.field
+    handle.seek(0)
+    name = field.storage.save(field.generate_filename(booking, upload.filename), File(handle), max_length=field.max_length)
+    upload_id, path = upload.pk, partial_path(upload)  # delete() clears the pk
+    try:
+        with transaction.atomic():
+            replaced = Bookings.objects.filter(pk=booking.pk).values_list("receipt", flat=True).first()
+            Bookings.objects.filter(pk=booking.pk).update(receipt=name)
+            upload.delete()
+            release_on_commit(Bookings, [(field.storage, replaced)])
+    except Exception:
+        field.storage.delete(name)
+        raise
+    booking.receipt = name
+    _remove(upload_id, path)
+
+
+def _remove(upload_id, path):
+    running_hashes.discard(upload_id)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def discard(upload):
+    """Delete an upload and whatever it received"""
+    upload_id, path = upload.pk, partial_path(upload)
+    upload.delete()
+    _remove(upload_id, path)
+
+
+def prune(now=None):
+    """Discard uploads started more than RECEIPT_UPLOAD_TTL seconds ago; returns how many"""
+    now = now or timezone.now()
+    ttl = getattr(settings, "RECEIPT_UPLOAD_TTL", 24 * 60 * 60)
+    stale = list(ReceiptUpload.objects.filter(created_at__lt=now - datetime.timedelta(seconds=ttl)))
+    for upload in stale:
+        discard(upload)
+    return len(stale)
@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import CustomTokenObtainPairView, chatbot_response, TherapistListView, BlogCategoryListView, BlogsByCategoryView,BlogView, LatestBlogsView, LatestNewsListView, UserBookingsListCreateView, CustomTokenRefreshView, UserSignupView, CalculatorDetailView, CalculatorListView, UserLatestScoresView, SaveCalculatorScoreView
+from .views import CustomTokenObtainPairView, TherapistListView, BlogCategoryListView, BlogsByCategoryView,BlogView, LatestBlogsView, LatestNewsListView, UserBookingsListCreateView, CustomTokenRefreshView, UserSignupView, TherapistDirectoryView, TherapistDetailView, TherapistSlotsView, CalculatorDetailView, CalculatorListView, UserLatestScoresView, SaveCalculatorScoreView, SubmitCalculatorAnswersView, SearchView
 from . import views
+from .metrics import metrics_view
 
 urlpatterns = [
     path('token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
@@ -8,17 +9,28 @@ urlpatterns = [
         path("signup/", UserSignupView.as_view(), name="signup"),
 
     path('therapists/', TherapistListView.as_view(), name='therapists'),
+    path('therapists/directory/', TherapistDirectoryView.as_view(), name='therapist_directory'),
+    path('therapists/<int:pk>/', TherapistDetailView.as_view(), name='therapist_detail'),
+    path('therapists/<int:pk>/slots/', TherapistSlotsView.as_view(), name='therapist_slots'),
         path('categories/', BlogCategoryListView.as_view(), name='categories'),
     path('blogs/category/<str:category_name>/', BlogsByCategoryView.as_view(), name='blogs_by_category'),
     path('blogs/<str:category>/<str:blog>', BlogView.as_view(), name="blog"),
     path('blogs/latest/', LatestBlogsView.as_view(), name='latest_blogs'),
     path('news/latest/', LatestNewsListView.as_view(), name='latest_news'),
     path('bookings/', UserBookingsListCreateView.as_view(), name='user_bookings'),
+    path('bookings/bulk/', views.BookingBulkUpdateView.as_view(), name='bookings_bulk_update'),
+    path('bookings/<int:pk>/receipt/uploads/', views.ReceiptUploadCreateView.as_view(), name='receipt_upload_create'),
+    path('receipt-uploads/<uuid:pk>/', views.ReceiptUploadView.as_view(), name='receipt_upload'),
+    path('therapist/bookings/', views.TherapistBookingsView.as_view(), name='therapist_bookings'),
     path("calculators/", CalculatorListView.as_view(), name="calculator-list"),
     path("calculators/<str:name>/", CalculatorDetailView.as_view(), name="calculator-detail"),
+    path("calculators/<str:name>/submit/", SubmitCalculatorAnswersView.as_view(), name="calculator-submit"),
     path("user/scores/", UserLatestScoresView.as_view(), name="user-latest-scores"),
     path("save-score/", SaveCalculatorScoreView.as_view(), name="save-calculator-score"),
-    # path("chatbot/", chatbot_response, name="chatbot_response"),
+    path("search/", SearchView.as_view(), name="search"),
+    path("metrics/", metrics_view, name="metrics"),
+    path("exports/<str:name>/", views.ExportView.as_view(), name="export"),
+    path("chatbot/", views.chatbot_response, name="chatbot_response"),
 
         
 ]
\ No newline at end of file
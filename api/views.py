@@ -1,80 +1,46 @@
 from rest_framework_simplejwt.views import TokenObtainPairView
-from .serializers import CustomTokenObtainPairSerializer, TherapistSerializer, BlogCategorySerializer, BlogSerializer, NewsSerializer, BookingSerializer, UserSignupSerializer, CalculatorDetailSerializer, CalculatorListSerializer, UserLatestScoreSerializer, SaveCalculatorScoreSerializer
+from .serializers import BlogListSerializer, BookingBulkUpdateSerializer, ReceiptUploadSerializer, TherapistSummarySerializer, ChatbotMessageSerializer, TherapistBookingSerializer, CustomTokenObtainPairSerializer, ClaimsTokenRefreshSerializer, TherapistSerializer, BlogCategorySerializer, BlogSerializer, NewsSerializer, BookingSerializer, UserSignupSerializer, TherapistListSerializer, CalculatorDetailSerializer, CalculatorListSerializer, UserLatestScoreSerializer, SaveCalculatorScoreSerializer, SubmitCalculatorAnswersSerializer
 from rest_framework.generics import ListAPIView, ListCreateAPIView, RetrieveAPIView, CreateAPIView
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.permissions import IsAuthenticated
-from rest_framework_simplejwt.serializers import TokenRefreshSerializer
 from rest_framework_simplejwt.views import TokenRefreshView
-from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.exceptions import AuthenticationFailed, NotFound, PermissionDenied
 from django.contrib.auth import get_user_model  
-from .models import User, BlogsCategories, Blogs, News, Bookings, Calculators, CalculatorScores
-from rest_framework import  pagination
-from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from .models import User, BlogsCategories, Blogs, BlogImages, News, Bookings, ReceiptUpload, Calculators, CalculatorQuestions, CalculatorResults, CalculatorLatestScore
+from .authentication import ClaimsJWTAuthentication
 from django.shortcuts import get_object_or_404
 from rest_framework.response import Response
 from rest_framework import status
-from django.db.models import OuterRef, Subquery
+from django.db.models import Count, Q
+from django.db.models.functions import Coalesce
 from rest_framework.exceptions import ValidationError
+from rest_framework.views import APIView
+from rest_framework.decorators import api_view, permission_classes
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .availability import SLOT_MINUTES, free_slots
+from .scoring import get_table, record_score
+from . import bookings, chatbot, exports, search, uploads
+from rest_framework.utils.urls import replace_query_param
+import datetime
+import uuid
+from .cache import CachedResponseMixin, ConditionalGetMixin
+from .pagination import AsyncPageNumberPagination, KeysetPagination
+from .richtext import full_text_columns
 
 
+User = get_user_model()
 
 
-
-# from transformers import BlenderbotTokenizer, BlenderbotForConditionalGeneration
-# from rest_framework.decorators import api_view
-# from django.middleware.csrf import get_token
-# import uuid
-# import time
-# from rest_framework.response import Response
-
-# model_name = "facebook/blenderbot-400M-distill"
-# tokenizer = BlenderbotTokenizer.from_pretrained(model_name)
-# model = BlenderbotForConditionalGeneration.from_pretrained(model_name)
-# session_data = {}
-
-# # Remove inactive sessions (e.g., after 10 minutes)
-# SESSION_TIMEOUT = 10 * 60  # 10 minutes in seconds
-
-# def cleanup_sessions():
-#     """Delete inactive sessions to free up memory."""
-#     current_time = time.time()
-#     inactive_sessions = [sid for sid, data in session_data.items() if (current_time - data["last_active"]) > SESSION_TIMEOUT]
-    
-#     for sid in inactive_sessions:
-#         del session_data[sid]  # Remove inactive session
-
-# @api_view(['POST'])
-# def chatbot_response(request):
-#     cleanup_sessions()  # Run cleanup before processing request
-
-#     session_id = request.data.get("session_id", str(uuid.uuid4()))
-#     user_input = request.data.get("message", "")
-
-#     if not user_input:
-#         return Response({"error": "No message provided"}, status=400)
-
-#     # Retrieve session history or create a new one
-#     if session_id not in session_data:
-#         session_data[session_id] = {"history": [], "last_active": time.time()}
-
-#     session_data[session_id]["history"].append({"role": "user", "message": user_input})
-
-#     # Generate chatbot response
-#     inputs = tokenizer([user_input], return_tensors="pt")
-#     reply_ids = model.generate(**inputs)
-#     response_text = tokenizer.batch_decode(reply_ids, skip_special_tokens=True)[0]
-
-#     session_data[session_id]["history"].append({"role": "bot", "message": response_text})
-#     session_data[session_id]["last_active"] = time.time()  # Update last active time
-
-#     return Response({
-#         "session_id": session_id,
-#         "response": response_text
-#     })
-
-
-User = get_user_model()
+def set_refresh_cookie(response, refresh_token):
+    response.set_cookie(
+        key="refresh_token",
+        value=refresh_token,
+        httponly=True,  # Secure against JavaScript access
+        secure=False,  # Set to True in production (HTTPS required)
+        samesite="Lax",
+        path="/api/token/refresh/"  # Ensure cookie is accessible for refresh
+    )
 
 
 class CustomTokenObtainPairView(TokenObtainPairView):
@@ -86,19 +52,12 @@ class CustomTokenObtainPairView(TokenObtainPairView):
         refresh_token = response.data.pop("refresh", None)  # Remove refresh from JSON response
         
         if refresh_token:
-            response.set_cookie(
-                key="refresh_token",
-                value=refresh_token,
-                httponly=True,  # Secure against JavaScript access
-                secure=False,  # Set to True in production (HTTPS required)
-                samesite="Lax",
-                path="/api/token/refresh/"  # Ensure cookie is accessible for refresh
-            )
+            set_refresh_cookie(response, refresh_token)
 
         return response
 
 class CustomTokenRefreshView(TokenRefreshView):
-    serializer_class = TokenRefreshSerializer
+    serializer_class = ClaimsTokenRefreshSerializer
 
     def post(self, request, *args, **kwargs):
         refresh_token = request.COOKIES.get("refresh_token")
@@ -107,7 +66,14 @@ class CustomTokenRefreshView(TokenRefreshView):
             raise AuthenticationFailed("Refresh token not found in cookies.")
 
         request.data["refresh"] = refresh_token  # Inject token into request body
-        return super().post(request, *args, **kwargs)
+        response = super().post(request, *args, **kwargs)
+
+        # The old token is revoked once rotated, so the cookie must carry the new one
+        rotated_token = response.data.pop("refresh", None)
+        if rotated_token:
+            set_refresh_cookie(response, rotated_token)
+
+        return response
     
 class UserSignupView(ListCreateAPIView):
     queryset = User.objects.all()
@@ -115,88 +81,180 @@ class UserSignupView(ListCreateAPIView):
     permission_classes = [AllowAny]  # Anyone can register
 
     def create(self, request, *args, **kwargs):
-        response = super().create(request, *args, **kwargs)  # Call parent create method
-        user = self.get_queryset().get(id=response.data["user"]["id"])  # Get created user
-
-        # Generate refresh token
-        refresh = RefreshToken.for_user(user)
-
-        response.set_cookie(
-            key="refresh_token",
-            value=str(refresh),
-            httponly=True,  # Secure against JS access
-            secure=False,  # Set to True in production (HTTPS required)
-            samesite="Lax",
-            path="/api/token/refresh/"
-        )
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        response = Response(serializer.data, status=status.HTTP_201_CREATED)
+
+        # Same refresh token the serializer derived the access token from
+        set_refresh_cookie(response, str(serializer.refresh))
 
         return response
     
-class TherapistListView(ListAPIView):
-    queryset = User.objects.filter(role='therapist')  # Fetch only therapists
-    serializer_class = TherapistSerializer
+class TherapistListView(CachedResponseMixin, ListAPIView):
+    queryset = User.objects.filter(role='therapist').defer(*full_text_columns(User))  # Fetch only therapists
+    serializer_class = TherapistSummarySerializer
     permission_classes = [AllowAny]  # Allow anyone to access the endpoint
-    
+    cache_models = (User,)
+
+
+class TherapistDirectoryPagination(KeysetPagination):
+    page_size = 12
+    ordering = ("first_name", "id")
+
+def int_query_param(params, name):
+    value = params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: "A whole number is required."})
+
+def date_query_param(params, name):
+    value = params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise ValidationError({name: "Use the YYYY-MM-DD format."})
+
+def date_range_params(params, max_days):
+    """?start= and ?end= dates, defaulting to the 7 days from today"""
+    start = date_query_param(params, "start") or timezone.localdate()
+    end = date_query_param(params, "end") or start + datetime.timedelta(days=6)
+    if end < start:
+        raise ValidationError({"end": "End date must not be before the start date."})
+    if (end - start).days >= max_days:
+        raise ValidationError({"end": f"At most {max_days} days can be requested at once."})
+    return start, end
+
+# Paginated, filterable therapist directory with compact rows
+class TherapistDirectoryView(CachedResponseMixin, ListAPIView):
+    """
+    Filters: ?expertise=, ?fee_min=, ?fee_max=, ?experience_min=, ?experience_max=
+    Sorting: ?sort=name|fee|experience, prefixed with "-" for descending
+    """
+    serializer_class = TherapistListSerializer
+    pagination_class = TherapistDirectoryPagination
+    permission_classes = [AllowAny]
+    cache_models = (User,)
+    # Missing fees and experience sort as 0 so every row has a keyset position
+    sort_options = {
+        "name": ("first_name", "id"),
+        "fee": ("fee_key", "id"),
+        "experience": ("experience_key", "id"),
+    }
+
+    def get_queryset(self):
+        params = self.request.query_params
+        sort = params.get("sort", "name")
+        if sort.lstrip("-") not in self.sort_options:
+            raise ValidationError({"sort": f"Choose one of: {', '.join(self.sort_options)}."})
+        prefix = "-" if sort.startswith("-") else ""
+        self.keyset_ordering = tuple(prefix + name for name in self.sort_options[sort.lstrip("-")])
+
+        therapists = User.objects.filter(role='therapist').defer(*full_text_columns(User)).annotate(
+            fee_key=Coalesce("therapist_fee", 0),
+            experience_key=Coalesce("therapist_experience", 0),
+        )
+        expertise = params.get("expertise")
+        if expertise:
+            therapists = therapists.filter(therapist_expertise__icontains=expertise.strip())
+        range_filters = {
+            "fee_min": "therapist_fee__gte",
+            "fee_max": "therapist_fee__lte",
+            "experience_min": "therapist_experience__gte",
+            "experience_max": "therapist_experience__lte",
+        }
+        for param, lookup in range_filters.items():
+            value = int_query_param(params, param)
+            if value is not None:
+                therapists = therapists.filter(**{lookup: value})
+        return therapists
+
+# Full therapist profile, including the description left out of the directory
+class TherapistDetailView(CachedResponseMixin, RetrieveAPIView):
+    queryset = User.objects.filter(role='therapist')
+    serializer_class = TherapistSerializer
+    permission_classes = [AllowAny]
+    cache_models = (User,)
+
 
 # Get all categories
-class BlogCategoryListView(ListAPIView):
+class BlogCategoryListView(CachedResponseMixin, ListAPIView):
     queryset = BlogsCategories.objects.all()
     serializer_class = BlogCategorySerializer
+    cache_models = (BlogsCategories,)
+
+def blogs_with_relations():
+    """Blogs with the category, owner and images BlogSerializer nests, in two queries"""
+    return (
+        Blogs.objects.select_related("category", "owner").prefetch_related("blogimages_set")
+        .defer(*full_text_columns(User, "owner__"))  # Never nested
+    )
+
+def blog_list():
+    """blogs_with_relations() for BlogListSerializer, without the content it leaves out"""
+    return blogs_with_relations().defer(*full_text_columns(Blogs))
 
 # Custom pagination for 12 blogs per page
-class BlogPagination(pagination.PageNumberPagination):
+class BlogPagination(AsyncPageNumberPagination):
+    page_size = 12
+
+# Keyset pagination on (created_at, id) for infinite scroll, no COUNT(*) or OFFSET
+class BlogCursorPagination(KeysetPagination):
     page_size = 12
+    ordering = ("-created_at", "-id")
 
 # Get 12 blogs of a specific category with pagination
-class BlogsByCategoryView(ListAPIView):
-    serializer_class = BlogSerializer
-    pagination_class = BlogPagination
-
-    # def get_queryset(self):
-    #     category_name = self.kwargs['category_name']
-    #     print("category_name")
-    #     print(category_name)
-    #     category_id = BlogsCategories.objects.get(name=category_name).id
-    #     blogs = Blogs.objects.filter(category_id=category_id).order_by('-created_at')
-    #     return blogs
+class BlogsByCategoryView(ConditionalGetMixin, ListAPIView):
+    serializer_class = BlogListSerializer
+    cache_models = (Blogs, BlogsCategories, User, BlogImages)
+
+    @property
+    def pagination_class(self):
+        """?pagination=cursor (or any ?cursor=) switches to next/previous cursors"""
+        params = self.request.query_params
+        if params.get("pagination") == "cursor" or "cursor" in params:
+            return BlogCursorPagination
+        return BlogPagination
+
     def get_queryset(self):
         category_name = self.kwargs.get('category_name', None)
-        print("Received category_name:", category_name)  # Debugging print
 
         if category_name is None:
             raise ValueError("Category name is None")  # This will help detect if it's missing
 
-        try:
-            category = BlogsCategories.objects.get(name__iexact=category_name.strip())
-            print("Found category:", category)  # Debugging print
-        except BlogsCategories.DoesNotExist:
-            print("Category not found in DB")  # Debugging print
-            raise  # Re-raise the exception to see the full error
+        category = get_object_or_404(BlogsCategories, name__iexact=category_name.strip())
 
-        blogs = Blogs.objects.filter(category_id=category.id).order_by('-created_at')
+        blogs = blog_list().filter(category_id=category.id).order_by('-created_at')
         return blogs
     
-class BlogView(ListAPIView):
+class BlogView(ConditionalGetMixin, ListAPIView):
     serializer_class = BlogSerializer
+    cache_models = (Blogs, BlogsCategories, User, BlogImages)
     
     def get_queryset(self):
         category_name = self.kwargs["category"]
-        category_id = BlogsCategories.objects.get(name=category_name)
         blog_name = self.kwargs["blog"]
-        blog = Blogs.objects.filter(category=category_id, title=blog_name)
+        blog = blogs_with_relations().filter(category__name=category_name, title=blog_name)
         return blog
 
 # Get latest 4 blogs
-class LatestBlogsView(ListAPIView):
-    serializer_class = BlogSerializer
+class LatestBlogsView(CachedResponseMixin, ListAPIView):
+    serializer_class = BlogListSerializer
+    cache_models = (Blogs, BlogsCategories, User, BlogImages)
 
     def get_queryset(self):
-        return Blogs.objects.order_by('-created_at')[:4]
+        return blog_list().order_by('-created_at')[:4]
     
 
-class LatestNewsListView(ListAPIView):
+class LatestNewsListView(CachedResponseMixin, ListAPIView):
     queryset = News.objects.order_by('-created_at')[:4]  # Get the latest 4 news
     serializer_class = NewsSerializer
+    cache_models = (News,)
     
 class UserBookingsListCreateView(ListCreateAPIView):
     """Allows users to get their bookings and create new bookings"""
@@ -208,19 +266,162 @@ class UserBookingsListCreateView(ListCreateAPIView):
 
     def perform_create(self, serializer):
         """Automatically assigns the logged-in user as the patient when creating a booking"""
-        if not serializer.is_valid():  # Check if the data is valid before saving
-            print("Validation Errors:", serializer.errors)  # Print errors to console
-        serializer.save(user=self.request.user)
+        try:
+            # The savepoint keeps the request's transaction usable if the insert loses a race
+            with transaction.atomic():
+                serializer.save(user=self.request.user)
+        except IntegrityError:
+            raise ValidationError({"time": "This slot has already been booked."})
+
+# The calling therapist's bookings for ?start=&end= (optionally ?status=a,b), with per-day and per-status counts
+class TherapistBookingsView(APIView):
+    permission_classes = [IsAuthenticated]
+    max_days = 62
+    statuses = [value for value, _ in Bookings.CHOICE]
+
+    def get(self, request):
+        if request.user.role != "therapist":
+            raise PermissionDenied("Only therapists have a booking schedule.")
+        start, end = date_range_params(request.query_params, self.max_days)
+        wanted = [value for value in request.query_params.get("status", "").split(",") if value]
+        if set(wanted) - set(self.statuses):
+            raise ValidationError({"status": f"Choose from: {', '.join(self.statuses)}."})
+
+        # Both queries range-scan the (therapist, date, time) index
+        bookings = Bookings.objects.filter(therapist_id=request.user.id, date__range=(start, end))
+        # One GROUP BY date, counting every status alongside; the counts ignore ?status=
+        days = list(bookings.order_by("date").values("date").annotate(
+            total=Count("id"), **{value: Count("id", filter=Q(status=value)) for value in self.statuses}
+        ))
+        if wanted:
+            bookings = bookings.filter(status__in=wanted)
+        listed = bookings.select_related("user").order_by("date", "time", "id")
+        return Response({
+            "start": start,
+            "end": end,
+            "counts": {
+                "total": sum(day["total"] for day in days),
+                "by_status": {value: sum(day[value] for day in days) for value in self.statuses},
+                "by_day": days,
+            },
+            "results": TherapistBookingSerializer(listed, many=True, context={"request": request}).data,
+        })
+
+# Set the status and/or paid flag of many bookings at once: therapists their own, staff any
+class BookingBulkUpdateView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        user = request.user
+        if not (user.is_staff or user.role == "therapist"):
+            raise PermissionDenied("Only therapists and staff can update bookings.")
+        serializer = BookingBulkUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data.pop("ids")
+
+        try:
+            results = bookings.bulk_update(
+                ids, serializer.validated_data, therapist_id=None if user.is_staff else user.id
+            )
+        except bookings.BulkUpdateConflict as error:
+            return Response({"detail": str(error)}, status=status.HTTP_409_CONFLICT)
+        return Response({
+            "updated": sum(result == bookings.UPDATED for result in results.values()),
+            "results": [{"id": pk, "result": results[pk]} for pk in ids],
+        })
+
+# Starts a chunked upload of a booking's receipt; the bytes follow in PATCHes to ReceiptUploadView
+class ReceiptUploadCreateView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk):
+        booking = get_object_or_404(Bookings, pk=pk, user_id=request.user.id)
+        serializer = ReceiptUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.save(booking=booking, user_id=request.user.id)
+        return receipt_upload_response(upload.pk, upload.size, 0, status.HTTP_201_CREATED)
+
+
+def receipt_upload_response(upload_id, size, offset, status_code=status.HTTP_200_OK):
+    response = Response({"id": upload_id, "offset": offset, "size": size}, status=status_code)
+    response["Upload-Offset"] = str(offset)
+    return response
+
+
+# GET reports the offset to resume from, PATCH appends the bytes sent at Upload-Offset, DELETE abandons the upload
+class ReceiptUploadView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get_upload(self, request, pk):
+        return get_object_or_404(ReceiptUpload.objects.select_related("booking"), pk=pk, user_id=request.user.id)
+
+    def get(self, request, pk):
+        upload = self.get_upload(request, pk)
+        return receipt_upload_response(upload.pk, upload.size, uploads.offset_of(upload))
+
+    def patch(self, request, pk):
+        upload = self.get_upload(request, pk)
+        try:
+            offset = int(request.headers["Upload-Offset"])
+            length = int(request.headers["Content-Length"])
+        except (KeyError, ValueError):
+            raise ValidationError({"detail": "Send the chunk with Upload-Offset and Content-Length headers."})
+        if offset < 0 or length < 0:
+            raise ValidationError({"detail": "Upload-Offset and Content-Length can't be negative."})
+
+        upload_id = upload.pk  # The last chunk deletes the upload, which clears its pk
+        try:
+            # Read from the underlying request: DRF's parsers would load the whole body
+            offset = uploads.append(upload, offset, length, request._request)
+        except uploads.OffsetMismatch as error:
+            response = Response({"detail": str(error), "offset": error.offset}, status=status.HTTP_409_CONFLICT)
+            response["Upload-Offset"] = str(error.offset)
+            return response
+        except uploads.UploadBusy as error:
+            return Response({"detail": str(error)}, status=status.HTTP_423_LOCKED)
+        except uploads.UploadError as error:
+            raise ValidationError({"detail": str(error)})
+
+        response = receipt_upload_response(upload_id, upload.size, offset)
+        if offset == upload.size:
+            response.data["receipt"] = request.build_absolute_uri(upload.booking.receipt.url)
+        return response
+
+    def delete(self, request, pk):
+        uploads.discard(self.get_upload(request, pk))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+# Free booking slots of a therapist for a date range
+class TherapistSlotsView(APIView):
+    """?start=YYYY-MM-DD&end=YYYY-MM-DD, defaulting to the next 7 days"""
+    permission_classes = [AllowAny]
+    max_days = 62
+
+    def get(self, request, pk):
+        therapist = get_object_or_404(User.objects.filter(role='therapist').only('id'), pk=pk)
+        start, end = date_range_params(request.query_params, self.max_days)
+
+        slots = free_slots(therapist.id, start, end)
+        return Response({
+            "therapist": therapist.id,
+            "slot_minutes": SLOT_MINUTES,
+            "days": [
+                {"date": day, "slots": [time.strftime("%H:%M") for time in times]}
+                for day, times in slots.items()
+            ],
+        })
 
 # 1. List all calculators
-class CalculatorListView(ListAPIView):
+class CalculatorListView(CachedResponseMixin, ListAPIView):
     queryset = Calculators.objects.all()
     serializer_class = CalculatorListSerializer
+    cache_models = (Calculators,)
 
 # 2. Get all details of a specific calculator (including questions & results)
-class CalculatorDetailView(RetrieveAPIView):
+class CalculatorDetailView(CachedResponseMixin, RetrieveAPIView):
     serializer_class = CalculatorDetailSerializer
     lookup_field = "name"
+    cache_models = (Calculators, CalculatorQuestions, CalculatorResults)
     
     def get_queryset(self):
         return Calculators.objects.prefetch_related("calculator_questions", "calculator_results")
@@ -228,42 +429,143 @@ class CalculatorDetailView(RetrieveAPIView):
 # 3. Get latest scores per calculator for the authenticated user
 class UserLatestScoresView(ListAPIView):
     serializer_class = UserLatestScoreSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         user = self.request.user
-        latest_scores = CalculatorScores.objects.filter(
-            user=user,
-            created_at=Subquery(
-                CalculatorScores.objects.filter(
-                    user=user,
-                    calculator=OuterRef("calculator")
-                )
-                .order_by("-created_at")
-                .values("created_at")[:1]  # Get latest created_at per calculator
-            )
-        )
+        # One row per calculator, kept current by record_score
+        latest_scores = CalculatorLatestScore.objects.filter(user=user).select_related("calculator")
 
         return latest_scores
 
+def score_answers(user, calculator_name, answers):
+    """Score ``answers`` on the server and save the score; returns (table, score)"""
+    table = get_table(calculator_name)
+    try:
+        score = table.score(answers)
+    except ValueError as error:
+        raise ValidationError({"answers": str(error)})
+    record_score(user, table.calculator_id, score)
+    return table, score
+
 # 4. Save user's calculator score
 class SaveCalculatorScoreView(CreateAPIView):
+    """
+    Deprecated: use calculators/<name>/submit/. Breaking change: the body is now
+    {calculator_name, answers} and the score is computed here, so the old
+    {calculator_name, score} body is rejected with a 400.
+    """
     serializer_class = SaveCalculatorScoreSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        _, score = score_answers(
+            request.user, serializer.validated_data["calculator_name"], serializer.validated_data["answers"]
+        )
+
+        return Response({"message": "Score saved successfully", "score": score}, status=status.HTTP_201_CREATED)
+
+# 5. Score a user's answers on the server and save the result
+class SubmitCalculatorAnswersView(CreateAPIView):
+    serializer_class = SubmitCalculatorAnswersSerializer
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def create(self, request, *args, **kwargs):
-        user = request.user
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        calculator_name = serializer.validated_data["calculator_name"]
-        score = serializer.validated_data["score"]
+        table, score = score_answers(request.user, self.kwargs["name"], serializer.validated_data["answers"])
 
-        calculator = get_object_or_404(Calculators, name=calculator_name)
+        return Response({
+            "calculator_name": self.kwargs["name"],
+            "score": score,
+            "max_score": table.max_score,
+            "result": table.band(score),
+        }, status=status.HTTP_201_CREATED)
+
+# Ranked full-text search over blogs, news and therapists
+class SearchView(APIView):
+    """?q=text with optional ?type=blog|news|therapist and ?page="""
+    permission_classes = [AllowAny]
+    page_size = 12
 
-        # Save score
-        CalculatorScores.objects.create(user=user, calculator=calculator, score=score)
+    def get(self, request):
+        params = request.query_params
+        query = params.get("q", "").strip()
+        kind = params.get("type") or None
+        if kind is not None and kind not in search.KIND_CODES:
+            raise ValidationError({"type": f"Choose one of: {', '.join(search.KIND_CODES)}."})
+        page = int_query_param(params, "page") or 1
+        if page < 1:
+            raise ValidationError({"page": "Pages start at 1."})
+        if not search.is_available():
+            return Response({"detail": "Search is not available."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        results = search.search(query, kind, limit=self.page_size + 1, offset=(page - 1) * self.page_size)
+        has_next = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        # Blog pages are addressed by category name, which the index doesn't hold
+        blog_ids = [result["id"] for result in results if result["type"] == "blog"]
+        if blog_ids:
+            categories = dict(Blogs.objects.filter(id__in=blog_ids).values_list("id", "category__name"))
+            for result in results:
+                if result["type"] == "blog":
+                    result["category"] = categories.get(result["id"])
+
+        url = request.build_absolute_uri()
+        return Response({
+            "next": replace_query_param(url, "page", page + 1) if has_next else None,
+            "previous": replace_query_param(url, "page", page - 1) if page > 1 else None,
+            "results": results,
+        })
+
+
+# Staff exports, streamed as ?output=ndjson|csv and filtered by ?since= and ?until= dates
+class ExportView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, name):
+        if name not in exports.EXPORTS:
+            raise NotFound()
+        params = request.query_params
+        output = params.get("output", "ndjson")
+        if output not in exports.OUTPUTS:
+            raise ValidationError({"output": f"Choose one of: {', '.join(exports.OUTPUTS)}."})
+        since, until = exports.date_param(params, "since"), exports.date_param(params, "until")
+        return exports.stream(request._request, name, output, since, until)
+
+    def perform_content_negotiation(self, request, force=False):
+        # The body's format comes from ?output=, whatever Accept asks for
+        return super().perform_content_negotiation(request, force=True)
+
+
+def start_chat(data):
+    """(session id, future of the reply) for a chatbot request body"""
+    serializer = ChatbotMessageSerializer(data=data)
+    serializer.is_valid(raise_exception=True)
+    session_id = serializer.validated_data.get("session_id") or str(uuid.uuid4())
+    return session_id, chatbot.get_chatbot().ask(session_id, serializer.validated_data["message"])
+
+
+CHATBOT_UNAVAILABLE = {"detail": "The chatbot is unavailable right now."}
+
+
+# Replies to concurrent messages are generated in one batch (api/chatbot.py)
+@api_view(["POST"])
+@permission_classes([AllowAny])
+def chatbot_response(request):
+    session_id, future = start_chat(request.data)
+    try:
+        reply = future.result(timeout=chatbot.REPLY_TIMEOUT)
+    except Exception:  # Timed out, or the model failed (logged by the batcher)
+        future.cancel()  # Drops it from the queue if it is still waiting
+        return Response(CHATBOT_UNAVAILABLE, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return Response({"session_id": session_id, "response": reply})
 
-        return Response({"message": "Score saved successfully"}, status=status.HTTP_201_CREATED)
\ No newline at end of file
@@ -2,6 +2,8 @@
 ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests resolve against backend/asgi_urls.py, which serves the hot public
+reads with the native async views of api/async_views.py.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -9,8 +11,21 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler, ASGIRequest
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
 
-application = get_asgi_application()
+
+class AsyncReadsRequest(ASGIRequest):
+    # BaseHandler resolves against request.urlconf when it is set
+    urlconf = "backend.asgi_urls"
+
+
+class AsyncReadsHandler(ASGIHandler):
+    request_class = AsyncReadsRequest
+
+
+# What get_asgi_application() does, with the request class above
+django.setup(set_prefix=False)
+application = AsyncReadsHandler()
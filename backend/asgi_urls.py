@@ -0,0 +1,15 @@
+"""
+URL configuration for requests served by backend/asgi.py.
+
+The hot public reads resolve to the native async views of api.async_views
+first; every other URL falls through to backend/urls.py unchanged.
+"""
+from django.urls import path, include
+
+from .urls import urlpatterns as sync_urlpatterns
+
+
+urlpatterns = [
+    path("api/", include("api.async_urls")),
+    *sync_urlpatterns,
+]
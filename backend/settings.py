@@ -51,6 +51,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.metrics.PerformanceMiddleware",  # First, so its timings cover the rest of the stack
+    "api.database.ReadOnlyRequestMiddleware",
         'corsheaders.middleware.CorsMiddleware',
     "django.middleware.common.CommonMiddleware",
     "django.middleware.security.SecurityMiddleware",
@@ -132,9 +134,47 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "CONN_MAX_AGE": 60,
+        "CONN_HEALTH_CHECKS": True,
+        # Take the write lock when a transaction starts rather than on its first write
+        "OPTIONS": {"transaction_mode": "IMMEDIATE"},
+    },
+    # Second connection to the same file for the reads of GET requests (api/database.py)
+    "replica": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db.sqlite3",
+        "CONN_MAX_AGE": 60,
+        "CONN_HEALTH_CHECKS": True,
+        "TEST": {"MIRROR": "default"},
+    },
+}
+DATABASE_ROUTERS = ["api.database.ReadReplicaRouter"]
+
+# Applied to every new SQLite connection (api/database.py)
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",  # Durable across app crashes; only an OS crash can lose the last commits
+    "busy_timeout": 20000,  # Milliseconds a writer queues for the lock before "database is locked"
+    "cache_size": -20000,  # 20 MB of page cache per connection
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+}
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# The versioned response cache (api/cache.py) relies on every worker seeing the
+# same version counters, so multi-process deployments need a shared backend
+# such as Redis or Memcached instead of the per-process local memory cache.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "hiba-backend",
     }
 }
 
+API_RESPONSE_CACHE_TIMEOUT = 60 * 60  # Seconds an unused cached response is kept
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -181,7 +221,50 @@ AUTH_USER_MODEL = "api.User"
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-    'rest_framework_simplejwt.authentication.JWTAuthentication',
+    'api.authentication.ClaimsJWTAuthentication',
     'rest_framework.authentication.SessionAuthentication',
 ]
-}
\ No newline at end of file
+}
+
+# Users rebuilt from token claims are cached per process (api/authentication.py);
+# the TTL defaults to the access token lifetime.
+AUTH_USER_CACHE_SIZE = 10000
+
+# Bearer token Prometheus scrapes /api/metrics/ with; staff sessions work too
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Chatbot model (api/chatbot.py), loaded on the first message rather than at startup
+CHATBOT_BACKEND = os.environ.get("CHATBOT_BACKEND", "api.chatbot.BlenderbotBackend")
+CHATBOT_MODEL = "facebook/blenderbot-400M-distill"
+
+# Uploads under the models' upload_to directories are stored once per content, named by
+# SHA-256 and reference counted (api/storage.py); dedupe_media converts existing files
+STORAGES = {
+    "default": {
+        "BACKEND": "api.storage.ContentAddressedStorage",
+        "OPTIONS": {"directories": ["therapists", "blogs", "categories", "calculators", "receipts"]},
+    },
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+# Media delivery (api/media.py): "x-accel-redirect" (nginx, with an internal location at
+# MEDIA_ACCEL_REDIRECT_PREFIX aliased to MEDIA_ROOT) or "x-sendfile" (Apache, lighttpd) lets the
+# proxy send the files; left empty, Django streams them. Names that aren't content hashes are
+# cached for MEDIA_CACHE_MAX_AGE seconds.
+MEDIA_SENDFILE = os.environ.get("MEDIA_SENDFILE", "")
+MEDIA_ACCEL_REDIRECT_PREFIX = "/protected-media/"
+MEDIA_CACHE_MAX_AGE = 60 * 60
+
+# Chunked receipt uploads (api/uploads.py): partial files live outside MEDIA_ROOT until finished,
+# and prune_receipt_uploads deletes the ones not finished within the TTL (seconds)
+RECEIPT_UPLOAD_DIR = os.path.join(BASE_DIR, "partial_uploads")
+RECEIPT_MAX_SIZE = 20 * 1024 * 1024
+RECEIPT_UPLOAD_TTL = 24 * 60 * 60
+
+# Length of a therapist booking slot, used to compute free slots (api/availability.py)
+BOOKING_SLOT_MINUTES = 60
+
+# Resized WebP/JPEG copies of uploaded images (api/images.py). Derivatives are
+# built on a thread pool after the upload commits; 0 workers builds them inline.
+IMAGE_DERIVATIVE_WIDTHS = (160, 320, 640, 1280)
+IMAGE_DERIVATIVE_WORKERS = 2